@@ -0,0 +1,108 @@
+#!/usr/bin/python
+#
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Compares the wall-clock time taken to run a suite of ``N`` tests
+under the green and thread backends, for two workloads: an I/O-bound
+workload, in which each test sleeps, and a workload in which each
+test compresses and hashes a large buffer, work which is done in C
+code that releases the global interpreter lock.  The green backend
+should do well on the first and run the second serially; the thread
+backend should do well on both, given enough CPUs.  Each measurement
+is made in a fresh process, since the green backend monkey-patches
+the standard library.
+
+Usage: python bench/bench_backend.py [N [THREADS]]
+"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from dtest import core
+from dtest import test
+from tests import support
+
+
+# A buffer to compress and hash
+DATA = os.urandom(1 << 16) * 16
+
+
+def sleeper():
+    time.sleep(0.1)
+
+
+def cruncher():
+    for i in range(4):
+        hashlib.sha256(zlib.compress(DATA, 1)).digest()
+
+
+WORKLOADS = {
+    'io': sleeper,
+    'gil-free': cruncher,
+    }
+
+
+def measure(backend, workload, count, maxth):
+    """
+    Run ``count`` tests of the named ``workload`` under the named
+    ``backend``, with no more than ``maxth`` running at once.
+    Returns the elapsed time in seconds.
+    """
+
+    tests = [test._gettest(support.mkfunc('test_%d' % i, WORKLOADS[workload]))
+             for i in range(count)]
+
+    output = core.DTestOutput(open(os.devnull, 'w'))
+    if backend == 'thread':
+        from dtest import backend as bk
+        queue = core.DTestQueue(maxth, output=output,
+                                backend=bk.ThreadBackend(maxth))
+    else:
+        queue = core.DTestQueue(maxth, output=output)
+    queue.add_tests(tests)
+
+    start = time.time()
+    queue.run()
+    return time.time() - start
+
+
+def main(count, maxth):
+    print "%10s %10s %10s" % ('workload', 'green s', 'thread s')
+    for workload in sorted(WORKLOADS):
+        times = []
+        for backend in ('green', 'thread'):
+            out = subprocess.check_output([sys.executable, __file__,
+                                           '--measure', backend, workload,
+                                           str(count), str(maxth)])
+            times.append(float(out))
+        print "%10s %10.2f %10.2f" % (workload, times[0], times[1])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        backend, workload, count, maxth = sys.argv[2:6]
+        print measure(backend, workload, int(count), int(maxth))
+    else:
+        args = [int(arg) for arg in sys.argv[1:]]
+        main(*(args + [32, 8][len(args):]))
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+#
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the cost of collecting the tests of test modules which
+import a large API.  A synthetic API module of ``N`` functions and
+classes is generated, along with test modules which import everything
+from it, and which define test functions and a chain of DTestCase
+classes, each inheriting from the last and adding tests of its own.
+Each test module is executed, building its classes, and visited with
+dtest.test.visit_mod(); for comparison, the same is done with the
+metaclass and visit_mod() as they used to be, examining every name
+returned by dir() for each module and class.  The time taken by each
+is reported; both must find the same tests.
+
+Usage: python bench/bench_collect.py [N]
+"""
+
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from dtest import test
+from dtest.test import SETUP, TEARDOWN, CLASS
+
+
+# Test modules, test functions per module, chained classes per
+# module, and tests per class
+MODULES = 20
+FUNCTIONS = 20
+CLASSES = 8
+METHODS = 10
+
+
+class OldMeta(type):
+    """
+    The DTestCaseMeta metaclass as it used to be.
+    """
+
+    def __new__(mcs, name, bases, dict_):
+        cls = super(OldMeta, mcs).__new__(mcs, name, bases, dict_)
+
+        setUp = getattr(cls, SETUP, None)
+        tearDown = getattr(cls, TEARDOWN, None)
+        setUpClass = test._gettest(getattr(cls, SETUP + CLASS, None),
+                                   test.DTestFixtureSetUp, True)
+        tearDownClass = test._gettest(getattr(cls, TEARDOWN + CLASS, None),
+                                      test.DTestFixtureTearDown, True)
+        if setUpClass is not None:
+            setUpClass._attach(cls)
+        if tearDownClass is not None:
+            tearDownClass._attach(cls)
+        if setUpClass is not None and tearDownClass is not None:
+            tearDownClass._set_partner(setUpClass)
+
+        tests = []
+        for k in dir(cls):
+            if (k[0] == '_' or k == SETUP or k == TEARDOWN or
+                k == SETUP + CLASS or k == TEARDOWN + CLASS):
+                continue
+            v = getattr(cls, k)
+            if not callable(v):
+                continue
+            if hasattr(v, '_dt_nottest') and v._dt_nottest:
+                continue
+            dt = test._gettest(v, test.DTest if test.testRE.match(k)
+                               else None)
+            if dt is None:
+                continue
+            dt._attach(cls)
+            tests.append(dt)
+            if dt._pre is None and setUp is not None:
+                dt.setUp(setUp)
+            if dt._post is None and tearDown is not None:
+                dt.tearDown(tearDown)
+            if setUpClass is not None:
+                test.depends(setUpClass)(dt)
+            if tearDownClass is not None:
+                test.depends(dt)(tearDownClass)
+
+        cls._dt_tests = set(tests)
+        if setUpClass is not None:
+            cls._dt_tests.add(setUpClass)
+        if tearDownClass is not None:
+            cls._dt_tests.add(tearDownClass)
+        return cls
+
+
+class OldCase(object):
+    """
+    A base class for test classes built by OldMeta.
+    """
+
+    __metaclass__ = OldMeta
+
+
+def old_visit_mod(mod, tests):
+    """
+    Visit the module ``mod``, which has no parent package, as
+    visit_mod() used to.
+    """
+
+    mod._dt_visited = set()
+    for k in dir(mod):
+        if k[0] == '_' or k == SETUP or k == TEARDOWN:
+            continue
+        v = getattr(mod, k)
+        if not callable(v):
+            continue
+        if hasattr(v, '_dt_nottest') and v._dt_nottest:
+            continue
+        try:
+            if issubclass(v, OldCase):
+                mod._dt_visited |= v._dt_tests
+            continue
+        except TypeError:
+            pass
+        dt = test._gettest(v, test.DTest if test.testRE.match(k) else None)
+        if dt is None:
+            continue
+        mod._dt_visited.add(dt)
+    tests |= mod._dt_visited
+
+
+def api_source(count):
+    """
+    Generate the source of an API module of ``count`` functions and
+    classes.
+    """
+
+    lines = []
+    for i in range(count):
+        if i % 10:
+            lines.append('def api_%d(arg):\n    return arg\n' % i)
+        else:
+            lines.append('class Api%d(object):\n'
+                         '    def method(self):\n        pass\n' % i)
+    return '\n'.join(lines)
+
+
+def test_source():
+    """
+    Generate the source of a test module, using the base class
+    ``Case`` for its test classes.
+    """
+
+    lines = ['from bench_api import *\n']
+    for i in range(FUNCTIONS):
+        lines.append('def test_func_%d():\n    pass\n' % i)
+    base = 'Case'
+    for i in range(CLASSES):
+        lines.append('class TestCase%d(%s):' % (i, base))
+        for j in range(METHODS):
+            lines.append('    def test_%d_%d(self):\n        pass\n' % (i, j))
+        base = 'TestCase%d' % i
+    return '\n'.join(lines)
+
+
+def collect(source, case, visit):
+    """
+    Execute ``source`` as each of the test modules, using ``case`` as
+    the base class of the test classes, and visit them with
+    ``visit``.  Returns the time taken and the number of tests found.
+    """
+
+    code = compile(source, '<bench>', 'exec')
+    tests = set()
+    start = time.time()
+    for i in range(MODULES):
+        mod = types.ModuleType('bench_test_%d' % i)
+        mod.Case = case
+        exec code in mod.__dict__
+        visit(mod, tests)
+    return time.time() - start, len(tests)
+
+
+def main(count):
+    # Install the API module
+    api = types.ModuleType('bench_api')
+    exec api_source(count) in api.__dict__
+    sys.modules['bench_api'] = api
+
+    source = test_source()
+    print "%d API names, %d test modules" % (count, MODULES)
+    print "%-16s %10s %10s" % ('collector', 'seconds', 'tests')
+    for name, case, visit in (('dir+getattr', OldCase, old_visit_mod),
+                              ('visit_mod', test.DTestCase,
+                               test.visit_mod)):
+        elapsed, found = collect(source, case, visit)
+        print "%-16s %10.3f %10d" % (name, elapsed, found)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+#
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the cost of walking a source tree to find test modules.  A
+synthetic tree of about ``N`` files is generated: nested packages of
+test and library modules, with data directories which are not
+packages, a ".git" directory and a "node_modules" directory.  The
+tree is then walked with dtest.discovery.walk(), and, for comparison,
+with os.walk() and an os.path.exists() check for each import suffix
+in each subdirectory, as explore() used to do.  The time and the
+number of filesystem calls made through the os module are reported
+for each; no modules are imported.
+
+Usage: python bench/bench_discovery.py [N]
+"""
+
+import imp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from dtest import discovery
+
+
+# Files per directory, and subdirectories per package
+FILES = 20
+FANOUT = 4
+
+
+def _touch(path):
+    # Create an empty file
+    open(path, 'w').close()
+
+
+def build(root, count):
+    """
+    Build a synthetic tree of about ``count`` files under ``root``.
+    """
+
+    made = 0
+    pending = [root]
+    while made < count and pending:
+        path = pending.pop(0)
+        os.makedirs(path)
+        _touch(os.path.join(path, '__init__.py'))
+        for i in range(FILES // 2):
+            _touch(os.path.join(path, 'test_%d.py' % i))
+            _touch(os.path.join(path, 'lib_%d.py' % i))
+        made += FILES + 1
+
+        # A data directory which is not a package
+        data = os.path.join(path, 'data')
+        os.makedirs(data)
+        for i in range(FILES):
+            _touch(os.path.join(data, 'sample_%d.json' % i))
+        made += FILES
+
+        for i in range(FANOUT):
+            pending.append(os.path.join(path, 'pkg_%d' % i))
+
+    # Version control and dependency directories full of files
+    for name in ('.git', 'node_modules'):
+        for i in range(max(1, count // 10 // FILES)):
+            path = os.path.join(root, name, 'd%d' % i)
+            os.makedirs(path)
+            for j in range(FILES):
+                _touch(os.path.join(path, 'f%d' % j))
+
+
+def old_walk(top):
+    """
+    Walk ``top`` as explore() used to: os.walk(), checking each
+    subdirectory for an __init__ module.
+    """
+
+    suffixes = [sfx[0] for sfx in imp.get_suffixes()]
+    for root, dirs, files in os.walk(top):
+        subdirs = []
+        for d in dirs:
+            for sfx in suffixes:
+                if os.path.exists(os.path.join(root, d, '__init__' + sfx)):
+                    subdirs.append(d)
+                    break
+        dirs[:] = subdirs
+
+
+def new_walk(top):
+    """
+    Walk ``top`` with dtest.discovery.walk().
+    """
+
+    for root, files, packages in discovery.walk(top):
+        pass
+
+
+class Counter(object):
+    """
+    Counts calls to the filesystem functions of the os module.
+    """
+
+    names = ('stat', 'lstat', 'listdir', 'scandir')
+
+    def __init__(self):
+        self.calls = 0
+        self.saved = {}
+
+    def __enter__(self):
+        for name in self.names:
+            func = getattr(os, name, None)
+            if func is not None:
+                self.saved[name] = func
+                setattr(os, name, self._wrap(func))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, func in self.saved.items():
+            setattr(os, name, func)
+
+    def _wrap(self, func):
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+
+def measure(walker, top):
+    """
+    Walk ``top`` with ``walker``.  Returns the time taken and the
+    number of filesystem calls made.
+    """
+
+    with Counter() as counter:
+        start = time.time()
+        walker(top)
+        return time.time() - start, counter.calls
+
+
+def main(count):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        top = os.path.join(tmpdir, 'tree')
+        build(top, count)
+        total = sum(len(files) for dirpath, dirs, files in os.walk(top))
+        print "%d files (scandir %s)" % (total, "available"
+                                         if discovery.scandir is not None
+                                         else "not available")
+
+        print "%-16s %10s %10s" % ('walker', 'seconds', 'fs calls')
+        for name, walker in (('os.walk+exists', old_walk),
+                             ('discovery.walk', new_walk)):
+            elapsed, calls = measure(walker, top)
+            print "%-16s %10.3f %10d" % (name, elapsed, calls)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+#
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the memory used by DTestQueue while running suites of ``N``
+independent tests, each of which yields once to let other threads
+run.  Each suite is run in a fresh subprocess in three modes:
+
+:reused:
+    The maximum thread count is 8, and threads which finish a test go
+    on to run the next ready test, as DTestQueue does.
+
+:spawned:
+    The maximum thread count is 8, but a new thread is spawned for
+    every test.
+
+:unbounded:
+    There is no maximum thread count, so a thread is spawned for
+    every test and all of them are alive at once.
+
+For each mode, the number of threads created and the growth in the
+peak resident set size of the process over the run are reported.
+With a maximum thread count, the memory growth should reflect only
+the results retained for each test; without one, it also includes a
+live thread for every test.  With thread reuse, the number of threads
+created should not exceed the maximum thread count.
+
+Usage: python bench/bench_memory.py [N ...]
+"""
+
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from dtest import core
+from dtest import test
+from tests import support
+
+
+# Maximum thread count for the bounded modes
+MAXTH = 8
+
+
+class CountingQueue(core.DTestQueue):
+    """
+    A DTestQueue which counts the threads it creates.
+    """
+
+    threads = 0
+
+    def _run_test(self, dt):
+        self.threads += 1
+        return super(CountingQueue, self)._run_test(dt)
+
+
+class SpawningQueue(CountingQueue):
+    """
+    A CountingQueue which never reuses threads, as the queue did
+    before finished threads picked up the next ready test.
+    """
+
+    def _spawn(self, tests, reuse=False):
+        return super(SpawningQueue, self)._spawn(tests)
+
+
+# Queue class and maximum thread count for each mode
+MODES = [
+    ('reused', CountingQueue, MAXTH),
+    ('spawned', SpawningQueue, MAXTH),
+    ('unbounded', CountingQueue, None),
+    ]
+
+
+def build(count):
+    """
+    Build a suite of ``count`` independent tests.
+    """
+
+    # Each test yields to other threads
+    return [test._gettest(support.mkfunc('test_%d' % i,
+                                         lambda: time.sleep(0)))
+            for i in range(count)]
+
+
+def _maxrss():
+    # Peak resident set size of this process, in kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(mode, count):
+    """
+    Run a suite of ``count`` tests in the named ``mode``.  Returns a
+    tuple of the number of threads created and the growth in peak
+    resident set size, in megabytes.
+    """
+
+    qcls, maxth = [(qcls, maxth) for name, qcls, maxth in MODES
+                   if name == mode][0]
+
+    output = core.DTestOutput(open(os.devnull, 'w'))
+    queue = qcls(maxth=maxth, output=output)
+    queue.add_tests(build(count))
+
+    before = _maxrss()
+    queue.run()
+    return queue.threads, (_maxrss() - before) / 1024.0
+
+
+def main(sizes):
+    print "%10s" % 'tests',
+    for name, qcls, maxth in MODES:
+        print "%9s %-12s" % ('threads', name + ' MB'),
+    print
+
+    for count in sizes:
+        print "%10d" % count,
+        for name, qcls, maxth in MODES:
+            # Measure in a fresh process, so the peak sizes are
+            # independent
+            out = subprocess.check_output([sys.executable, __file__,
+                                           '--measure', name, str(count)])
+            threads, growth = out.split()
+            print "%9s %-12s" % (threads, growth),
+            sys.stdout.flush()
+        print
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        print "%d %.1f" % measure(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
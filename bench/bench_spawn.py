@@ -0,0 +1,139 @@
+#!/usr/bin/python
+#
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the scheduling overhead of DTestQueue as the fan-in of a
+tear down fixture grows.  Each generated suite consists of a setUp()
+fixture, ``N`` empty tests, and a tearDown() fixture dependent on all
+``N`` tests.  The time spent in the _spawn() and _release() methods
+is accumulated and reported per test; for the remaining-dependency
+counter scheduler, this should stay flat as ``N`` grows.  For
+comparison, the same suite is also run with a queue which re-checks
+every dependency of a dependent each time one of its dependencies
+finishes; since the tearDown() fixture is re-checked after each of
+the ``N`` tests, its time per test grows linearly with ``N``.
+
+Usage: python bench/bench_spawn.py [N ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from dtest import core
+from dtest import test
+from tests import support
+
+
+class TimedQueue(core.DTestQueue):
+    """
+    A DTestQueue which accumulates the time spent scheduling tests.
+    """
+
+    sched_time = 0.0
+
+    def _release(self, dt):
+        start = time.time()
+        try:
+            return super(TimedQueue, self)._release(dt)
+        finally:
+            self.sched_time += time.time() - start
+
+    def _spawn(self, tests, reuse=False):
+        start = time.time()
+        try:
+            return super(TimedQueue, self)._spawn(tests, reuse)
+        finally:
+            self.sched_time += time.time() - start
+
+
+class RecheckQueue(TimedQueue):
+    """
+    A TimedQueue which, whenever a test finishes, re-checks every
+    dependency of each of its dependents, as the queue did before it
+    kept per-test remaining-dependency counters.
+    """
+
+    def _release(self, dt):
+        start = time.time()
+        try:
+            self.unfinished.discard(dt)
+            released = []
+            for dep in list(dt._revdeps):
+                if not self.pending.get(dep):
+                    continue
+
+                # Walk all the dependencies of the dependent
+                left = len([other for other in dep._deps
+                            if other in self.unfinished])
+                if left == 0:
+                    self.pending[dep] = 0
+                    released.append(dep)
+
+            return released
+        finally:
+            self.sched_time += time.time() - start
+
+
+def build(count):
+    """
+    Build a fan-in suite of ``count`` tests.  Returns the list of
+    tests and fixtures.
+    """
+
+    setUp = test._gettest(support.mkfunc('setUp'), test.DTestFixtureSetUp)
+    tearDown = test._gettest(support.mkfunc('tearDown'),
+                             test.DTestFixtureTearDown)
+    tearDown._set_partner(setUp)
+
+    tests = [setUp, tearDown]
+    for i in range(count):
+        dt = test._gettest(support.mkfunc('test_%d' % i))
+        test.depends(setUp)(dt)
+        test.depends(dt)(tearDown)
+        tests.append(dt)
+
+    return tests
+
+
+def measure(qcls, count):
+    """
+    Run a fan-in suite of ``count`` tests on a queue of class
+    ``qcls``.  Returns the number of microseconds spent scheduling
+    per test.
+    """
+
+    output = core.DTestOutput(open(os.devnull, 'w'))
+    queue = qcls(output=output)
+    queue.add_tests(build(count))
+
+    queue.run()
+    return queue.sched_time * 1000000.0 / count
+
+
+def main(sizes):
+    print "%10s %16s %16s" % ('fan-in', 'counters us/test', 'recheck us/test')
+    for count in sizes:
+        print "%10d %16.1f %16.1f" % (count, measure(TimedQueue, count),
+                                       measure(RecheckQueue, count))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000, 10000])
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+#
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measures the time taken to start using dtest.  Each of a number of
+statements--importing the modules used to define tests, importing the
+framework as a whole, and, for comparison, importing eventlet--is
+executed ``N`` times, each in a fresh interpreter, as is a dry run of
+the command line tool on a directory holding a single test.  The
+fastest and median times are reported, along with whether eventlet
+was imported; the times for the statements exclude the startup of the
+interpreter.  A fastest time to import the framework over ``BUDGET``
+seconds is reported, and makes the benchmark exit with a non-zero
+status.  The tests/test_startup.py test checks that importing the
+framework leaves eventlet and the machinery of optional features
+unloaded, and holds it to a looser time bound.
+
+Usage: python bench/bench_startup.py [N]
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# The root of the source tree
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The time, in seconds, within which the framework should import
+BUDGET = 0.25
+
+# The statement importing the framework, whose time is budgeted
+FRAMEWORK = 'import dtest'
+
+# The statements to time
+STATEMENTS = [
+    'import dtest.constants',
+    'import dtest.util',
+    'import dtest.test',
+    FRAMEWORK,
+    'import eventlet',
+    ]
+
+# Run in a fresh interpreter, reporting the time taken and whether
+# eventlet was imported
+TIMER = """
+import sys, time
+start = time.time()
+%s
+print time.time() - start, 'eventlet' in sys.modules
+"""
+
+
+def _env():
+    # Make the source tree importable
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+    return env
+
+
+def time_statement(stmt):
+    """
+    Execute ``stmt`` in a fresh interpreter.  Returns the time taken
+    and whether eventlet was imported.
+    """
+
+    out = subprocess.check_output([sys.executable, '-c', TIMER % stmt],
+                                  env=_env())
+    elapsed, loaded = out.split()
+    return float(elapsed), loaded == 'True'
+
+
+def time_dryrun(directory):
+    """
+    Run the command line tool in dry run mode on ``directory``.
+    Returns the time taken, including the startup of the interpreter,
+    and None, since whether eventlet was imported is not known.
+    """
+
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call([sys.executable, '-m', 'dtest.core', '-n',
+                               '-d', directory], env=_env(), stdout=devnull)
+    return time.time() - start, None
+
+
+def measure(func, arg, count):
+    """
+    Call ``func`` with ``arg`` ``count`` times.  Returns the fastest
+    and median times, and whether eventlet was imported.
+    """
+
+    results = [func(arg) for i in range(count)]
+    times = sorted(elapsed for elapsed, loaded in results)
+    return times[0], times[len(times) // 2], results[-1][1]
+
+
+def main(count):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # A directory holding a single test
+        pkgdir = os.path.join(tmpdir, 'startup_tests')
+        os.mkdir(pkgdir)
+        open(os.path.join(pkgdir, '__init__.py'), 'w').close()
+        with open(os.path.join(pkgdir, 'test_one.py'), 'w') as f:
+            f.write('from dtest import *\n\ndef test_x():\n    pass\n')
+
+        print "%-26s %10s %10s %10s" % ('statement', 'fastest', 'median',
+                                        'eventlet')
+        runs = ([(stmt, time_statement, stmt) for stmt in STATEMENTS] +
+                [('dtest.core -n (process)', time_dryrun, pkgdir)])
+        over = False
+        for name, func, arg in runs:
+            fastest, median, loaded = measure(func, arg, count)
+            print "%-26s %10.3f %10.3f %10s" % (
+                name, fastest, median, '-' if loaded is None else loaded)
+            if name == FRAMEWORK and fastest >= BUDGET:
+                over = True
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if over:
+        print "\nImporting the framework exceeds the budget of %.2fs" % BUDGET
+    return not over
+
+
+if __name__ == '__main__':
+    sys.exit(not main(int(sys.argv[1]) if len(sys.argv) > 1 else 10))
@@ -104,7 +104,7 @@ Note that both dtest and dtest.util are safe for use with "import *".
 
 from dtest.capture import Capturer
 from dtest.constants import *
-from dtest.exceptions import DTestException
+from dtest.exceptions import DTestException, DTestTimeout
 from dtest.core import DTestQueue, DTestOutput, status, explore, main, \
     optparser, opts_to_args
 from dtest.resource import cleanaccess, dirty, clean, getobject, \
@@ -116,8 +116,8 @@ from dtest.test import istest, nottest, isfixture, skip, failing, attr, \
 __all__ = ['Capturer',
            'PRE', 'POST', 'TEST',
            'RUNNING', 'FAIL', 'XFAIL', 'ERROR', 'DEPFAIL', 'OK', 'UOK',
-           'SKIPPED',
-           'DTestException',
+           'SKIPPED', 'NOTRUN',
+           'DTestException', 'DTestTimeout',
            'DTestQueue', 'DTestOutput', 'status', 'explore', 'main',
            'optparser', 'opts_to_args',
            'cleanaccess', 'dirty', 'clean', 'getobject', 'Resource',
@@ -0,0 +1,200 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+==========================
+Adaptive Concurrency Limit
+==========================
+
+This module contains the AdaptiveLimit class, which may be passed to
+DTestQueue in place of a fixed maximum thread count.  The limit is
+adjusted while the tests run, using additive-increase,
+multiplicative-decrease: after each window of completed tests, the
+limit is increased by a constant if the tests appear healthy, and
+multiplied by a factor less than one if they appear to be
+overloading something.  Three signals are considered:
+
+:latency:
+    The mean duration of the tests in the window, compared to a
+    moving average of the mean durations of earlier windows.
+
+:errors:
+    The fraction of the tests in the window which ended in the ERROR
+    state.
+
+:load:
+    The one-minute load average of the host, where the operating
+    system provides it.
+"""
+
+import os
+import time
+
+from dtest.constants import *
+
+
+# The default upper bound on the limit
+DEF_MAXIMUM = 64
+
+
+class AdaptiveLimit(object):
+    """
+    AdaptiveLimit
+    =============
+
+    The AdaptiveLimit class maintains a concurrency limit which is
+    adjusted according to the health of the tests being run.  The
+    current limit is obtained by converting the object to an integer.
+    The start() method must be called when the test run begins, and
+    the finished() method each time a test finishes.  Each decision to
+    raise or lower the limit is reported through the info() method of
+    the test output; the ``curve`` attribute records every change of
+    the limit over time as a list of (elapsed seconds, limit) tuples.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=None, increase=1,
+                 decrease=0.5, latency_factor=2.0, latency_floor=0.05,
+                 max_errors=0.2, max_load=None):
+        """
+        Initialize an AdaptiveLimit object.  The limit begins at
+        ``initial`` and is kept between ``minimum`` and ``maximum``
+        (by default, DEF_MAXIMUM).  After each window of completed tests
+        (as many tests as the current limit, but no fewer than
+        ``minimum``), the limit is increased by ``increase``, unless
+        the mean test duration exceeds both ``latency_factor`` times
+        its moving average and ``latency_floor`` seconds, the
+        fraction of tests ending in ERROR exceeds ``max_errors``, or
+        the load average exceeds ``max_load`` (by default, the number
+        of CPUs); in that case the limit is multiplied by
+        ``decrease``.
+        """
+
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else DEF_MAXIMUM
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.max_errors = max_errors
+
+        if max_load is None:
+            import multiprocessing
+            try:
+                max_load = float(multiprocessing.cpu_count())
+            except NotImplementedError:
+                pass
+        self.max_load = max_load
+
+        self.start()
+
+    def __int__(self):
+        """
+        Retrieve the current concurrency limit.
+        """
+
+        return self.limit
+
+    def start(self, output=None):
+        """
+        Reset the limit for the start of a test run.  Decisions will
+        be reported using the info() method of ``output``, if given.
+        """
+
+        self.output = output
+        self.limit = self.initial
+        self.baseline = None
+        self.curve = [(0.0, self.limit)]
+        self._started = time.time()
+        self._samples = []
+
+    def finished(self, dt):
+        """
+        Called when the test ``dt`` has finished.  Adjusts the limit
+        at the end of each window.  Test fixtures are ignored.
+        """
+
+        if not dt.istest():
+            return
+
+        self._samples.append((dt.result.duration, dt.state))
+        if len(self._samples) >= max(self.limit, self.minimum):
+            self._adjust()
+
+    def _loadavg(self):
+        """
+        Retrieve the one-minute load average, or None if it is not
+        available.
+        """
+
+        try:
+            return os.getloadavg()[0]
+        except (AttributeError, OSError):
+            return None
+
+    def _adjust(self):
+        """
+        Decide whether to increase or decrease the limit, based on the
+        tests in the window just completed.
+        """
+
+        samples, self._samples = self._samples, []
+
+        # Compute the signals
+        durations = [dur for dur, state in samples if dur is not None]
+        latency = sum(durations) / len(durations) if durations else None
+        errors = float(len([state for dur, state in samples
+                            if state == ERROR])) / len(samples)
+        load = self._loadavg()
+
+        # Check them for signs of trouble
+        reasons = []
+        if latency is not None and self.baseline is not None:
+            threshold = max(self.baseline * self.latency_factor,
+                            self.latency_floor)
+            if latency > threshold:
+                reasons.append("mean test time %.3fs exceeds %.3fs" %
+                               (latency, threshold))
+        if errors > self.max_errors:
+            reasons.append("%d%% of tests errored out" % (errors * 100))
+        if (load is not None and self.max_load is not None and
+            load > self.max_load):
+            reasons.append("load average %.2f exceeds %.2f" %
+                           (load, self.max_load))
+
+        # Update the latency moving average
+        if latency is not None:
+            if self.baseline is None:
+                self.baseline = latency
+            else:
+                self.baseline = 0.7 * self.baseline + 0.3 * latency
+
+        # Pick the new limit
+        old = self.limit
+        if reasons:
+            self.limit = max(self.minimum, int(self.limit * self.decrease))
+        else:
+            self.limit = min(self.maximum, self.limit + self.increase)
+
+        # Record and report any change
+        if self.limit != old:
+            self.curve.append((time.time() - self._started, self.limit))
+            if self.output is not None and reasons:
+                self.output.info("Concurrency limit lowered from %d to "
+                                 "%d: %s" % (old, self.limit,
+                                             '; '.join(reasons)))
+            elif self.output is not None:
+                self.output.info("Concurrency limit raised from %d to %d" %
+                                 (old, self.limit))
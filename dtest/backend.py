@@ -0,0 +1,501 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+==================
+Execution Backends
+==================
+
+This module contains the classes which provide the threads and
+synchronization primitives used to run tests.  GreenBackend, the
+default, runs tests in eventlet greenthreads after monkey-patching the
+standard library.  ThreadBackend runs tests in native OS threads,
+using a concurrent.futures.ThreadPoolExecutor, without any
+monkey-patching; this permits real concurrency for tests which spend
+their time in C extensions that release the global interpreter lock,
+and avoids problems with libraries that do not work when
+monkey-patched.  On Python 2, ThreadBackend requires the ``futures``
+package.
+
+Each backend provides the following interface:
+
+:setup():
+    Called when a test run begins.
+
+:shutdown():
+    Called when a test run has finished.
+
+:submit(func, *args):
+    Runs a test in a new thread.  The backend may limit the number of
+    these threads which run at once.
+
+:spawn_n(func, *args, **kwargs):
+    Runs ``func`` in a new thread; used by parallelization
+    strategies.
+
+:Semaphore(value=1):
+    Returns a new semaphore, usable as a context manager.
+
+:Event():
+    Returns a new event, with send() and wait() methods.  An event
+    may only be sent once.
+
+:Timeout(seconds, exception):
+    Starts a timer which arranges for ``exception`` to be raised if
+    the cancel() method of the returned object has not been called
+    within ``seconds`` seconds.
+
+:watchdog():
+    Returns a new watchdog, from the dtest.watchdog module, able to
+    interrupt tests which exceed their time limits without yielding.
+
+:sleep():
+    Lets other threads run; used by a test run which discovers tests
+    while running those already discovered.
+
+The backend in use for the current test run is available from the
+current() function.  The ThreadLocal class provides thread-local data
+which works with every backend.
+
+Eventlet is not imported until a GreenBackend is first used, so that
+tests may be defined and discovered without it; the original()
+function retrieves the standard library modules eventlet may have
+monkey-patched without importing it.
+"""
+
+import sys
+import threading
+import time
+import weakref
+
+from greenlet import getcurrent
+
+from dtest.exceptions import DTestException
+from dtest import watchdog as wd
+
+
+class GreenBackend(object):
+    """
+    GreenBackend
+    ============
+
+    The GreenBackend class runs tests in eventlet greenthreads.  The
+    standard library is monkey-patched when a test run begins, so
+    blocking I/O and sleeps in one test allow other tests to run.
+    """
+
+    name = 'green'
+
+    def setup(self):
+        """
+        Prepare for a test run by monkey-patching the standard
+        library.
+        """
+
+        import eventlet
+        eventlet.monkey_patch()
+
+    def shutdown(self):
+        """
+        Clean up after a test run.  Does nothing.
+        """
+
+        pass
+
+    def submit(self, func, *args):
+        """
+        Run the test function ``func`` in a new greenthread.
+        """
+
+        import eventlet
+        eventlet.spawn_n(func, *args)
+
+    def spawn_n(self, func, *args, **kwargs):
+        """
+        Run ``func`` in a new greenthread.
+        """
+
+        import eventlet
+        eventlet.spawn_n(func, *args, **kwargs)
+
+    def Semaphore(self, value=1):
+        """
+        Return a new greenthread semaphore.
+        """
+
+        from eventlet import semaphore
+        return semaphore.Semaphore(value)
+
+    def Event(self):
+        """
+        Return a new greenthread event.
+        """
+
+        from eventlet import event
+        return event.Event()
+
+    def Timeout(self, seconds, exception):
+        """
+        Start a timer which will raise ``exception`` in the current
+        greenthread after ``seconds`` seconds.
+        """
+
+        from eventlet import timeout
+        return timeout.Timeout(seconds, exception)
+
+    def watchdog(self):
+        """
+        Return a new SignalWatchdog, which can interrupt greenthreads
+        of the main thread.
+        """
+
+        return wd.SignalWatchdog()
+
+    def sleep(self):
+        """
+        Yield to the other greenthreads.
+        """
+
+        import eventlet
+        eventlet.sleep(0)
+
+
+class ThreadEvent(object):
+    """
+    ThreadEvent
+    ===========
+
+    The ThreadEvent class provides the interface of an eventlet Event
+    for native threads.  A value may be sent once; all threads
+    waiting for the event are then woken up and receive the value.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ThreadEvent object.
+        """
+
+        self._cond = threading.Condition()
+        self._sent = False
+        self._value = None
+
+    def ready(self):
+        """
+        Returns True if the event has been sent.
+        """
+
+        return self._sent
+
+    def send(self, value=None):
+        """
+        Send the event, waking up all waiting threads, which will
+        receive ``value``.
+        """
+
+        with self._cond:
+            if self._sent:
+                raise AssertionError("Trying to re-send() an already-"
+                                     "triggered event.")
+            self._sent = True
+            self._value = value
+            self._cond.notify_all()
+
+    def wait(self):
+        """
+        Wait until the event is sent, and return the value sent.
+        """
+
+        with self._cond:
+            while not self._sent:
+                # A timeout allows signals to be delivered
+                self._cond.wait(1.0)
+
+        return self._value
+
+
+class SoftTimeout(object):
+    """
+    SoftTimeout
+    ===========
+
+    The SoftTimeout class is used by ThreadBackend in place of an
+    eventlet Timeout.  Native threads cannot be interrupted, so a
+    SoftTimeout does not raise an exception; instead, the ``expired``
+    attribute is set by the cancel() method if the time limit was
+    exceeded, and ``exception`` holds the exception that would have
+    been raised.
+    """
+
+    def __init__(self, seconds, exception):
+        """
+        Initialize a SoftTimeout object, starting the timer.
+        """
+
+        self.seconds = seconds
+        self.exception = exception
+        self.expired = False
+        self._start = time.time()
+
+    def cancel(self):
+        """
+        Stop the timer, determining whether the time limit was
+        exceeded.
+        """
+
+        self.expired = time.time() - self._start > self.seconds
+
+
+class ThreadLocal(object):
+    """
+    ThreadLocal
+    ===========
+
+    The ThreadLocal class provides thread-local data which is unique
+    to each greenthread and to each native thread, and so may be used
+    with any backend.  Like eventlet.corolocal.local, it may be
+    extended; the __init__() method of the subclass is called, with
+    the arguments given when the object was created, the first time
+    the object is used in each thread.  Unlike eventlet.corolocal.local,
+    which swaps the attribute dictionary of the current greenthread
+    into the shared object, each thread's attributes are looked up by
+    its greenlet, so native threads using the object at the same time
+    cannot see each other's data.
+    """
+
+    def __new__(cls, *args, **kwargs):
+        """
+        Create a ThreadLocal object, saving the arguments for the
+        __init__() method.
+        """
+
+        self = object.__new__(cls)
+        object.__setattr__(self, '_local_args', (args, kwargs))
+        object.__setattr__(self, '_local_dicts',
+                           weakref.WeakKeyDictionary())
+        return self
+
+    def _local_dict(self):
+        """
+        Retrieve the attribute dictionary for the current thread,
+        initializing it if the object has not yet been used in this
+        thread.
+        """
+
+        dicts = object.__getattribute__(self, '_local_dicts')
+        cur = getcurrent()
+        try:
+            return dicts[cur]
+        except KeyError:
+            pass
+
+        # First use in this thread; set up the dictionary before
+        # calling __init__(), so its attributes land there
+        dicts[cur] = {}
+        args, kwargs = object.__getattribute__(self, '_local_args')
+        self.__init__(*args, **kwargs)
+        return dicts[cur]
+
+    def __getattribute__(self, attr):
+        """
+        Retrieve the value of ``attr`` for the current thread.
+        Attributes not set in the current thread, such as methods,
+        are looked up normally.
+        """
+
+        if not attr.startswith('_local_'):
+            local = object.__getattribute__(self, '_local_dict')()
+            if attr in local:
+                return local[attr]
+
+        return object.__getattribute__(self, attr)
+
+    def __setattr__(self, attr, value):
+        """
+        Set the value of ``attr`` for the current thread.
+        """
+
+        self._local_dict()[attr] = value
+
+    def __delattr__(self, attr):
+        """
+        Delete ``attr`` for the current thread.
+        """
+
+        try:
+            del self._local_dict()[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+
+class ThreadBackend(object):
+    """
+    ThreadBackend
+    =============
+
+    The ThreadBackend class runs tests in native OS threads managed by
+    a concurrent.futures.ThreadPoolExecutor.  No monkey-patching is
+    performed, so it cannot be used in a process which has already
+    been monkey-patched by eventlet.  Threads spawned by
+    parallelization strategies are created directly, rather than in
+    the executor, so that tests waiting for them cannot exhaust the
+    executor.
+
+    Native threads cannot be interrupted; a test which exceeds its
+    @timed() limit fails when it completes, rather than being
+    interrupted.
+    """
+
+    name = 'thread'
+
+    # Default number of executor threads
+    DEF_WORKERS = 16
+
+    def __init__(self, max_workers=None):
+        """
+        Initialize a ThreadBackend object.  The ``max_workers``
+        argument limits the number of threads running tests; if None,
+        DEF_WORKERS threads are used.
+        """
+
+        try:
+            from concurrent import futures
+        except ImportError:
+            raise DTestException("The thread backend requires the "
+                                 "concurrent.futures module; on Python 2, "
+                                 "install the futures package.")
+
+        self.max_workers = max_workers or self.DEF_WORKERS
+        self.executor = None
+
+    def setup(self):
+        """
+        Prepare for a test run by starting the executor.
+        """
+
+        # Green threads and native threads don't mix
+        patcher = sys.modules.get('eventlet.patcher')
+        if patcher is not None and patcher.is_monkey_patched('thread'):
+            raise DTestException("The thread backend cannot be used once "
+                                 "eventlet has monkey-patched the standard "
+                                 "library.")
+
+        from concurrent import futures
+        self.executor = futures.ThreadPoolExecutor(self.max_workers)
+
+    def shutdown(self):
+        """
+        Clean up after a test run by shutting down the executor.
+        """
+
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def submit(self, func, *args):
+        """
+        Run the test function ``func`` in one of the executor's
+        threads.
+        """
+
+        self.executor.submit(func, *args)
+
+    def spawn_n(self, func, *args, **kwargs):
+        """
+        Run ``func`` in a new native thread.
+        """
+
+        th = threading.Thread(target=func, args=args, kwargs=kwargs)
+        th.daemon = True
+        th.start()
+
+    def Semaphore(self, value=1):
+        """
+        Return a new native semaphore.
+        """
+
+        return threading.Semaphore(value)
+
+    def Event(self):
+        """
+        Return a new ThreadEvent.
+        """
+
+        return ThreadEvent()
+
+    def Timeout(self, seconds, exception):
+        """
+        Return a SoftTimeout, since native threads cannot be
+        interrupted.
+        """
+
+        return SoftTimeout(seconds, exception)
+
+    def watchdog(self):
+        """
+        Return a new ThreadWatchdog, which can interrupt native
+        threads.
+        """
+
+        return wd.ThreadWatchdog()
+
+    def sleep(self):
+        """
+        Yield to the other threads.
+        """
+
+        time.sleep(0)
+
+
+# Available backends, by name
+BACKENDS = {
+    GreenBackend.name: GreenBackend,
+    ThreadBackend.name: ThreadBackend,
+    }
+
+
+# The backend in use
+_current = GreenBackend()
+
+
+def original(modname):
+    """
+    Retrieve the standard library module ``modname`` as it was before
+    eventlet monkey-patched it.  If eventlet has not been imported,
+    nothing can have been patched, and the module is simply imported.
+    """
+
+    patcher = sys.modules.get('eventlet.patcher')
+    if patcher is None:
+        return __import__(modname)
+
+    return patcher.original(modname)
+
+
+def current():
+    """
+    Retrieve the backend in use for the current test run.
+    """
+
+    return _current
+
+
+def use(backend):
+    """
+    Select the ``backend`` to use for subsequent test runs.
+    """
+
+    global _current
+
+    _current = backend
@@ -0,0 +1,471 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+=================
+Test Result Cache
+=================
+
+This module contains the DTestCache class, which remembers the tests
+which passed, so that they need not be run again until something they
+depend on changes.  Each passing test is recorded under a key which is
+a hash of the code of the test, the source of its module and of the
+modules that module uses, transitively, and the states of the tests
+and test fixtures it depends on.  Only modules under the current
+directory are considered; changes to the standard library or to
+installed packages do not invalidate the cache, except that each
+version of Python has its own keys.  Test fixtures are never cached,
+and neither are tests which did not simply pass.
+
+The cache is a directory of small files, one per key, which may be
+shared by several machines over a common filesystem; entries are
+written atomically, and a missing or unreadable entry is simply a
+cache miss.  Once the entries exceed the size limit, the least
+recently used are removed.
+"""
+
+import ast
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import types
+
+from dtest.constants import *
+
+
+# Default cache size limit, in bytes
+DEF_CACHE_SIZE = 10 * 1024 * 1024
+
+# Version of the cache key scheme; bump to invalidate old entries
+_KEY_VERSION = '2'
+
+# Prefix of the names of entries still being written
+_TMP_PREFIX = '.tmp'
+
+# The import statements of each source file, keyed by path, along
+# with the modification time and size of the file they were read from
+_statements = {}
+
+
+def _code_digest(code, h):
+    """
+    Feed the bytecode, names, and constants of the code object
+    ``code``, including those of any nested code objects, into the
+    hash ``h``.  Line numbers and file names are left out, since they
+    are covered by the module source.
+    """
+
+    h.update(code.co_code)
+    h.update(repr(code.co_names))
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _code_digest(const, h)
+        else:
+            h.update(repr(const))
+
+
+def _imports(fname):
+    """
+    Read the import statements anywhere in the source file ``fname``.
+    Returns a list of tuples of the relative import level and the
+    names of the modules the statement may import, or an empty list
+    if the file cannot be read or parsed.  The statements of each
+    file are remembered until the file changes.
+    """
+
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return []
+
+    cached = _statements.get(fname)
+    if cached is not None and cached[:2] == (st.st_mtime, st.st_size):
+        return cached[2]
+
+    statements = []
+    try:
+        with open(fname) as f:
+            tree = ast.parse(f.read(), fname)
+    except (EnvironmentError, SyntaxError, TypeError, ValueError):
+        tree = None
+
+    if tree is not None:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                statements.extend((0, [alias.name])
+                                  for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                # The names imported may be submodules, too
+                base = node.module or ''
+                statements.append((node.level or 0, [base] + [
+                    '%s.%s' % (base, alias.name) if base else alias.name
+                    for alias in node.names if alias.name != '*']))
+
+    _statements[fname] = (st.st_mtime, st.st_size, statements)
+    return statements
+
+
+def _imported(mod):
+    """
+    Determine the names of the modules imported by the import
+    statements of the module ``mod``, including the submodules named
+    by statements such as "import pkg.sub", which bind only the
+    package in the module's namespace.  Only modules which have
+    actually been imported are included.  Returns a set of module
+    names.
+    """
+
+    fname = getattr(mod, '__file__', None)
+    if fname is None:
+        return set()
+    if fname.endswith(('.pyc', '.pyo')):
+        fname = fname[:-1]
+
+    # Relative imports are relative to the package of the module
+    parts = mod.__name__.split('.')
+    if os.path.splitext(os.path.basename(fname))[0] != '__init__':
+        parts.pop()
+
+    imported = set()
+    for level, names in _imports(fname):
+        for name in names:
+            if level > 0:
+                prefix = parts[:len(parts) - level + 1]
+                candidates = ['.'.join(prefix + [name] if name
+                                       else prefix)]
+            else:
+                # Implicit relative imports come first
+                candidates = [name]
+                if parts:
+                    candidates.insert(0, '.'.join(parts + [name]))
+
+            for candidate in candidates:
+                if sys.modules.get(candidate) is None:
+                    continue
+
+                # Packages are imported along with their modules
+                dotted = candidate.split('.')
+                for i in range(1, len(dotted) + 1):
+                    if sys.modules.get('.'.join(dotted[:i])) is not None:
+                        imported.add('.'.join(dotted[:i]))
+                break
+
+    return imported
+
+
+def uses(mod):
+    """
+    Determine the names of the modules used directly by the module
+    ``mod``: its parent packages, the modules it imported, and the
+    modules defining the functions and classes it imported.  The
+    submodules of a package are not considered to be used by it
+    merely because they were imported by some other module; those
+    named by its own import statements are.  Returns a set of module
+    names.
+    """
+
+    used = _imported(mod)
+
+    # Packages are imported before their modules
+    parts = mod.__name__.split('.')
+    for i in range(1, len(parts)):
+        used.add('.'.join(parts[:i]))
+
+    # Look through the module's namespace
+    for value in vars(mod).values():
+        if isinstance(value, types.ModuleType):
+            if not value.__name__.startswith(mod.__name__ + '.'):
+                used.add(value.__name__)
+        else:
+            other = getattr(value, '__module__', None)
+            if isinstance(other, basestring):
+                used.add(other)
+
+    used.discard(mod.__name__)
+    return used
+
+
+class DTestCache(object):
+    """
+    DTestCache
+    ==========
+
+    The DTestCache class keeps track of passing tests across test
+    runs.  The lookup() method determines whether a test ready to run
+    passed before under the same key; the record() method stores the
+    tests which passed in the most recent run and then evicts old
+    entries if the cache has grown beyond its size limit.  Keys are
+    computed by the key() method; the digests of module sources are
+    computed once, so the reset() method must be called if modules
+    are reloaded.
+    """
+
+    def __init__(self, path, max_size=DEF_CACHE_SIZE):
+        """
+        Initialize a DTestCache object, storing its entries in the
+        directory ``path``, which is created if necessary.  The
+        ``max_size`` argument limits the total size of the entries,
+        in bytes.
+        """
+
+        self.path = path
+        self.max_size = max_size
+        self.root = os.path.realpath(os.getcwd()) + os.sep
+
+        # Make sure the directory exists
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # Another machine may have beaten us to it
+                if not os.path.isdir(path):
+                    raise
+
+        # Memoized keys and module information
+        self._keys = {}
+        self._sources = {}
+        self._uses = {}
+
+    def reset(self):
+        """
+        Forget the keys and module sources computed so far, so that
+        reloaded modules are accounted for.
+        """
+
+        self._keys = {}
+        self._sources = {}
+        self._uses = {}
+
+    def _source(self, modname):
+        """
+        Compute the digest of the source of the module ``modname``.
+        Returns None if the module is not under the current directory
+        or its source cannot be read.
+        """
+
+        try:
+            return self._sources[modname]
+        except KeyError:
+            pass
+
+        digest = None
+        mod = sys.modules.get(modname)
+        fname = getattr(mod, '__file__', None)
+        if fname is not None:
+            # Use the source, not the compiled code
+            if fname.endswith(('.pyc', '.pyo')):
+                fname = fname[:-1]
+            if os.path.realpath(fname).startswith(self.root):
+                try:
+                    with open(fname, 'rb') as f:
+                        digest = hashlib.sha1(f.read()).hexdigest()
+                except IOError:
+                    pass
+
+        self._sources[modname] = digest
+        return digest
+
+    def _used(self, modname):
+        """
+        Determine the names of the modules used directly by the module
+        ``modname``.  See uses().
+        """
+
+        try:
+            return self._uses[modname]
+        except KeyError:
+            pass
+
+        mod = sys.modules.get(modname)
+        used = uses(mod) if mod is not None else set()
+        self._uses[modname] = used
+        return used
+
+    def _modules(self, modname):
+        """
+        Collect the digests of the source of the module ``modname``
+        and of every module under the current directory it uses,
+        directly or indirectly.  Returns a sorted list of tuples of
+        the module name and digest.
+        """
+
+        seen = set([modname])
+        pending = [modname]
+        result = []
+        while pending:
+            name = pending.pop()
+            digest = self._source(name)
+            if digest is None:
+                continue
+            result.append((name, digest))
+
+            # Only follow modules under the current directory
+            for other in self._used(name):
+                if other not in seen:
+                    seen.add(other)
+                    pending.append(other)
+
+        return sorted(result)
+
+    def key(self, dt):
+        """
+        Compute the cache key of the test ``dt``, whose dependencies
+        must all have finished.  Returns None if the test may not be
+        cached: if it is a test fixture, or the source of its module
+        cannot be found.
+        """
+
+        if not dt.istest():
+            return None
+
+        code = getattr(dt.test, 'func_code', None)
+        modname = getattr(dt.test, '__module__', None)
+        if code is None or self._source(modname) is None:
+            return None
+
+        h = hashlib.sha1()
+        h.update('dtest %s %s\n' % (_KEY_VERSION, sys.version))
+        h.update('%s\n' % dt)
+
+        # The code of the test and of its class fixtures
+        _code_digest(code, h)
+        for fixture in (dt._pre, dt._post):
+            fcode = getattr(fixture, 'func_code', None)
+            if fcode is not None:
+                _code_digest(fcode, h)
+
+        # The sources the test may use
+        for name, digest in self._modules(modname):
+            h.update('%s %s\n' % (name, digest))
+
+        # The results of its dependencies
+        for dep in sorted(dt._deps, key=str):
+            h.update('%s %s\n' % (dep, dep.state))
+
+        key = h.hexdigest()
+        self._keys[dt] = key
+        return key
+
+    def _entry(self, key):
+        """
+        Determine the file name of the entry for ``key``.  Entries are
+        spread over subdirectories named by the first two characters
+        of the key.
+        """
+
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def lookup(self, dt):
+        """
+        Determine whether the test ``dt``, whose dependencies must all
+        have finished, passed in an earlier test run under the same
+        key.  A hit marks the entry as recently used.
+        """
+
+        key = self.key(dt)
+        if key is None:
+            return False
+
+        entry = self._entry(key)
+        if not os.path.exists(entry):
+            return False
+
+        # Touch the entry, so it's evicted last; the cache may be
+        # read-only, though
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+
+        return True
+
+    def record(self, tests):
+        """
+        Store the tests from ``tests`` which passed in the most recent
+        test run, other than those found in the cache, then evict the
+        least recently used entries if the cache exceeds its size
+        limit.  A test which cannot be stored, for instance because
+        another process is evicting entries at the same time, is
+        simply left out of the cache.
+        """
+
+        for dt in tests:
+            if (dt.state != OK or dt.result.cached or
+                dt not in self._keys):
+                continue
+
+            entry = self._entry(self._keys[dt])
+            dirname = os.path.dirname(entry)
+            try:
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+            except OSError:
+                # Created by someone else in the meantime
+                pass
+
+            # Write the entry atomically
+            tmpname = None
+            try:
+                fd, tmpname = tempfile.mkstemp(prefix=_TMP_PREFIX,
+                                               dir=dirname)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(dict(test=str(dt),
+                                   duration=dt.result.duration), f)
+                os.rename(tmpname, entry)
+            except (IOError, OSError):
+                # Leave the test out of the cache
+                if tmpname is not None:
+                    try:
+                        os.remove(tmpname)
+                    except OSError:
+                        pass
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the total size of
+        the entries is within the size limit.  Entries which vanish
+        while we look at them have been removed by someone else, and
+        entries still being written by someone else are left alone.
+        """
+
+        # Find all the entries
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for fname in filenames:
+                if fname.startswith(_TMP_PREFIX):
+                    continue
+                entry = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(entry)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry))
+                total += st.st_size
+
+        # Remove the oldest until we're within the limit
+        entries.sort()
+        for mtime, size, entry in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            total -= size
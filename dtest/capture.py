@@ -68,7 +68,7 @@ within this module::
 Implementation Details
 ----------------------
 
-The eventlet.corolocal.local class is used to maintain a set of
+The dtest.backend.ThreadLocal class is used to maintain a set of
 capturing objects (as initialized by the Capturer.init() method) for
 each thread.  The Capturer.install() method is used by the framework
 to install a special CaptureProxy object, which uses this thead-local
@@ -79,7 +79,7 @@ Capturer.uninstall() method is used to restore the original values
 that the Capturer.install() method discovered when it installed the
 CaptureProxy object.
 
-The capture module exports three functions used only by the framework;
+The capture module exports five functions used only by the framework;
 these probably should not be called directly by a test author.  The
 retrieve() function retrieves the captured data by calling the
 Capturer.retrieve() methods in turn; the data is returned in the same
@@ -90,6 +90,11 @@ simply call the Capturer.install() and Capturer.uninstall() methods in
 turn.  Note that these calls are not made in any defined order, so
 test authors should not rely on any given ordering.
 
+Finally, the current() and swap() functions retrieve and replace the
+capturing objects of the current thread.  They are used to capture
+the output of coroutine tests, which run in the event loop's thread,
+as the output of the thread waiting for the test.
+
 The capture module also pre-defines two Capturer instances, one for
 capturing output to sys.stdout, and the other for capturing output to
 sys.stderr; the code for this is included in the example above, and
@@ -99,8 +104,7 @@ can be referred to while building your own Capturer subclasses.
 from StringIO import StringIO
 import sys
 
-from eventlet.corolocal import local
-
+from dtest import backend as bk
 from dtest.exceptions import DTestException
 
 
@@ -226,12 +230,12 @@ class Capturer(object):
                               self.__class__.__name__))
 
 
-class _CaptureLocal(local):
+class _CaptureLocal(bk.ThreadLocal):
     """
     _CaptureLocal
     =============
 
-    The _CaptureLocal class extends eventlet.corolocal.local to
+    The _CaptureLocal class extends dtest.backend.ThreadLocal to
     provide thread-local data.  Its attributes map to objects returned
     by the init() methods of the corresponding Capturer instances, and
     are unique to each thread.
@@ -282,6 +286,33 @@ def retrieve():
     return vals
 
 
+def current():
+    """
+    Retrieve the capture objects of the current thread.  Returns a
+    dictionary mapping Capturer names to the objects returned by their
+    init() methods.
+    """
+
+    return dict((name, getattr(_caplocal, name))
+                for name in Capturer._caporder)
+
+
+def swap(caps):
+    """
+    Replace the capture objects of the current thread with those in
+    the dictionary ``caps``, as returned by current().  Returns a
+    dictionary of the replaced objects, which may be passed to swap()
+    to restore them.  This allows output from code run on behalf of
+    another thread to be captured as the other thread's output.
+    """
+
+    old = current()
+    for name, obj in caps.items():
+        setattr(_caplocal, name, obj)
+
+    return old
+
+
 class CaptureProxy(object):
     """
     CaptureProxy
@@ -20,8 +20,8 @@ Test Constants
 
 This module contains the various constants used by the test framework.
 The constants are the various states that a test may be in (RUNNING,
-FAIL, XFAIL, ERROR, DEPFAIL, OK, UOK, and SKIPPED) and the origins of
-messages in the result (PRE, POST, and TEST).
+FAIL, XFAIL, ERROR, DEPFAIL, OK, UOK, SKIPPED, and NOTRUN) and the
+origins of messages in the result (PRE, POST, and TEST).
 """
 
 # Test states
@@ -33,6 +33,7 @@ DEPFAIL = 'DEPFAIL'  # dependency failed or errored out
 OK = 'OK'            # test completed successfully
 UOK = 'UOK'          # test unexpectedly completed successfully
 SKIPPED = 'SKIPPED'  # test was skipped
+NOTRUN = 'NOTRUN'    # test run stopped early
 
 
 # Result message origins
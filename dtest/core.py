@@ -33,23 +33,23 @@ also available, and the module can be executed by passing "-m
 dtest.core" to the Python interpreter.
 """
 
-import imp
-from optparse import OptionParser
+from collections import deque
 import os
 import os.path
 import sys
+import time
 import traceback
 
-from eventlet import spawn_n, monkey_patch
-from eventlet.corolocal import local
-from eventlet.event import Event
-from eventlet.semaphore import Semaphore
-
+from dtest import adaptive
+from dtest import backend as bk
 from dtest import capture
 from dtest.constants import *
 from dtest.exceptions import DTestException
+from dtest import discovery as dc
 from dtest import resource
+from dtest import scheduler as sched
 from dtest import test
+from dtest import watchdog as wd
 
 
 # Default line width
@@ -57,7 +57,7 @@ DEF_LINEWIDTH = 78
 
 
 # Current output for issuing status messages
-_output = local()
+_output = bk.ThreadLocal()
 
 
 class _DTestStatus(object):
@@ -177,6 +177,10 @@ class DTestOutput(object):
         # Determine the name of the test
         name = str(test)
 
+        # Tests found in the cache weren't actually run
+        if state == OK and test.result is not None and test.result.cached:
+            state = 'OK (cached)'
+
         # Determine the width of the test name field
         width = self.linewidth - len(state) - 1
 
@@ -274,6 +278,11 @@ class DTestOutput(object):
         UOK
             The number of tests which unexpectedly passed.
 
+        'cached'
+            The number of tests which passed in an earlier test run
+            and were not run again; these are included in the count
+            of tests which passed.
+
         SKIPPED
             The number of tests which were skipped in this test run.
 
@@ -293,6 +302,10 @@ class DTestOutput(object):
             The number of tests which could not be executed because tests
             they were dependent on failed.
 
+        NOTRUN
+            The number of tests which were not executed because the test
+            run was stopped after too many failures.
+
         'total'
             The total number of tests considered for execution.
 
@@ -300,6 +313,11 @@ class DTestOutput(object):
             The maximum number of simultaneously executing threads
             which were utilized while running tests.
 
+        'limits'
+            Only present if the thread limit was adaptive; a list of
+            tuples of the time, in seconds from the start of the test
+            run, and the thread limit adopted at that time.
+
         Note that test fixtures are not included in these counts.  If a
         test fixture fails (raises an AssertionError) or raises any other
         exception, all tests dependent on that test fixture will fail due
@@ -310,9 +328,12 @@ class DTestOutput(object):
         print >>self.output, ("%d tests run in %d max simultaneous threads" %
                               (counts['total'], counts['threads']))
         if counts[OK] > 0:
-            unexp = ''
+            notes = []
             if counts[UOK] > 0:
-                unexp = ' (%d unexpected)' % counts[UOK]
+                notes.append('%d unexpected' % counts[UOK])
+            if counts.get('cached', 0) > 0:
+                notes.append('%d cached' % counts['cached'])
+            unexp = ' (%s)' % ', '.join(notes) if notes else ''
             print >>self.output, ("  %d tests successful%s" %
                                   (counts[OK], unexp))
         if counts[SKIPPED] > 0:
@@ -336,6 +357,14 @@ class DTestOutput(object):
 
             print >>self.output, ("  %d tests failed (%s)" %
                                   (total, ', '.join(bd)))
+        if counts.get(NOTRUN, 0) > 0:
+            print >>self.output, ("  %d tests not run (too many failures)" %
+                                  counts[NOTRUN])
+        if 'limits' in counts:
+            print >>self.output, ("  thread limit over time: %s" %
+                                  ' '.join('%d@%.1fs' % (limit, when)
+                                           for when, limit
+                                           in counts['limits']))
 
         # Flush the output
         self.output.flush()
@@ -367,6 +396,32 @@ class DTestOutput(object):
         # Flush the output
         self.output.flush()
 
+    def cycles(self, cycles):
+        """
+        Called by run(), before any tests are executed, if dependency
+        cycles were found.  The ``cycles`` argument is a list of
+        cycles; each cycle is a list of tests, beginning and ending
+        with the same test, in which each test depends on the next.
+        The tests in the cycles will not be run.
+        """
+
+        # Emit the cycles
+        print >>self.output, ("The following dependency cycles were "
+                              "encountered:")
+        for cycle in cycles:
+            print >>self.output, '-' * self.linewidth
+            print >>self.output, '  %s' % cycle[0]
+            for dt in cycle[1:]:
+                print >>self.output, '    -> %s' % dt
+        print >>self.output, '-' * self.linewidth
+        print >>self.output, ("The tests in these cycles, and the tests "
+                              "depending on them, will fail.\nThe --dot "
+                              "option may be useful for examining the "
+                              "dependency graph.\n")
+
+        # Flush the output
+        self.output.flush()
+
     def imports(self, exc_list):
         """
         Called by main() if import errors were encountered while
@@ -413,12 +468,35 @@ class DTestOutput(object):
         # Flush the output
         self.output.flush()
 
+    def import_times(self, entries):
+        """
+        Called by main() to report the time taken to import the test
+        modules, if requested.  The ``entries`` argument is a list of
+        dictionaries describing the slowest modules imported, slowest
+        first, as returned by DTestImportTimer.report(); each gives
+        the name of the module, the cumulative time taken to import
+        it and the modules it imported and to find its tests, the
+        time taken by the module itself, the time taken to find its
+        tests, and whether it is a test module.
+        """
+
+        # Emit the table
+        print >>self.output, "\nSlowest imports while discovering tests:"
+        print >>self.output, "%10s %10s %10s  %s" % ('cumulative', 'self',
+                                                    'visit', 'module')
+        for entry in entries:
+            print >>self.output, "%10.3f %10.3f %10.3f  %s%s" % (
+                entry['cumulative'], entry['self'], entry['visit'],
+                entry['module'], ' (test)' if entry['test'] else '')
+
+        # Flush the output
+        self.output.flush()
+
     def info(self, message):
         """
         Called to emit other specialized messages not specifically
-        categorized.  Currently only used in the case of dependency
-        cycle detection.  The ``message`` argument will be an
-        explanatory message.
+        categorized, such as changes to an adaptive thread limit.
+        The ``message`` argument will be an explanatory message.
         """
 
         # Emit the message
@@ -463,37 +541,99 @@ class DTestQueue(object):
     The DTestQueue class maintains a queue of tests waiting to be run.
     The constructor initializes the queue to an empty state and stores
     a maximum simultaneous thread count ``maxth`` (None means
-    unlimited); a ``skip`` evaluation routine (defaults to testing the
-    ``skip`` attribute of the test); and an instance of DTestOutput.
-    The list of all tests in the queue is maintained in the ``tests``
-    attribute; tests may be added to a queue with add_test() (for a
-    single test) or add_tests() (for a sequence of tests).  The tests
-    in the queue may be run by invoking the run() method.
+    unlimited, and an AdaptiveLimit adjusts the count as the tests
+    run); a ``skip`` evaluation routine (defaults to testing the
+    ``skip`` attribute of the test); an instance of DTestOutput; a
+    scheduler, which selects the order in which ready tests are
+    started; a DTestHistory, which records the durations of the
+    tests; and either a count of worker processes in which to run the
+    tests or a pool of workers.  The list of all tests in the queue is
+    maintained in the ``tests`` attribute; tests may be added to a
+    queue with add_test() (for a single test) or add_tests() (for a
+    sequence of tests).  The tests in the queue may be run by invoking
+    the run() method.
     """
 
     def __init__(self, maxth=None, skip=lambda dt: dt.skip,
-                 output=DTestOutput()):
+                 output=DTestOutput(), scheduler=None, history=None,
+                 processes=None, pool=None, backend=None,
+                 max_failures=None, hard_timeouts=False, impact=None,
+                 cache=None):
         """
         Initialize a DTestQueue.  The ``maxth`` argument must be
         either None or an integer specifying the maximum number of
-        simultaneous threads permitted.  The ``skip`` arguments is
-        function references; it should take a test and return True if
-        the test should be skipped.  The ``output`` argument should be
-        an instance of DTestOutput containing a notify() method, which
-        takes a test and the state to which it is transitioning, and
-        may use that information to emit a test result.  Note that the
+        simultaneous threads permitted; it may also be an
+        AdaptiveLimit object from the dtest.adaptive module, or the
+        string "auto" for a new one, in which case the limit is
+        adjusted during the test run.  The ``skip``
+        arguments is function references; it should take a test and
+        return True if the test should be skipped.  The ``output``
+        argument should be an instance of DTestOutput containing a
+        notify() method, which takes a test and the state to which it
+        is transitioning, and may use that information to emit a test
+        result.  Note that the
         notify() method will receive state transitions to the RUNNING
         state, as well as state transitions for test fixtures; callers
         may find the DTestBase.istest() method useful for
         differentiating between regular tests and test fixtures for
         reporting purposes.
+
+        The ``scheduler`` argument may be an object such as those
+        provided by the dtest.scheduler module; it defaults to a
+        FIFOScheduler, which starts ready tests in the order in which
+        they become ready.  If ``history`` is given, it should be a
+        DTestHistory object; the durations of the tests, and which
+        tests failed, will be recorded in it and saved at the end of
+        each test run.
+
+        If ``processes`` is given, the tests will be run in that many
+        worker processes, rather than in threads of the current
+        process.  Alternatively, ``pool`` may be a WorkerPool object,
+        such as a NodePool, to run the tests in.  See the
+        dtest.process module for details.
+
+        The ``backend`` argument selects the threads in which the
+        tests will be run; it defaults to a new backend of the same
+        kind as the one currently in use--initially a GreenBackend,
+        which uses eventlet greenthreads.  A ThreadBackend may be given
+        to run the tests in native OS threads instead.  See the
+        dtest.backend module for details.
+
+        If ``max_failures`` is given, the test run is stopped once
+        that many tests have failed, errored out, or unexpectedly
+        passed; test fixtures which fail are not counted, since the
+        tests depending on them do not run anyway.  No more tests are
+        started, although tests already running are allowed to
+        finish; the tearDown() fixtures of fixtures which were set up
+        are still run.  Tests which were not run end in the NOTRUN
+        state.
+
+        If ``hard_timeouts`` is True, a watchdog enforces the time
+        limits set by the @timed() decorator even on tests which never
+        yield, such as tests spinning on the CPU.  Tests exceeding
+        their limits are interrupted with DTestTimeout and end in the
+        ERROR state.  See the dtest.watchdog module for details.
+
+        If ``impact`` is given, it should be a DTestImpact object; the
+        lines executed by each test will be recorded in it and saved
+        at the end of each test run.  This cannot be combined with
+        worker processes.  See the dtest.impact module for details.
+
+        If ``cache`` is given, it should be a DTestCache object; tests
+        which passed in an earlier test run, and which depend on
+        nothing that has changed since, are not run again, but are
+        reported as passing.  The tests which pass are added to the
+        cache at the end of each test run.  See the dtest.cache module
+        for details.
         """
 
-        # Save our maximum thread count
-        if maxth is None:
-            self.sem = None
-        else:
-            self.sem = Semaphore(maxth)
+        # Save our maximum thread count, which may be adaptive
+        if maxth == 'auto':
+            maxth = adaptive.AdaptiveLimit()
+        self.maxth = maxth
+        self.limiter = None
+        if isinstance(maxth, adaptive.AdaptiveLimit):
+            self.limiter = maxth
 
         # Need to remember the skip routine
         self.skip = skip
@@ -504,18 +644,62 @@ class DTestQueue(object):
         # Initialize the lists of tests
         self.tests = set()
         self.waiting = None
+        self.unfinished = set()
         self.runlist = set()
-
-        # No initial resource manager...
-        self.res_mgr = resource.ResourceManager()
-
-        # Need locks for the waiting and runlist lists
-        self.waitlock = Semaphore()
-        self.runlock = Semaphore()
+        self.feeding = False
+
+        # Remaining-dependency counters for waiting tests, and the
+        # scheduler holding the tests ready to be started
+        self.pending = {}
+        if scheduler is None:
+            scheduler = sched.FIFOScheduler()
+        self.scheduler = scheduler
+
+        # Remember the history, too
+        self.history = history
+
+        # And the map of the lines each test executes
+        if impact is not None and (pool is not None or processes):
+            raise DTestException("Test impact cannot be recorded in worker "
+                                 "processes.")
+        self.impact = impact
+
+        # And the cache of passing tests
+        self.cache = cache
+
+        # Should we enforce hard timeouts?
+        self.hard_timeouts = hard_timeouts
+
+        # Stop the run after this many failures
+        self.max_failures = max_failures
+        self.failures = 0
+        self.stopping = False
+
+        # Set up the pool of workers, if we're using one
+        self.processes = processes
+        if pool is None and processes:
+            from dtest import process
+            pool = process.ProcessPool(processes)
+        self.pool = pool
+
+        # Select the backend providing our threads and locks
+        if backend is None:
+            backend = bk.current().__class__()
+        elif pool is not None and not isinstance(backend, bk.GreenBackend):
+            raise DTestException("Worker pools require the green backend.")
+        self.backend = backend
+
+        # The resource manager, the locks for the waiting and runlist
+        # lists, and the event signaling the end of the run are made
+        # by the backend when the queue is run, so that merely
+        # building a queue doesn't load the backend's machinery
+        self.res_mgr = None
+        self.waitlock = None
+        self.runlock = None
+        self.th_event = None
 
         # Set up some statistics...
         self.th_count = 0
-        self.th_event = Event()
         self.th_simul = 0
         self.th_max = 0
 
@@ -556,6 +740,31 @@ class DTestQueue(object):
         for tst in tests:
             self.add_test(tst)
 
+    def select(self, tests):
+        """
+        Restrict the queue to the tests in ``tests``, along with the
+        test fixtures they depend on and the partners of those
+        fixtures.  Tests which are not selected will not be run; they
+        are placed in the NOTRUN state, without being reported, so
+        that fixtures depending on them do not wait for them.
+        """
+
+        # Can't select tests if the queue is running
+        if self.running:
+            raise DTestException("Cannot select tests in a running queue.")
+
+        # Add in the fixtures
+        from dtest import shard as sh
+        selected = set(tests)
+        sh.closure(selected, self.tests)
+
+        # Tests outside the selection must still reach a final state
+        for dt in self.tests - selected:
+            dt._prepare()
+            dt._result._transition(NOTRUN)
+
+        self.tests = selected
+
     def dot(self, grname='testdeps'):
         """
         Constructs a GraphViz-compatible dependency graph with the
@@ -596,7 +805,7 @@ class DTestQueue(object):
                 opts['color'] = 'red'
             elif isinstance(dt, test.DTestFixture):
                 opts['color'] = 'blue'
-            if dt.state == SKIPPED:
+            if dt.state == SKIPPED or dt.state == NOTRUN:
                 opts['style'] = 'dotted'
             elif dt.state == DEPFAIL:
                 opts['style'] = 'dashed'
@@ -617,63 +826,119 @@ class DTestQueue(object):
         return (('strict digraph "%s" {\n\t' % grname) +
                 '\n\t'.join(nodes) + '\n\n\t' + '\n\t'.join(edges) + '\n}')
 
-    def run(self, debug=False):
+    def run(self, debug=False, feed=None):
         """
         Runs all tests that have been queued up.  Does not return
         until all tests have been run.  Causes test results and
         summary data to be emitted using the ``output`` object
         registered when the queue was initialized.
+
+        If ``feed`` is given, it should be an iterable producing sets
+        of tests as they are discovered, such as the one returned by
+        stream().  The tests are added to the queue, and started as
+        soon as they may be, while the iterable produces the rest; see
+        _feed().  Only the FIFOScheduler may be used, and the tests
+        cannot be run in worker processes.
         """
 
         # Can't run an already running queue
         if self.running:
             raise DTestException("Queue is already running.")
 
+        # Streamed tests are started before the whole dependency graph
+        # is known
+        if feed is not None:
+            if self.pool is not None:
+                raise DTestException("Tests cannot be streamed to worker "
+                                     "processes.")
+            elif type(self.scheduler) is not sched.FIFOScheduler:
+                raise DTestException("Streamed tests must be started in "
+                                     "the order in which they are ready.")
+
         # OK, put ourselves into the running state
         self.running = True
+        self.failures = 0
+        self.stopping = False
 
-        # Must begin by ensuring we're monkey-patched
-        monkey_patch()
-
-        # OK, let's prepare all the tests...
-        for dt in self.tests:
-            dt._prepare()
-
-        # Second pass--determine which tests are being skipped
-        waiting = []
-        for dt in self.tests:
-            # Do we skip this one?
-            willskip = self.skip(dt)
-
-            # If not, check if it's a fixture with no dependencies...
-            if not willskip and not dt.istest():
-                if dt._partner is None:
-                    if len(dt._revdeps) == 0:
-                        willskip = True
-                else:
-                    if len(dt._revdeps) == 1:
-                        willskip = True
-
-            # OK, mark it skipped if we're skipping
-            if willskip:
-                dt._skipped(self.output)
-            else:
-                waiting.append(dt)
-
-        # OK, last pass: generate list of waiting tests; have to
-        # filter out SKIPPED tests
-        self.waiting = set([dt for dt in self.tests if dt.state != SKIPPED])
-
-        # Install the capture proxies...
-        if not debug:
-            capture.install()
-
-        # Spawn waiting tests
-        self._spawn(self.waiting)
-
-        # Wait for all tests to finish
-        if self.th_count > 0:
-            self.th_event.wait()
+        # No initial resource manager...
+        self.res_mgr = resource.ResourceManager(self.backend.Semaphore())
+
+        # Need locks for the waiting and runlist lists, and an event
+        # to wait for the tests to finish
+        self.waitlock = self.backend.Semaphore()
+        self.runlock = self.backend.Semaphore()
+        self.th_event = self.backend.Event()
+
+        # Reset the adaptive thread limit
+        if self.limiter is not None:
+            self.limiter.start(self.output)
+
+        # Must begin by setting up the backend, which for the green
+        # backend ensures we're monkey-patched
+        prev_backend = bk.current()
+        bk.use(self.backend)
+        self.backend.setup()
+
+        # Start the watchdog for hard timeouts
+        prev_watchdog = wd.current()
+        watchdog = None
+        if self.hard_timeouts:
+            watchdog = self.backend.watchdog()
+            watchdog.start()
+            wd.use(watchdog)
+
+        # Start recording the lines each test executes
+        tracer = None
+        if self.impact is not None:
+            from dtest import impact as ti
+            tracer = ti.LineTracer(lambda: status.test)
+            tracer.start()
+
+        if feed is None:
+            # OK, let's prepare all the tests...
+            for dt in self.tests:
+                dt._prepare()
+
+            # ...and wait for them all
+            self.waiting = set()
+            self.unfinished = set()
+            self.pending = {}
+            ready = self._admit(self.tests)
+
+            # Let the scheduler analyze the tests to be run
+            self.scheduler.prepare(self.waiting)
+
+            # Start up the workers, if we're using them
+            if self.pool is not None:
+                self.pool.start(self, self.waiting, debug)
+
+            # Install the capture proxies...
+            if not debug:
+                capture.install()
+
+            # Spawn the tests which have nothing to wait for
+            self._spawn(ready)
+
+            # Wait for all tests to finish
+            if self.th_count > 0:
+                self.th_event.wait()
+        else:
+            self._feed(feed, debug)
+
+        # Stop recording the executed lines
+        if tracer is not None:
+            tracer.stop()
+
+        # Shut down the watchdog, the backend, and the workers
+        if watchdog is not None:
+            watchdog.stop()
+            wd.use(prev_watchdog)
+        self.backend.shutdown()
+        bk.use(prev_backend)
+        res_msgs = []
+        if self.pool is not None:
+            self.pool.stop()
+            res_msgs = self.pool.messages
 
         # OK, uninstall the capture proxies
         if not debug:
@@ -681,6 +946,21 @@ class DTestQueue(object):
 
         # Now we go through and clean up all left-over resources
         self.res_mgr.release_all()
+        res_msgs += self.res_mgr.messages
+
+        # Remember how long the tests took
+        if self.history is not None:
+            self.history.record(self.tests)
+            self.history.save()
+
+        # And which lines they executed
+        if self.impact is not None:
+            self.impact.record(self.tests, tracer.lines)
+            self.impact.save()
+
+        # Cache the tests which passed
+        if self.cache is not None:
+            self.cache.record(self.tests)
 
         # Walk through the tests and output the results
         cnt = {
@@ -691,9 +971,13 @@ class DTestQueue(object):
             XFAIL: 0,
             ERROR: 0,
             DEPFAIL: 0,
+            NOTRUN: 0,
+            'cached': 0,
             'total': 0,
             'threads': self.th_max,
             }
+        if self.limiter is not None:
+            cnt['limits'] = self.limiter.curve
         for t in self.tests:
             # Get the result object
             r = t.result
@@ -708,6 +992,10 @@ class DTestQueue(object):
             elif r.state == XFAIL:
                 cnt[FAIL] += int(r.test)
 
+            # Count the tests found in the cache
+            if r.cached:
+                cnt['cached'] += int(r.test)
+
             try:
                 # Emit the result messages
                 self.output.result(r, debug)
@@ -721,9 +1009,8 @@ class DTestQueue(object):
 
         # If there were resource tearDown exceptions, emit data about
         # them
-        msgs = self.res_mgr.messages
-        if msgs:
-            self.output.resources(msgs)
+        if res_msgs:
+            self.output.resources(res_msgs)
 
         # If we saw exceptions, emit data about them
         if self.caught:
@@ -743,125 +1030,386 @@ class DTestQueue(object):
         # All tests passed!
         return True
 
-    def _spawn(self, tests):
+    def _admit(self, tests):
         """
-        Selects all ready tests from the set or list specified in
-        ``tests`` and spawns threads to execute them.  Note that the
-        maximum thread count restriction is implemented by having the
-        thread wait on the ``sem`` Semaphore after being spawned.
+        Adds the tests in ``tests``, which must have been prepared, to
+        the tests waiting to be run.  Those to be skipped, including
+        test fixtures on which no test depends, are skipped; tests in
+        dependency cycles are failed.  The dependencies of each test
+        must already have been admitted, or be among ``tests``.
+        Returns the list of tests which have no dependencies left to
+        wait for, which should be passed to _spawn().
         """
 
-        # Work with a copy of the tests
-        tests = list(tests)
-
-        # Loop through the list
-        while tests:
-            # Pop off a test to consider
-            dt = tests.pop(0)
-
-            with self.waitlock:
-                # Is test waiting?
-                if dt not in self.waiting:
-                    continue
-
-                # OK, check dependencies
-                elif dt._depcheck(self.output):
-                    # No longer waiting
-                    self.waiting.remove(dt)
-
-                    # Place test on the run list
-                    with self.runlock:
-                        self.runlist.add(dt)
-
-                    # Spawn the test
-                    self.th_count += 1
-                    spawn_n(self._run_test, dt)
-
-                # Dependencies failed; check if state changed and add
-                # its dependents if so
-                elif dt.state is not None:
-                    # No longer waiting
-                    self.waiting.remove(dt)
-
-                    # Check all its dependents.  Note--not trying to
-                    # remove duplicates, because some formerly
-                    # unrunnable tests may now be runnable because of
-                    # the state change
-                    tests.extend(list(dt.dependents))
-
-    def _run_test(self, dt):
+        with self.waitlock:
+            # Determine which tests are being skipped
+            for dt in tests:
+                # Do we skip this one?
+                willskip = self.skip(dt)
+
+                # If not, check if it's a fixture with no
+                # dependencies...
+                if not willskip and not dt.istest():
+                    if dt._partner is None:
+                        if len(dt._revdeps) == 0:
+                            willskip = True
+                    else:
+                        if len(dt._revdeps) == 1:
+                            willskip = True
+
+                # OK, mark it skipped if we're skipping
+                if willskip:
+                    dt._skipped(self.output)
+
+            # The tests not skipped are waiting, and have yet to
+            # finish; have to filter out SKIPPED tests, since skipping
+            # one test may skip others
+            admitted = set([dt for dt in tests if dt.state != SKIPPED])
+            self.waiting |= admitted
+            self.unfinished |= admitted
+
+            # Count the dependencies each admitted test must wait
+            # for; dependencies which are not unfinished have already
+            # reached their final state
+            for dt in admitted:
+                self.pending[dt] = len([dep for dep in dt._deps
+                                        if dep in self.unfinished])
+
+            # Tests in dependency cycles can never run; fail them now,
+            # releasing their dependents so the failure propagates
+            ready = [dt for dt in admitted if self.pending[dt] == 0]
+            cycles = sched.find_cycles(admitted)
+            if cycles:
+                self.output.cycles([sched.cycle_path(cycle)
+                                    for cycle in cycles])
+                for cycle in cycles:
+                    for dt in cycle:
+                        dt._result._transition(DEPFAIL, output=self.output)
+                        self.waiting.remove(dt)
+                for cycle in cycles:
+                    for dt in cycle:
+                        ready.extend(self._release(dt))
+
+        return ready
+
+    def _feed(self, feed, debug=False):
         """
-        Execute ``dt``.  This method is meant to be run in a new
-        thread.
-
-        Once a test is complete, the thread's dependents will be
-        passed back to the spawn() method, in order to pick up and
-        execute any tests that are now ready for execution.
+        Runs the tests in the queue while adding the sets of tests
+        produced by the iterable ``feed``; see run().  Each test is
+        admitted once all its dependencies have been, so a test whose
+        dependency is yet to be discovered is deferred.  Test fixtures
+        are deferred until some test depends on them, and tearDown()
+        fixtures until the iterable is exhausted, since more tests
+        needing the fixture may yet be discovered.  The tests
+        remaining then are admitted, and skipped or failed as usual.
+        Does not return until all tests have been run.
         """
 
-        # Acquire the thread semaphore
-        if self.sem is not None:
-            self.sem.acquire()
-
-        # Increment the simultaneous thread count
-        self.th_simul += 1
-        if self.th_simul > self.th_max:
-            self.th_max = self.th_simul
+        # Nothing is waiting yet; the end of the run may not be
+        # signaled until the iterable is exhausted
+        with self.waitlock:
+            self.waiting = set()
+            self.unfinished = set()
+            self.pending = {}
+            self.feeding = True
+        deferred = set(self.tests)
+        for dt in deferred:
+            dt._prepare()
+        self.scheduler.prepare(set())
 
-        # Save the output and test relative to this thread, for the
-        # status stream
-        status.setup(self.output, dt)
+        # Install the capture proxies...
+        if not debug:
+            capture.install()
 
-        # Execute the test
+        def admissible(dt):
+            # Can the deferred test be admitted yet?
+            if isinstance(dt, test.DTestFixtureTearDown):
+                return False
+            elif not dt.istest():
+                # Only a partner depends on it so far?
+                needed = len(dt._revdeps)
+                if dt._partner is not None:
+                    needed -= 1
+                if needed <= 0:
+                    return False
+            return not [dep for dep in dt._deps
+                        if dep not in self.tests or dep in deferred]
+
+        def admit(candidates):
+            # Admit the admissible tests, followed by the dependents
+            # they make admissible in turn
+            batch = []
+            candidates = list(candidates)
+            while candidates:
+                dt = candidates.pop()
+                if dt in deferred and admissible(dt):
+                    deferred.remove(dt)
+                    batch.append(dt)
+                    candidates.extend(dt._revdeps)
+            if batch:
+                self._spawn(self._admit(batch))
+
+        # Admit each set of tests as it's discovered, letting the
+        # tests already admitted run meanwhile
+        admit(deferred)
         try:
-            dt._run(self.output, self.res_mgr)
+            for tests in feed:
+                tests = set(tests) - self.tests
+                for dt in tests:
+                    dt._prepare()
+                self.tests |= tests
+                deferred |= tests
+                admit(deferred)
+                self.backend.sleep()
         except:
             # Add the exception to the caught list
             self.caught.append(sys.exc_info())
 
-            # Manually transition the test to the ERROR state
-            dt._result._transition(ERROR, output=self.output)
+        # Admit the rest, and wait for all tests to finish
+        ready = self._admit(deferred)
+        with self.waitlock:
+            self.feeding = False
+        self._spawn(ready)
+        with self.waitlock:
+            done = (len(self.waiting) == 0 and len(self.scheduler) == 0 and
+                    self.th_count == 0)
+        if not done:
+            self.th_event.wait()
 
-        # OK, done running the test; take it off the run list
-        with self.runlock:
-            self.runlist.remove(dt)
+    def _release(self, dt):
+        """
+        Notes that ``dt`` has reached its final state by decrementing
+        the remaining-dependency counters of its dependents.  Returns
+        the list of dependents which have no dependencies left to wait
+        for.  Must be called with the ``waitlock`` held.
+        """
 
-        # Now, walk through its dependents and check readiness
-        self._spawn(dt.dependents)
+        # Walk through the dependents and count down; copy them, as
+        # tests discovered while the queue runs may add to them
+        self.unfinished.discard(dt)
+        released = []
+        for dep in list(dt._revdeps):
+            if dep not in self.pending:
+                continue
 
-        # All right, we're done; release the semaphore
-        if self.sem is not None:
-            self.sem.release()
+            self.pending[dep] -= 1
+            if self.pending[dep] == 0:
+                released.append(dep)
 
-        # Decrement the thread count
-        self.th_simul -= 1
-        self.th_count -= 1
+        return released
+
+    def _spawn(self, tests, reuse=False):
+        """
+        Checks the tests in the set or list specified in ``tests``,
+        all of which must have no dependencies left to wait for.
+        Tests which may be run are pushed onto the scheduler; tests
+        which cannot be run because of the state of their dependencies,
+        or because the run is stopping, release their own dependents
+        in turn.  Threads are then spawned to execute ready tests, as
+        long as the maximum thread count permits.
+
+        If ``reuse`` is True, the caller is a thread which has
+        finished running its test, and which has already given up its
+        place in the thread count.  Rather than spawning a new thread
+        for the first test selected, that test is returned for the
+        caller to run; None is returned if there is no test for the
+        caller, in which case it should exit.
+        """
+
+        # Work with a copy of the tests
+        tests = deque(tests)
+        mine = None
 
-        # If thread count is now 0, signal the event
         with self.waitlock:
-            if len(self.waiting) == 0 and self.th_count == 0:
-                self.th_event.send()
-                return
+            while True:
+                # Loop through the list
+                while tests:
+                    # Pop off a test to consider
+                    dt = tests.popleft()
+
+                    # Is test waiting?
+                    if dt not in self.waiting:
+                        continue
+
+                    # Skipped since it was admitted?  Only tests fed
+                    # to a running queue may be
+                    elif dt.state == SKIPPED:
+                        self.waiting.remove(dt)
+                        tests.extend(self._release(dt))
+
+                    # OK, check dependencies; this only happens once per
+                    # test, since all the dependencies have finished
+                    elif dt._depcheck(self.output):
+                        # No longer waiting
+                        self.waiting.remove(dt)
+
+                        # Hand the test to the scheduler, unless we're
+                        # stopping
+                        if self._stopped(dt):
+                            tests.extend(self._release(dt))
+                        else:
+                            self.scheduler.push(dt)
+
+                    # Dependencies failed; if the state changed, the test
+                    # is finished, so release its dependents
+                    elif dt.state is not None:
+                        # No longer waiting
+                        self.waiting.remove(dt)
+
+                        # Check the dependents which are now unblocked
+                        tests.extend(self._release(dt))
+
+                # Now start as many ready tests as we're permitted;
+                # tests not started because we're stopping may
+                # release others
+                released, dt = self._dispatch(reuse and mine is None)
+                if dt is not None:
+                    mine = dt
+                tests.extend(released)
+                if not tests:
+                    break
+
+        return mine
+
+    def _stopped(self, dt):
+        """
+        Determines whether ``dt`` should not be run because the run
+        is stopping.  If so, the test is transitioned to the NOTRUN
+        state.  The tearDown() fixtures are still run, so fixtures
+        which were set up get torn down.  Must be called with the
+        ``waitlock`` held.
+        """
+
+        if (not self.stopping or
+            isinstance(dt, test.DTestFixtureTearDown)):
+            return False
+
+        dt._result._transition(NOTRUN)
+        return True
+
+    def _dispatch(self, reuse=False):
+        """
+        Spawns threads to execute the tests selected by the scheduler,
+        until either no ready tests remain, the scheduler declines to
+        start any more, or the maximum thread count has been reached.
+        If ``reuse`` is True, no thread is spawned for the first test
+        selected; it is to be run by the calling thread instead.  If
+        the run is stopping, tests selected by the scheduler are not
+        run.  Returns a tuple of the list of dependents of the tests
+        not run which have no dependencies left to wait for, and the
+        test for the calling thread, if any.  Must be called with the
+        ``waitlock`` held.
+        """
 
-            # If the run list is empty, that means we have a cycle
+        released = []
+        mine = None
+        while (len(self.scheduler) > 0 and
+               (self.maxth is None or self.th_count < int(self.maxth))):
+            # Get the next test to run
+            dt = self.scheduler.pop()
+            if dt is None:
+                break
+
+            # Don't start tests if we're stopping, or which were
+            # skipped since they were admitted
+            if dt.state == SKIPPED or self._stopped(dt):
+                self.scheduler.finished(dt)
+                released.extend(self._release(dt))
+                continue
+
+            # Place test on the run list
             with self.runlock:
-                if len(self.runlist) == 0:
-                    for dt2 in list(self.waiting):
-                        # Manually transition to DEPFAIL
-                        dt2._result._transition(DEPFAIL, output=self.output)
+                self.runlist.add(dt)
+
+            # Spawn the test, unless the caller will run it
+            self.th_count += 1
+            if reuse and mine is None:
+                mine = dt
+            else:
+                self.backend.submit(self._run_test, dt)
+
+        return released, mine
 
-                    # Emit an error message to let the user know what
-                    # happened
-                    self.output.info("A dependency cycle was discovered.  "
-                                     "Please examine the dependency graph "
-                                     "and correct the cycle.  The --dot "
-                                     "option may be useful here.")
+    def _run_test(self, dt):
+        """
+        Execute ``dt``.  This method is meant to be run in a new
+        thread.
 
-                    # Now, let's signal our event
-                    self.th_event.send()
+        Once a test is complete, the thread's dependents will be
+        passed back to the _spawn() method, in order to pick up and
+        execute any tests that are now ready for execution.  The
+        thread then goes on to execute the next ready test, if there
+        is one, so the number of threads created grows with the
+        maximum thread count rather than with the number of tests.
+        """
+
+        while dt is not None:
+            # Increment the simultaneous thread count
+            with self.waitlock:
+                self.th_simul += 1
+                if self.th_simul > self.th_max:
+                    self.th_max = self.th_simul
+
+            # Save the output and test relative to this thread, for
+            # the status stream
+            status.setup(self.output, dt)
+
+            # Execute the test, in a worker if we have them, unless
+            # it already passed
+            try:
+                if self.cache is not None and self.cache.lookup(dt):
+                    dt._result._from_cache(self.output)
+                elif self.pool is not None:
+                    self.pool.run(dt)
+                else:
+                    dt._run(self.output, self.res_mgr)
+            except:
+                # Add the exception to the caught list
+                self.caught.append(sys.exc_info())
 
+                # Manually transition the test to the ERROR state
+                dt._result._transition(ERROR, output=self.output)
 
-def explore(directory=None, queue=None):
+            # OK, done running the test; take it off the run list
+            with self.runlock:
+                self.runlist.remove(dt)
+
+            # Now, count down its dependents and decrement the thread
+            # count, freeing our slot for another test
+            with self.waitlock:
+                self.scheduler.finished(dt)
+                released = self._release(dt)
+                self.th_simul -= 1
+                self.th_count -= 1
+
+                # Let the adaptive thread limit observe the test
+                if self.limiter is not None:
+                    self.limiter.finished(dt)
+
+                # Stop the run if too many tests have failed
+                if dt.istest() and dt.state in (FAIL, ERROR, UOK):
+                    self.failures += 1
+                    if (self.max_failures is not None and
+                        self.failures >= self.max_failures):
+                        self.stopping = True
+
+            # Check the dependents which are no longer waiting on
+            # anything, start any ready tests, and pick up the next
+            # test for this thread
+            dt = self._spawn(released, reuse=True)
+
+        # If thread count is now 0, signal the event, unless tests
+        # are still being discovered; dependency cycles were dealt
+        # with before the tests were admitted, so nothing can be left
+        # waiting
+        with self.waitlock:
+            if (not self.feeding and len(self.waiting) == 0 and
+                len(self.scheduler) == 0 and self.th_count == 0):
+                self.th_event.send()
+
+
+def explore(directory=None, queue=None, ignore=dc.DEF_IGNORE,
+            modnames=None, timer=None):
     """
     Explore ``directory`` (by default, the current working directory)
     for all modules matching the test regular expression and import
@@ -872,7 +1420,12 @@ def explore(directory=None, queue=None):
     containing information about all ImportError exceptions caught.
     The elements of this exception information tuple are, in order, a
     path, the module name, and a tuple of exception information as
-    returned by sys.exc_info().
+    returned by sys.exc_info().  Files and directories matching the
+    glob patterns in ``ignore`` are not explored; see the
+    dtest.discovery module.  If ``modnames`` is given, only the test
+    modules and packages with those names are imported.  If ``timer``
+    is given, it is a DTestImportTimer, which times the imports and
+    the visits to the test modules; see the dtest.importtime module.
     """
 
     # If no queue is provided, allocate one with the default settings
@@ -885,138 +1438,98 @@ def explore(directory=None, queue=None):
     # List of all import exceptions
     caught = []
 
-    # Need the allowable suffixes
-    suffixes = [sfx[0] for sfx in imp.get_suffixes()]
+    # Discover the tests in each module in turn
+    for found in stream(directory, ignore, modnames, timer, caught):
+        tests |= found
+
+    # Add the discovered tests to the queue
+    queue.add_tests(tests)
+
+    # Output the import errors, if any
+    if caught:
+        queue.output.imports(caught)
+
+    # Return the queue
+    return queue
+
+
+def stream(directory=None, ignore=dc.DEF_IGNORE, modnames=None,
+           timer=None, caught=None):
+    """
+    Explore ``directory`` for test modules, as explore() does,
+    generating the set of tests discovered in each test module as it
+    is visited.  The ``ignore``, ``modnames``, and ``timer`` arguments
+    are as for explore(); if ``caught`` is given, information about
+    the ImportError exceptions caught is appended to it.  The modules
+    are imported with the help of a DTestImporter rather than by
+    altering the import path, and only the imports made by this
+    thread are timed, so the tests already generated may be run in
+    the meantime; see DTestQueue.run().
+    """
 
     # Obtain the canonical directory name
     if directory is None:
         directory = os.getcwd()
     else:
         directory = os.path.abspath(directory)
-
-    # This is the directory we'll be searching
-    searchdir = directory
-
-    # But does it have an __init__.py?
-    pkgpath = None
-    for sfx in suffixes:
-        if os.path.exists(os.path.join(directory, '__init__' + sfx)):
-            # Refigure the directory
-            directory, pkgpath = os.path.split(directory)
-
-    # Now, let's jigger the import path
-    tmppath = sys.path
-    sys.path = [directory] + sys.path
-
-    # Import the package, if necessary
-    if pkgpath is not None:
+    if caught is None:
+        caught = []
+
+    # If the directory is a package, we import from the directory
+    # containing it
+    basedir = dc.base(directory)[0]
+    importer = dc.DTestImporter(basedir)
+
+    # Walk the tree, importing the test modules and packages
+    failed = set()
+    for path, modname in dc.modules(directory, ignore, failed):
+        # Are we only importing some of them?
+        if modnames is not None and modname not in modnames:
+            continue
+
+        # Let's find modules in the base directory, and time the
+        # import if asked
+        importer.install()
+        if timer is not None:
+            timer.start()
+            timer.test(modname)
+
+        # Let's try to import it and visit it
+        tests = set()
         try:
-            __import__(pkgpath)
-            test.visit_mod(sys.modules[pkgpath], tests)
-        except ImportError:
-            # Remember the exception we got
-            caught.append((searchdir, pkgpath, sys.exc_info()))
-
-    # Having done that, we now begin walking the directory tree
-    for root, dirs, files in os.walk(searchdir):
-        # Let's determine the module's package path
-        if root == directory:
-            pkgpath = ''
-        else:
-            sep = root[len(directory)]
-            subdir = root[len(directory) + 1:]
-            pkgpath = '.'.join(subdir.split(sep)) + '.'
-
-        # Start with files...
-        for f in files:
-            # Does it match the testRE?
-            if not test.testRE.match(f):
-                continue
-
-            # Only interested in files we can load
-            for sfx in suffixes:
-                if f.endswith(sfx):
-                    modname = f[:-len(sfx)]
-                    break
-            else:
-                # Can't load it, so skip it
-                continue
-
-            # Determine the module's full path
-            fullmodname = pkgpath + modname
-
-            # Let's try to import it
             try:
-                __import__(fullmodname)
-                mod = sys.modules[fullmodname]
+                __import__(modname)
+                mod = sys.modules[modname]
             except ImportError:
                 # Remember the exception we got
-                caught.append((os.path.join(root, f), fullmodname,
-                               sys.exc_info()))
-
-                # Can't import it, so move on
-                continue
-
-            test.visit_mod(mod, tests)
-
-        # Now we want to determine which subdirectories are packages;
-        # they'll contain __init__.py
-        subdirs = []
-        for d in dirs:
-            # Only interested in directories which contain __init__.py
-            for sfx in suffixes:
-                if os.path.exists(os.path.join(root, d, '__init__' + sfx)):
-                    break
-            else:
-                # Not a package, so skip it
-                continue
-
-            # Does it match the testRE?
-            if not test.testRE.match(d):
-                # No, but let's continue exploring under it
-                subdirs.append(d)
-                continue
-
-            # Determine the package's full path
-            fullpkgname = pkgpath + d
-
-            # Let's try to import it
-            try:
-                __import__(fullpkgname)
-                pkg = sys.modules[fullpkgname]
-            except ImportError:
-                # Remember the exception we got
-                caught.append((os.path.join(root, d), fullpkgname,
-                               sys.exc_info()))
+                caught.append((path, modname, sys.exc_info()))
 
                 # Can't import it, no point exploring under it
+                failed.add(modname)
                 continue
 
-            test.visit_mod(pkg, tests)
-
-            # We also want to explore under it
-            subdirs.append(d)
-
-        # Make sure to set up our pruned subdirectory list
-        dirs[:] = subdirs
-
-    # We have finished loading all tests; restore the original import
-    # path
-    sys.path = tmppath
-
-    # Add the discovered tests to the queue
-    queue.add_tests(tests)
-
-    # Output the import errors, if any
-    if caught:
-        queue.output.imports(caught)
+            start = time.time()
+            test.visit_mod(mod, tests)
+            if timer is not None:
+                timer.visit(modname, time.time() - start)
+        finally:
+            if timer is not None:
+                timer.stop()
+            importer.remove()
 
-    # Return the queue
-    return queue
+        yield tests
 
 
 def main(directory=None, maxth=None, skip=lambda dt: dt.skip,
-         output=DTestOutput(), dryrun=False, debug=False, dotpath=None):
+         output=DTestOutput(), dryrun=False, debug=False, dotpath=None,
+         history=None, critical=False, processes=None, listen=None,
+         nodes=1, worker=None, max_scopes=None, backend=None,
+         max_failures=None, hard_timeouts=False, shard=None, impact=None,
+         changed_since=None, last_failed=False, failed_first=False,
+         cache=None, cache_size=None, watch=False, names=None, tests=None,
+         serve=None, ignore=dc.DEF_IGNORE, index=None, static=False,
+         import_times=None, import_times_path=None, streaming=False,
+         authkey=None):
     """
     Discover tests under ``directory`` (by default, the current
     directory), then run the tests under control of ``maxth``,
@@ -1024,19 +1537,332 @@ def main(directory=None, maxth=None, skip=lambda dt: dt.skip,
     function for more information on these three parameters).  Returns
     True if all tests (with the exclusion of expected failures)
     passed, or False if an unexpect OK, a failure, or an error was
-    encountered.
+    encountered.  If ``maxth`` is "auto", the thread limit is
+    adjusted while the tests run; see the dtest.adaptive module.
+    Files and directories matching the glob patterns in ``ignore``
+    are not searched for tests.
+
+    If ``history`` is given, it names a file in which the durations
+    of the tests, and which tests failed, are recorded.  If
+    ``critical`` is True, ready tests are started in order of the
+    longest remaining path through the dependency graph, using the
+    durations from the history file (by default, ".dtest_history" in
+    the current directory).  If ``processes`` is given, the tests are
+    run in that many worker processes.
+
+    If ``listen`` is given, the tests are run by workers connecting
+    to that address, which may be "host:port" or the path of a Unix
+    domain socket; the run begins once ``nodes`` workers have
+    connected.  If ``worker`` is given, the discovered tests are not
+    run; instead, this process connects to the coordinator at that
+    address and runs the tests it requests.  The coordinator and the
+    workers authenticate each other using the shared secret
+    ``authkey``, which is required for TCP addresses and defaults to
+    the value of the DTEST_AUTHKEY environment variable; see the
+    dtest.process module.
+
+    If ``max_scopes`` is given, the tests using a test fixture are
+    finished before other fixtures are set up, and no more than
+    ``max_scopes`` fixtures are set up at once.
+
+    The ``backend`` argument names the execution backend: "green"
+    (the default) runs the tests in eventlet greenthreads, while
+    "thread" runs them in native OS threads, no more than ``maxth``
+    at once if that is given.
+
+    If ``max_failures`` is given, the test run is stopped once that
+    many tests have failed; tests which have not yet been started are
+    not run.  If ``hard_timeouts`` is True, tests exceeding their
+    @timed() limits are interrupted even if they never yield.
+
+    If ``shard`` is given, it is a tuple of an index (counting from 1)
+    and a count; the discovered tests are split into that many
+    shards, balanced using the durations from the history file (by
+    default, ".dtest_history" in the current directory, which is not
+    updated unless ``history`` is given), and only the tests of the
+    indicated shard are run.  See the dtest.shard module.
+
+    If ``impact`` is given, it names a file in which the lines
+    executed by each test are recorded.  If ``changed_since`` is
+    given, it names a git revision; only the tests which executed
+    lines changed since that revision, according to the recorded
+    lines (by default, from ".dtest_impact" in the current directory,
+    which is not updated unless ``impact`` is given), are run, along
+    with any tests for which no lines have been recorded.  Lines which
+    run when a module is imported, such as constants and decorators,
+    are never recorded; changing one runs every test in that module
+    and in the modules using it.  See the dtest.impact module.
+
+    If ``last_failed`` is True, only the tests which did not pass the
+    last time they were run, according to the history file (by
+    default, ".dtest_history" in the current directory), are run,
+    along with the test fixtures they need; if no such tests are
+    recorded, all tests are run.  If ``failed_first`` is True, those
+    tests are started before any others.
+
+    If ``cache`` is given, it names a directory, which may be shared
+    with other machines, in which the tests which pass are recorded;
+    tests which passed before, and which depend on nothing that has
+    changed since, are not run again.  The ``cache_size`` argument
+    limits the size of the cache, in bytes.  See the dtest.cache
+    module.
+
+    If ``watch`` is True, the tests are not run just once; instead,
+    once they have run, the directory and the current directory are
+    watched for changes to Python source files.  Each time files
+    change, the modules loaded from them, and the modules using those
+    modules, are reloaded, and the tests they define are run again,
+    along with the test fixtures they need.  This continues until
+    interrupted.  See the dtest.watch module.
+
+    If ``names`` is given, only the tests with the listed names, or
+    belonging to the listed modules, packages, or classes, are run,
+    along with the test fixtures they need.  If ``tests`` is given, it
+    is the collection of tests to consider, as discovered by an
+    earlier call to explore(), and no tests are discovered.
+
+    If ``serve`` is given, the tests are not run; instead, this
+    process becomes a daemon listening on the Unix domain socket at
+    that path, and runs the discovered tests whenever a client asks,
+    under control of the command line arguments the client sends.
+    This continues until interrupted.  See the dtest.daemon module.
+
+    If ``index`` is given, it names a file in which the tests defined
+    by each test module are recorded.  Only the modules which changed
+    since they were recorded are imported to discover the tests; the
+    modules defining the tests selected are imported once the
+    selection has been made, and a dry run imports nothing more.  See
+    the dtest.index module.
+
+    If ``static`` is True, the test modules are parsed rather than
+    imported to discover the tests, and only the modules defining the
+    tests selected are imported; a dry run imports nothing at all.
+    The tests found by parsing are recorded in the index, if there is
+    one.  See the dtest.static module.
+
+    If ``import_times`` is given, the time taken to import each
+    module while discovering the tests, including the modules the
+    test modules import, is measured, and the ``import_times``
+    slowest modules are reported.  If ``import_times_path`` is given,
+    the times of all the modules are written to that file, as JSON.
+    See the dtest.importtime module.
+
+    If ``streaming`` is True, the tests of each test module are
+    started as soon as it and the test fixtures they need have been
+    discovered, while the other test modules are still being
+    imported; a test depending on a test not yet discovered is
+    deferred until it has been.  The tests cannot then be selected,
+    sharded, run in worker processes, or started in any order other
+    than the order in which they become ready.  See
+    DTestQueue.run().
     """
 
-    # First, allocate a queue
-    queue = DTestQueue(maxth, skip, output)
+    # Watching for changes only makes sense in this process
+    if watch and (listen is not None or worker is not None):
+        raise DTestException("Watch mode cannot be combined with remote "
+                             "workers.")
+
+    # Likewise, the daemon runs the tests itself, on request, and
+    # imports them all anyway
+    if serve is not None and (watch or listen is not None or
+                              worker is not None or index is not None or
+                              static):
+        raise DTestException("The daemon cannot be combined with watch "
+                             "mode, remote workers, the discovery index, "
+                             "or static discovery.")
+
+    # Streamed tests are started before the rest are discovered, so
+    # they can't be selected first, nor sent elsewhere
+    if streaming and (tests is not None or names or last_failed or
+                      changed_since is not None or shard is not None or
+                      index is not None or static or critical or
+                      max_scopes is not None or failed_first or processes or
+                      listen is not None or worker is not None or
+                      serve is not None):
+        raise DTestException("Streaming cannot be combined with test "
+                             "selection, sharding, the discovery index, "
+                             "static discovery, worker processes, the "
+                             "daemon, or scheduling options.")
+
+    # The history, the map of the lines each test executes, and the
+    # cache are loaded here, so that importing dtest stays cheap
+    from dtest import cache as tc
+    from dtest import history as hist
+    from dtest import impact as ti
+
+    # Load the test history, if we need it
+    if history is None and (critical or last_failed or failed_first):
+        history = hist.DEF_HISTORY
+    if history is not None:
+        history = hist.DTestHistory(history)
+
+    # Sharding needs the history too, but only records it if asked,
+    # so that every shard sees the same history
+    shard_history = history
+    if shard is not None and shard_history is None:
+        shard_history = hist.DTestHistory(hist.DEF_HISTORY)
+
+    # Likewise the map of the lines each test executes
+    if impact is not None:
+        impact = ti.DTestImpact(impact)
+    impact_map = impact
+    if changed_since is not None and impact_map is None:
+        impact_map = ti.DTestImpact(ti.DEF_IMPACT)
+
+    # Open the cache of passing tests
+    if cache is not None and worker is None:
+        cache = tc.DTestCache(cache, cache_size or tc.DEF_CACHE_SIZE)
+    else:
+        cache = None
+
+    # Select the scheduler
+    scheduler = None
+    if critical and max_scopes is not None:
+        raise DTestException("Critical path scheduling cannot be combined "
+                             "with a limit on fixture scopes")
+    elif critical:
+        scheduler = sched.CriticalPathScheduler(history)
+    elif max_scopes is not None:
+        scheduler = sched.AffinityScheduler(max_scopes)
+
+    # Start the tests which failed last time first?
+    if failed_first:
+        scheduler = sched.FailedFirstScheduler(history, scheduler)
+
+    # Is the thread limit adaptive?
+    if maxth == 'auto':
+        maxth = adaptive.AdaptiveLimit()
+
+    # Select the execution backend
+    if backend is None or backend == 'green':
+        backend = bk.GreenBackend()
+    elif backend == 'thread':
+        backend = bk.ThreadBackend(maxth if isinstance(maxth, int) else None)
+    else:
+        raise DTestException("Unknown backend %r" % backend)
+
+    # Are we waiting for remote workers?
+    pool = None
+    if listen is not None:
+        from dtest import process
+        pool = process.NodePool(listen, nodes, authkey)
+
+    # First, allocate a queue; watch mode needs a new one for every
+    # run
+    def new_queue():
+        return DTestQueue(maxth, skip, output, scheduler, history,
+                          processes, pool, backend, max_failures,
+                          hard_timeouts, impact, cache)
+    queue = new_queue()
+
+    # Are we timing the imports?
+    timer = None
+    if import_times or import_times_path is not None:
+        from dtest import importtime as imt
+        timer = imt.DTestImportTimer()
+
+    # Next, discover the tests of interest, unless we already have;
+    # the index or static discovery may let us get by with stand-ins
+    # for them, and streamed tests are discovered as they run
+    feed = None
+    if tests is not None:
+        queue.add_tests(tests)
+    elif index is not None or static:
+        from dtest import index as ix
+        _indexed(directory, queue, ignore, ix.DTestIndex(index), static,
+                 timer)
+    elif streaming and not dryrun:
+        feed = _streamed(directory, ignore, timer, output, import_times,
+                         import_times_path)
+    else:
+        explore(directory, queue, ignore, timer=timer)
+
+    # Are we a daemon?  Then we're done until interrupted
+    if serve is not None:
+        from dtest import daemon as td
+        _import_times(timer, output, import_times, import_times_path)
+        discovered = queue.tests
+        td.serve(serve, lambda args, stream: _request(discovered, args,
+                                                      stream), output)
+        return True
 
-    # Next, discover the tests of interest
-    explore(directory, queue)
+    # Are we only running the named tests?
+    if names and worker is None:
+        selected = [dt for dt in queue.tests if dt.istest() and
+                    _named(dt, names)]
+        output.info("Running %d of %d tests matching %s" %
+                    (len(selected),
+                     len([dt for dt in queue.tests if dt.istest()]),
+                     ', '.join(names)))
+        queue.select(selected)
+
+    # Are we only running the tests which failed last time?
+    if last_failed and worker is None:
+        total = len([dt for dt in queue.tests if dt.istest()])
+        selected = [dt for dt in queue.tests if history.failed(dt)]
+        if selected:
+            output.info("Running %d of %d tests which failed last time" %
+                        (len([dt for dt in selected if dt.istest()]),
+                         total))
+            queue.select(selected)
+        else:
+            output.info("No failed tests recorded; running all %d tests" %
+                        total)
+
+    # Are we only running the tests affected by recent changes?
+    if changed_since is not None and worker is None:
+        changed = ti.changes(changed_since)
+        selected = impact_map.affected(queue.tests, changed,
+                                       ti.imported_changes(changed_since,
+                                                           changed))
+        output.info("Running %d of %d tests affected by changes since %s" %
+                    (len(selected),
+                     len([dt for dt in queue.tests if dt.istest()]),
+                     changed_since))
+        queue.select(selected)
+
+    # Are we only running one shard of them?
+    if shard is not None and worker is None:
+        from dtest import shard as sh
+        shard_index, shard_count = shard
+        selected = sh.select(queue.tests, shard_index, shard_count,
+                             shard_history)
+        output.info("Running shard %d/%d: %d of %d tests" %
+                    (shard_index, shard_count, len([dt for dt in selected
+                                        if dt.istest()]),
+                     len([dt for dt in queue.tests if dt.istest()])))
+        queue.select(selected)
+
+    # Import the tests we're to run, if we only have stand-ins
+    if (index is not None or static) and tests is None and not dryrun:
+        queue = _materialize(queue, new_queue, directory, ignore, timer)
+
+    # Report the import times, if asked
+    if feed is None:
+        _import_times(timer, output, import_times, import_times_path)
+
+    # Are we a worker for somebody else?
+    if worker is not None:
+        from eventlet import monkey_patch
+        from dtest import process
+        monkey_patch()
+        watchdog = None
+        if hard_timeouts:
+            watchdog = wd.SignalWatchdog()
+            watchdog.start()
+            wd.use(watchdog)
+        try:
+            process.serve(worker, queue.tests, debug, authkey=authkey)
+        finally:
+            if watchdog is not None:
+                watchdog.stop()
+                wd.use(None)
+        return True
 
     # Is this a dry run?
     if not dryrun:
         # Nope, execute the tests
-        result = queue.run(debug=debug)
+        result = queue.run(debug=debug, feed=feed)
     else:
         result = True
 
@@ -1051,10 +1877,253 @@ def main(directory=None, maxth=None, skip=lambda dt: dt.skip,
         with open(dotpath, 'w') as f:
             print >>f, queue.dot()
 
+    # Should we keep running the tests as they change?
+    if watch and not dryrun:
+        rerun = _watch(directory, queue.output, new_queue, debug, cache,
+                       ignore)
+        if rerun is not None:
+            result = rerun
+
     # Now, let's return the result of the test run
     return result
 
 
+def _indexed(directory, queue, ignore, index, static=False, timer=None):
+    """
+    Helper for main() which discovers the tests under ``directory``
+    using the discovery ``index``.  The test modules which changed
+    since they were recorded are imported and recorded again, or, if
+    ``static`` is True, parsed and recorded again, and the index is
+    saved; stand-ins for all the tests are then added to the
+    ``queue``.  The imports are timed by the ``timer``, if given.
+    """
+
+    from dtest import static as ts
+    from dtest import watch as tw
+
+    directory = os.path.abspath(directory or os.getcwd())
+
+    # Find the test modules, and which of them need importing
+    modnames = [modname for path, modname in dc.modules(directory, ignore)]
+    stale = set(modname for modname in modnames
+                if index.stale(modname, static))
+
+    # Parse or import and record those
+    roots = tw.roots(directory)
+    if stale and static:
+        with ts.DTestStatic(directory, stale) as parsed:
+            for modname in stale:
+                index.record(modname, roots, modnames, True)
+        if parsed.caught:
+            queue.output.imports(parsed.caught)
+    elif stale:
+        explore(directory, DTestQueue(output=queue.output), ignore, stale,
+                timer)
+        for modname in stale:
+            index.record(modname, roots, modnames)
+    index.prune(modnames)
+    index.save()
+
+    queue.add_tests(index.tests(modnames, stale))
+
+
+def _materialize(queue, new_queue, directory, ignore, timer=None):
+    """
+    Helper for main() which replaces the stand-ins for tests in the
+    ``queue``, built from the discovery index, by the real tests,
+    importing only the modules defining them.  Returns a new queue,
+    from the ``new_queue`` function, holding the real tests.  The
+    imports are timed by the ``timer``, if given.
+    """
+
+    names = set(str(dt) for dt in queue.tests)
+    modnames = set(dt.test.__module__ for dt in queue.tests)
+
+    # Select the same tests; the fixtures they need follow, but not
+    # the dependencies of those fixtures
+    real = new_queue()
+    explore(directory, real, ignore, modnames, timer)
+    real.select([dt for dt in real.tests if dt.istest() and str(dt) in names])
+    return real
+
+
+def _streamed(directory, ignore, timer, output, count, path):
+    """
+    Helper for main() which generates the sets of tests discovered in
+    each test module under ``directory`` for a streaming test run;
+    see stream().  Once all have been discovered, any import errors
+    are reported to the ``output``, as are the import times measured
+    by the ``timer``, if any; see _import_times().
+    """
+
+    caught = []
+    for tests in stream(directory, ignore, timer=timer, caught=caught):
+        yield tests
+
+    # Output the import errors, if any
+    if caught:
+        output.imports(caught)
+
+    # Report the import times, if asked
+    _import_times(timer, output, count, path)
+
+
+def _import_times(timer, output, count, path):
+    """
+    Helper for main() which reports the import times measured by the
+    ``timer``, if any: the ``count`` slowest modules are reported to
+    the ``output``, if ``count`` is given, and all the times are
+    written to the file ``path``, if given.
+    """
+
+    if timer is None:
+        return
+
+    if count:
+        output.import_times(timer.report()[:count])
+    if path is not None:
+        timer.save(path)
+
+
+def _named(dt, names):
+    """
+    Determine whether the test ``dt`` is named by one of ``names``:
+    whether its name is one of them, or begins with one of them
+    followed by a period.
+    """
+
+    name = str(dt)
+    for prefix in names:
+        if name == prefix or name.startswith(prefix + '.'):
+            return True
+
+    return False
+
+
+# Options which only make sense when the daemon is started
+_DAEMON_ONLY = ('directory', 'ignore', 'index', 'listen', 'nodes', 'worker',
+                'authkey', 'watch', 'serve', 'static', 'import_times',
+                'import_times_path', 'streaming')
+
+
+def _request(tests, args, stream):
+    """
+    Helper for main() which handles a request made of a daemon: runs
+    the ``tests`` discovered by the daemon under control of the
+    command line arguments ``args``, writing the output to the
+    ``stream``.  Returns the result of the test run.
+    """
+
+    # Interpret the arguments just as the command line
+    op = optparser(usage="%prog [options] [name ...]")
+    (options, names) = op.parse_args(args)
+    kwargs = opts_to_args(options)
+
+    # Reject those only meaningful when starting up
+    for dest in _DAEMON_ONLY:
+        if dest in kwargs:
+            opt = [o for o in op.option_list if o.dest == dest][0]
+            raise DTestException("Option %s must be given when the daemon "
+                                 "is started" % opt.get_opt_string())
+
+    return main(output=DTestOutput(stream), names=names, tests=tests,
+                **kwargs)
+
+
+def _watch(directory, output, new_queue, debug=False, cache=None,
+           ignore=dc.DEF_IGNORE):
+    """
+    Helper for main() which implements watch mode.  Waits for changes
+    to Python source files, reloads the affected modules, and runs
+    the tests they define, along with the fixtures those tests need.
+    The ``new_queue`` argument is a function returning a new queue.
+    Returns the result of the last test run once interrupted, or None
+    if no tests were run.
+    """
+
+    from dtest import watch as tw
+
+    # Start watching
+    watched = tw.roots(directory)
+    watcher = tw.watcher(watched)
+    output.info("Watching %s for changes; interrupt to stop" %
+                ', '.join(os.path.relpath(root) for root in watched))
+
+    result = None
+    try:
+        while True:
+            changed = watcher.wait()
+
+            # Reload what changed; the cache must take note
+            loaded = set(sys.modules)
+            stale, caught = tw.refresh(changed, watched)
+            if caught:
+                output.imports(caught)
+            if cache is not None:
+                cache.reset()
+
+            # Discover the tests again, picking out those of the
+            # reloaded modules and of any new ones
+            queue = new_queue()
+            explore(directory, queue, ignore)
+            fresh = stale | (set(sys.modules) - loaded)
+            selected = [dt for dt in queue.tests if dt.istest() and
+                        getattr(dt.test, '__module__', None) in fresh]
+            if not selected:
+                output.info("No tests affected by changes to %s" %
+                            ', '.join(sorted(os.path.relpath(path)
+                                             for path in changed)))
+                continue
+
+            output.info("Running %d tests affected by changes to %s" %
+                        (len(selected),
+                         ', '.join(sorted(os.path.relpath(path)
+                                          for path in changed))))
+            queue.select(selected)
+            result = queue.run(debug=debug)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+    return result
+
+
+def _maxth_option(option, opt, value, parser):
+    """
+    Option callback for the "--max-threads" option, which accepts
+    either an integer or "auto".
+    """
+
+    from optparse import OptionValueError
+
+    if value != 'auto':
+        try:
+            value = int(value)
+        except ValueError:
+            raise OptionValueError("option %s: invalid thread limit: %r" %
+                                   (opt, value))
+
+    setattr(parser.values, option.dest, value)
+
+
+def _shard_option(option, opt, value, parser):
+    """
+    Option callback for the "--shard" option, which accepts a shard
+    specification of the form "INDEX/COUNT".
+    """
+
+    from optparse import OptionValueError
+    from dtest import shard as sh
+
+    try:
+        value = sh.parse(value)
+    except DTestException as exc:
+        raise OptionValueError("option %s: %s" % (opt, exc))
+
+    setattr(parser.values, option.dest, value)
+
+
 def optparser(*args, **kwargs):
     """
     Builds and returns an option parser with the default options
@@ -1062,6 +2131,11 @@ def optparser(*args, **kwargs):
     the OptionParser constructor.
     """
 
+    from optparse import OptionParser
+    from dtest import cache as tc
+    from dtest import history as hist
+    from dtest import impact as ti
+
     # Set up an OptionParser
     op = OptionParser(*args, **kwargs)
 
@@ -1069,11 +2143,53 @@ def optparser(*args, **kwargs):
     op.add_option("-d", "--directory",
                   action="store", type="string", dest="directory",
                   help="The directory to search for tests to run.")
+    op.add_option("--ignore",
+                  action="append", type="string", dest="ignore",
+                  help="Do not search files or directories matching the "
+                  "indicated glob pattern for tests; the pattern may match "
+                  "the name or the path relative to the test directory.  "
+                  "May be given more than once.  The patterns %s are "
+                  "always ignored." % ', '.join('"%s"' % pat for pat in
+                                                dc.DEF_IGNORE))
+    op.add_option("--index",
+                  action="store", type="string", dest="index",
+                  help="Record the tests defined by each test module in the "
+                  "indicated file, and import only the modules changed "
+                  "since to discover the tests.  The modules defining the "
+                  "tests selected are imported once the selection has been "
+                  "made; with \"-n\", nothing more is imported.")
+    op.add_option("--static",
+                  action="store_true", dest="static",
+                  help="Discover the tests by parsing the test modules "
+                  "instead of importing them.  Only the modules defining "
+                  "the tests selected are imported; with \"-n\", nothing "
+                  "is imported.  Tests which cannot be found without "
+                  "running the test modules are missed.")
+    op.add_option("--import-times",
+                  action="store", type="int", dest="import_times",
+                  help="Measure the time taken to import each module while "
+                  "discovering the tests, including the modules imported "
+                  "by the test modules, and report the indicated number of "
+                  "slowest modules.")
+    op.add_option("--import-times-json",
+                  action="store", type="string", dest="import_times_path",
+                  help="Measure the time taken to import each module while "
+                  "discovering the tests, and write the times to the "
+                  "indicated file as JSON.")
+    op.add_option("--stream",
+                  action="store_true", dest="streaming",
+                  help="Start running the tests of each test module as soon "
+                  "as it has been imported, while the other test modules "
+                  "are still being imported.  Cannot be combined with "
+                  "selecting tests or with scheduling options.")
     op.add_option("-m", "--max-threads",
-                  action="store", type="int", dest="maxth",
+                  action="callback", type="string", dest="maxth",
+                  callback=_maxth_option,
                   help="The maximum number of tests to run simultaneously; if "
                   "not specified, an unlimited number of tests may run "
-                  "simultaneously.")
+                  "simultaneously.  If \"auto\", the limit is adjusted "
+                  "while the tests run, up to %d, based on test durations, "
+                  "errors, and the load average." % adaptive.DEF_MAXIMUM)
     op.add_option("-s", "--skip",
                   action="store", type="string", dest="skip",
                   help="Specifies a rule to control which tests are skipped.  "
@@ -1100,6 +2216,158 @@ def optparser(*args, **kwargs):
                   "file may then be passed to the \"dot\" tool of the "
                   "GraphViz package to visualize the dependency graph.  "
                   "This option may be used in combination with \"-n\".")
+    op.add_option("--history",
+                  action="store", type="string", dest="history",
+                  help="Record the duration of each test, and which tests "
+                  "failed, in the indicated file, for use in scheduling "
+                  "future test runs.")
+    op.add_option("--critical-path",
+                  action="store_true", dest="critical",
+                  help="When the number of simultaneous tests is limited, "
+                  "start the tests on the longest remaining path through "
+                  "the dependency graph first.  Uses the durations "
+                  "recorded by earlier test runs; if \"--history\" is not "
+                  "given, \"%s\" is used." % hist.DEF_HISTORY)
+    op.add_option("--max-scopes",
+                  action="store", type="int", dest="max_scopes",
+                  help="Finish the tests using a test fixture before setting "
+                  "up other fixtures, and keep no more than the indicated "
+                  "number of fixtures (not counting enclosing fixtures) set "
+                  "up at the same time.  Cannot be combined with "
+                  "\"--critical-path\".")
+    op.add_option("-p", "--processes",
+                  action="store", type="int", dest="processes",
+                  help="Run the tests in the indicated number of worker "
+                  "processes, rather than in threads of a single process.  "
+                  "Test fixtures always run in the same process as the "
+                  "tests which depend on them.")
+    op.add_option("--listen",
+                  action="store", type="string", dest="listen",
+                  help="Run the tests in workers started with \"--worker\", "
+                  "possibly on other machines.  Listens for the workers on "
+                  "the indicated address, which may be \"host:port\" or the "
+                  "path of a Unix domain socket; the host defaults to "
+                  "127.0.0.1.  Workers are trusted to run code in this "
+                  "process, and must authenticate with the shared secret "
+                  "given by \"--authkey\", which is required for TCP.")
+    op.add_option("--nodes",
+                  action="store", type="int", dest="nodes",
+                  help="With \"--listen\", the number of workers to wait for "
+                  "before starting the tests; defaults to 1.")
+    op.add_option("--worker",
+                  action="store", type="string", dest="worker",
+                  help="Act as a worker for the test run listening on the "
+                  "indicated address.  The tests discovered must match those "
+                  "of the coordinator, which must authenticate with the "
+                  "shared secret given by \"--authkey\".")
+    op.add_option("--authkey",
+                  action="store", type="string", dest="authkey",
+                  help="With \"--listen\" or \"--worker\", the shared secret "
+                  "with which the coordinator and its workers authenticate "
+                  "each other before exchanging any messages.  Messages are "
+                  "pickled, so anyone knowing the secret can run code in "
+                  "the coordinator and the workers.  Defaults to the value "
+                  "of the DTEST_AUTHKEY environment variable, which keeps "
+                  "it out of the process list.")
+    op.add_option("-x", "--fail-fast",
+                  action="store_const", const=1, dest="max_failures",
+                  help="Stop the test run after the first failure.  Tests "
+                  "already running are allowed to finish, and test fixtures "
+                  "which were set up are torn down.  Equivalent to "
+                  "\"--max-failures 1\".")
+    op.add_option("--max-failures",
+                  action="store", type="int", dest="max_failures",
+                  help="Stop the test run after the indicated number of "
+                  "tests have failed.  Failing test fixtures are not "
+                  "counted.")
+    op.add_option("--hard-timeouts",
+                  action="store_true", dest="hard_timeouts",
+                  help="Interrupt tests exceeding their @timed() limits even "
+                  "if they never yield, as when spinning on the CPU; such "
+                  "tests end in the ERROR state.  Workers started with "
+                  "\"--worker\" need this option as well.")
+    op.add_option("--backend",
+                  action="store", type="choice", dest="backend",
+                  choices=sorted(bk.BACKENDS),
+                  help="Select the threads used to run the tests: \"green\" "
+                  "(the default) uses eventlet greenthreads, while "
+                  "\"thread\" uses native OS threads, which can run tests "
+                  "releasing the global interpreter lock simultaneously.  "
+                  "The \"thread\" backend requires the futures package on "
+                  "Python 2.")
+    op.add_option("--shard",
+                  action="callback", type="string", dest="shard",
+                  callback=_shard_option,
+                  help="Split the tests into COUNT shards and run only the "
+                  "shard numbered INDEX, counting from 1; the value has the "
+                  "form \"INDEX/COUNT\".  Tests sharing fixtures are kept "
+                  "in the same shard, and the shards are balanced using the "
+                  "durations recorded by earlier test runs; if \"--history\" "
+                  "is not given, \"%s\" is used, but not updated.  Every "
+                  "shard must use the same history." % hist.DEF_HISTORY)
+    op.add_option("--impact",
+                  action="store", type="string", dest="impact",
+                  help="Record the lines of code executed by each test in the "
+                  "indicated file, for use with \"--changed-since\".  Only "
+                  "files under the current directory are recorded.  Cannot "
+                  "be combined with worker processes.")
+    op.add_option("--changed-since",
+                  action="store", type="string", dest="changed_since",
+                  help="Run only the tests which executed lines changed in "
+                  "the working tree since the indicated git revision, as "
+                  "recorded by earlier test runs, along with the test "
+                  "fixtures they need; tests for which nothing has been "
+                  "recorded are always run.  Changes to lines which run when "
+                  "a module is imported, such as constants and decorators, "
+                  "select every test in that module and in the modules "
+                  "using it.  If \"--impact\" is not given, "
+                  "\"%s\" is used, but not updated." % ti.DEF_IMPACT)
+    op.add_option("--last-failed",
+                  action="store_true", dest="last_failed",
+                  help="Run only the tests which failed, errored out, or "
+                  "unexpectedly passed the last time they were run, along "
+                  "with the test fixtures they need; if there are none, "
+                  "all tests are run.  If \"--history\" is not given, "
+                  "\"%s\" is used." % hist.DEF_HISTORY)
+    op.add_option("--failed-first",
+                  action="store_true", dest="failed_first",
+                  help="Start the tests which failed the last time they were "
+                  "run, and the test fixtures they need, before any other "
+                  "tests.  If \"--history\" is not given, \"%s\" is used." %
+                  hist.DEF_HISTORY)
+    op.add_option("--cache",
+                  action="store", type="string", dest="cache",
+                  help="Record the tests which pass in the indicated "
+                  "directory, and don't run them again until their code, "
+                  "the code they use under the current directory, or the "
+                  "results of their dependencies change.  The directory "
+                  "may be shared by several machines.")
+    op.add_option("--cache-size",
+                  action="store", type="int", dest="cache_size",
+                  help="With \"--cache\", the maximum size of the cache, in "
+                  "megabytes; the least recently used entries are removed "
+                  "beyond it.  Defaults to %d." %
+                  (tc.DEF_CACHE_SIZE // (1024 * 1024)))
+    op.add_option("--watch",
+                  action="store_true", dest="watch",
+                  help="After running the tests, watch the test directory "
+                  "and the current directory for changes to Python source "
+                  "files.  When files change, reload the modules affected "
+                  "and run their tests again, along with the test fixtures "
+                  "they need, until interrupted.")
+    op.add_option("--serve",
+                  action="store", type="string", dest="serve",
+                  help="Discover the tests, then run them whenever asked by "
+                  "a client started with \"--connect\", until "
+                  "interrupted.  Listens for clients on the Unix domain "
+                  "socket at the indicated path.  The test modules are not "
+                  "reloaded; restart the daemon after changing them.")
+    op.add_option("--connect",
+                  action="store", type="string", dest="connect",
+                  help="Ask the daemon listening on the Unix domain socket "
+                  "at the indicated path to run the tests, passing along "
+                  "the other options and the names of the tests to run; "
+                  "the tests discovered by the daemon are used.")
 
     # Return the OptionParser
     return op
@@ -1142,9 +2410,97 @@ def opts_to_args(options):
     if options.dotpath is not None:
         args['dotpath'] = options.dotpath
 
-    # And, finally, directory
+    # Are we keeping a test history?
+    if options.history is not None:
+        args['history'] = options.history
+
+    # Should we schedule along the critical path?
+    if options.critical is True:
+        args['critical'] = True
+
+    # Should we limit the open fixture scopes?
+    if options.max_scopes is not None:
+        args['max_scopes'] = options.max_scopes
+
+    # How about worker processes?
+    if options.processes is not None:
+        args['processes'] = options.processes
+
+    # Are we distributing tests over the network?
+    if options.listen is not None:
+        args['listen'] = options.listen
+    if options.nodes is not None:
+        args['nodes'] = options.nodes
+    if options.worker is not None:
+        args['worker'] = options.worker
+    if options.authkey is not None:
+        args['authkey'] = options.authkey
+
+    # Should we stop after too many failures?
+    if options.max_failures is not None:
+        args['max_failures'] = options.max_failures
+
+    # Are we enforcing hard timeouts?
+    if options.hard_timeouts is True:
+        args['hard_timeouts'] = True
+
+    # Which backend are we using?
+    if options.backend is not None:
+        args['backend'] = options.backend
+
+    # Are we running a single shard?
+    if options.shard is not None:
+        args['shard'] = options.shard
+
+    # Are we recording or using the lines executed by the tests?
+    if options.impact is not None:
+        args['impact'] = options.impact
+    if options.changed_since is not None:
+        args['changed_since'] = options.changed_since
+
+    # Are we rerunning failed tests, or running them first?
+    if options.last_failed is True:
+        args['last_failed'] = True
+    if options.failed_first is True:
+        args['failed_first'] = True
+
+    # Are we caching passing tests?
+    if options.cache is not None:
+        args['cache'] = options.cache
+    if options.cache_size is not None:
+        args['cache_size'] = options.cache_size * 1024 * 1024
+
+    # Should we watch for changes?
+    if options.watch is True:
+        args['watch'] = True
+
+    # Are we a daemon?
+    if options.serve is not None:
+        args['serve'] = options.serve
+
+    # And, finally, directory, and what to ignore in it
     if options.directory is not None:
         args['directory'] = options.directory
+    if options.ignore:
+        args['ignore'] = dc.DEF_IGNORE + tuple(options.ignore)
+
+    # Are we keeping an index of the tests?
+    if options.index is not None:
+        args['index'] = options.index
+
+    # Are we to parse rather than import the test modules?
+    if options.static is True:
+        args['static'] = True
+
+    # Are we timing the imports?
+    if options.import_times is not None:
+        args['import_times'] = options.import_times
+    if options.import_times_path is not None:
+        args['import_times_path'] = options.import_times_path
+
+    # Are we running the tests as they're discovered?
+    if options.streaming is True:
+        args['streaming'] = True
 
     # Return the built arguments object
     return args
@@ -1152,10 +2508,20 @@ def opts_to_args(options):
 
 if __name__ == '__main__':
     # Obtain the options
-    opts = optparser(usage="%prog [options]")
+    opts = optparser(usage="%prog [options] [name ...]")
 
     # Process command-line arguments
     (options, args) = opts.parse_args()
 
+    # Should a daemon run the tests for us?
+    if options.connect is not None:
+        from dtest import daemon as td
+        try:
+            result = td.client(options.connect, sys.argv[1:])
+        except DTestException as exc:
+            print >>sys.stderr, str(exc)
+            result = False
+        sys.exit(not result)
+
     # Execute the test suite
-    sys.exit(not main(**opts_to_args(options)))
+    sys.exit(not main(names=args, **opts_to_args(options)))
@@ -0,0 +1,308 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+===============
+Coroutine Tests
+===============
+
+This module contains the support for tests and fixtures which are
+asyncio coroutines--on Python 2, coroutines decorated with the
+@trollius.coroutine decorator.  Rather than running each coroutine on
+an event loop of its own, all coroutines are run as tasks on a single
+event loop, shared by the whole test run, which runs in a native
+thread of its own.  The thread which called the coroutine test waits
+for the task to complete, then reports the result of the test as
+usual.
+
+The asyncio library is never imported by this module; a function can
+only be a coroutine function if the module defining it has already
+imported asyncio or trollius.
+
+Timeouts specified with the @timed() decorator are applied with
+wait_for(), which cancels a coroutine that runs too long; if the
+thread waiting for the coroutine is interrupted first, as by the
+timeout eventlet enforces, the task is cancelled as well.  Output
+written by a coroutine is captured along with the output of the
+thread waiting for it, even though the coroutine runs in the event
+loop's thread.
+"""
+
+import fcntl
+import os
+import sys
+
+from dtest import backend as bk
+from dtest import capture
+
+
+# The libraries which may provide coroutines
+LIBRARIES = ('asyncio', 'trollius')
+
+
+# The shared event loop and its library, once started
+_loop = None
+_lib = None
+_lock = bk.original('threading').Lock()
+
+
+def _library():
+    """
+    Retrieve the asyncio library in use, or None if no coroutine
+    library has been imported.
+    """
+
+    for name in LIBRARIES:
+        lib = sys.modules.get(name)
+        if lib is not None:
+            return lib
+
+    return None
+
+
+def _selectors():
+    """
+    Retrieve the selectors module used by the asyncio library.
+    """
+
+    selectors = getattr(_lib, 'selectors', None)
+    if selectors is None:
+        import selectors
+
+    return selectors
+
+
+def _green():
+    """
+    Determine whether eventlet has monkey-patched the os module, so
+    that reading from a non-blocking pipe lets other greenthreads run.
+    """
+
+    patcher = sys.modules.get('eventlet.patcher')
+    return patcher is not None and patcher.is_monkey_patched('os')
+
+
+def iscoroutinefunction(func):
+    """
+    Returns True if ``func`` is a coroutine function.
+    """
+
+    lib = _library()
+    return lib is not None and lib.iscoroutinefunction(func)
+
+
+def _run_loop():
+    """
+    Run the shared event loop.  Called in the event loop's thread.
+    """
+
+    _lib.set_event_loop(_loop)
+    _loop.run_forever()
+
+
+def get_loop():
+    """
+    Retrieve the shared event loop, starting it in a new native
+    thread if necessary.
+    """
+
+    global _loop
+    global _lib
+
+    with _lock:
+        if _loop is None:
+            # The default selector may have been chosen before
+            # eventlet monkey-patched the select module, so use one
+            # which works either way
+            _lib = _library()
+            _loop = _lib.SelectorEventLoop(_selectors().SelectSelector())
+
+            # The loop must run in a real thread, even if we've been
+            # monkey-patched
+            threading = bk.original('threading')
+            th = threading.Thread(target=_run_loop,
+                                  name='dtest-event-loop')
+            th.daemon = True
+            th.start()
+
+    return _loop
+
+
+def _steps(coro, caps):
+    """
+    Drive the coroutine ``coro``, installing the capture objects
+    ``caps`` while each of its steps runs.  This stands in for
+    context variables, which Python 2 lacks.
+    """
+
+    value = None
+    exc_info = None
+    while True:
+        saved = capture.swap(caps)
+        try:
+            if exc_info is not None:
+                item = coro.throw(*exc_info)
+            else:
+                item = coro.send(value)
+        finally:
+            capture.swap(saved)
+
+        try:
+            value = yield item
+            exc_info = None
+        except BaseException:
+            value = None
+            exc_info = sys.exc_info()
+
+
+class _Call(object):
+    """
+    _Call
+    =====
+
+    The _Call class represents a coroutine running as a task on the
+    event loop ``loop``, provided by the asyncio library ``lib``.  The
+    task is started by the event loop's thread; completion is
+    signaled by writing to a pipe, which the calling thread
+    reads--with eventlet's help, if the standard library has been
+    monkey-patched.
+    """
+
+    def __init__(self, coro, loop, lib, timeout=None):
+        """
+        Initialize a _Call object for the coroutine ``coro``, to be
+        run on ``loop``.  If ``timeout`` is given, the coroutine is
+        cancelled if it has not completed within that many seconds.
+        """
+
+        self.coro = coro
+        self.loop = loop
+        self.lib = lib
+        self.timeout = timeout
+        self.caps = capture.current()
+        self.result = None
+        self.exc_info = None
+        self.task = None
+        self._rfd, self._wfd = os.pipe()
+
+        # Without a non-blocking pipe, eventlet couldn't switch to
+        # other greenthreads, or time us out, while we wait
+        if _green():
+            flags = fcntl.fcntl(self._rfd, fcntl.F_GETFL)
+            fcntl.fcntl(self._rfd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def start(self):
+        """
+        Start the task.  Called in the event loop's thread.
+        """
+
+        try:
+            coro = _steps(self.coro, self.caps)
+            if self.timeout:
+                coro = self.lib.wait_for(coro, self.timeout, loop=self.loop)
+            self.task = self.lib.ensure_future(coro, loop=self.loop)
+            self.task.add_done_callback(self._done)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+            self._signal()
+
+    def cancel(self):
+        """
+        Cancel the task, which the calling thread has given up waiting
+        for.  Called in the event loop's thread, after start().
+        """
+
+        if self.task is not None:
+            self.task.cancel()
+
+    def _done(self, task):
+        """
+        Collect the result of the task.  Called in the event loop's
+        thread.
+        """
+
+        try:
+            self.result = task.result()
+        except self.lib.TimeoutError:
+            self.exc_info = (AssertionError,
+                             AssertionError("Timed out after %s seconds" %
+                                            self.timeout), None)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+
+        self._signal()
+
+    def _signal(self):
+        """
+        Wake up the calling thread.
+        """
+
+        try:
+            os.write(self._wfd, 'x')
+        except OSError:
+            # The calling thread gave up waiting
+            pass
+        os.close(self._wfd)
+
+    def wait(self):
+        """
+        Wait for the task to complete.  Returns the result of the
+        coroutine, or raises the exception it raised.  If the wait is
+        interrupted, as by a timeout, the task is cancelled.
+        """
+
+        try:
+            os.read(self._rfd, 1)
+        except BaseException:
+            # The coroutine must not go on running, using our capture
+            # objects, after we've moved on
+            self.loop.call_soon_threadsafe(self.cancel)
+            raise
+        finally:
+            os.close(self._rfd)
+
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+        return self.result
+
+
+def run(coro, timeout=None):
+    """
+    Run the coroutine ``coro`` as a task on the shared event loop,
+    waiting for it to complete.  If ``timeout`` is given, the
+    coroutine is cancelled and AssertionError is raised if it has
+    not completed within that many seconds.  Returns the result of
+    the coroutine.
+    """
+
+    loop = get_loop()
+    call = _Call(coro, loop, _lib, timeout)
+    loop.call_soon_threadsafe(call.start)
+    return call.wait()
+
+
+def wrap(func, timeout=None):
+    """
+    Wrap the coroutine function ``func`` in a function which runs it
+    on the shared event loop, with the given ``timeout``.
+    """
+
+    def wrapper(*args, **kwargs):
+        return run(func(*args, **kwargs), timeout)
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
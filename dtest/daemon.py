@@ -0,0 +1,219 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+===========
+Warm Daemon
+===========
+
+This module contains the support for a daemon which discovers the
+tests once and then runs them on request, so that repeated test runs
+need not import the test modules and build the dependency graph all
+over again.  The serve() function listens for requests on a Unix
+domain socket; the client() function sends a request to the daemon
+and relays the output of the test run.
+
+Each request is handled with a new DTestQueue, which prepares a fresh
+DTestResult for each test before running it, so the results of the
+previous run are all that need to be reset.  The test modules are
+never reloaded: changes to them are not seen until the daemon is
+restarted.  Requests are handled one at a time; clients connecting
+while a test run is in progress wait their turn.
+
+Protocol
+--------
+
+The client sends ``('run', args)``, where ``args`` is a list of
+command line arguments, as accepted by the dtest.core module.  The
+daemon responds with ``('output', text)`` for each piece of output
+from the test run, followed by ``('done', result)`` once the run has
+finished, where ``result`` is True if all the tests passed.  Messages
+are framed by the dtest.wire module, as for the dtest.process module.
+"""
+
+import os
+import socket
+import sys
+import threading
+import traceback
+
+from dtest.exceptions import DTestException
+from dtest import wire
+
+
+class _ClientStream(object):
+    """
+    _ClientStream
+    =============
+
+    The _ClientStream class is a stream-like object which relays the
+    output written to it to a daemon client.  Output is collected
+    until the stream is flushed.  If the client goes away, further
+    output is discarded, so that the test run can finish.
+    """
+
+    def __init__(self, sock):
+        """
+        Initialize a _ClientStream object, which will relay output
+        over the socket ``sock``.
+        """
+
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.buf = []
+
+    def write(self, data):
+        """
+        Write ``data`` to the stream.
+        """
+
+        with self.lock:
+            self.buf.append(data)
+
+    def flush(self):
+        """
+        Send the output written so far to the client.
+        """
+
+        with self.lock:
+            data = ''.join(self.buf)
+            self.buf = []
+            if data and self.sock is not None:
+                try:
+                    wire.send_msg(self.sock, ('output', data))
+                except socket.error:
+                    # The client has gone away
+                    self.sock = None
+
+
+def _handle(sock, handler):
+    """
+    Handle a request from the client connected on ``sock``, calling
+    ``handler`` to run the tests.  Standard output and standard error
+    are sent to the client while the request is handled.
+    """
+
+    msg = wire.recv_msg(sock)
+    if msg is None or msg[0] != 'run':
+        return
+
+    stream = _ClientStream(sock)
+    saves = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = stream
+    try:
+        result = handler(msg[1], stream)
+    except SystemExit as exc:
+        # From option parsing, including "--help"
+        result = not exc.code
+    except DTestException as exc:
+        print >>stream, str(exc)
+        result = False
+    except Exception:
+        # Report the problem, but keep the daemon going
+        traceback.print_exc(file=stream)
+        result = False
+    finally:
+        sys.stdout, sys.stderr = saves
+
+    # Let the client know we're done
+    stream.flush()
+    if stream.sock is not None:
+        try:
+            wire.send_msg(sock, ('done', bool(result)))
+        except socket.error:
+            pass
+
+
+def serve(address, handler, output=None):
+    """
+    Listen on the Unix domain socket ``address`` and handle requests
+    until interrupted.  For each request, ``handler`` is called with
+    the list of command line arguments from the client and a
+    stream-like object to which the output is to be written; it must
+    return the result of the test run.  A DTestException raised by
+    ``handler`` is reported to the client.  If ``output`` is given,
+    it is a DTestOutput object, used to announce that the daemon is
+    ready.
+    """
+
+    # Don't take over the socket of a daemon which is still running
+    if os.path.exists(address):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(address)
+        except socket.error:
+            os.unlink(address)
+        else:
+            raise DTestException("A daemon is already listening on %s" %
+                                 address)
+        finally:
+            sock.close()
+
+    # Set up the listening socket; only we may connect to it
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(077)
+    try:
+        listener.bind(address)
+    finally:
+        os.umask(umask)
+    listener.listen(5)
+
+    if output is not None:
+        output.info("Listening for test runs on %s; interrupt to stop" %
+                    address)
+
+    try:
+        while True:
+            sock, peer = listener.accept()
+            try:
+                _handle(sock, handler)
+            finally:
+                sock.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        if os.path.exists(address):
+            os.unlink(address)
+
+
+def client(address, args, output=sys.stdout):
+    """
+    Ask the daemon listening on the Unix domain socket ``address`` to
+    run the tests under control of the command line arguments
+    ``args``, writing the output to the stream ``output``.  Returns
+    the result of the test run.
+    """
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(address)
+        except socket.error as exc:
+            raise DTestException("Unable to connect to the daemon on %s: "
+                                 "%s" % (address, exc))
+
+        wire.send_msg(sock, ('run', list(args)))
+        while True:
+            msg = wire.recv_msg(sock)
+            if msg is None:
+                raise DTestException("The daemon on %s went away" % address)
+            elif msg[0] == 'output':
+                output.write(msg[1])
+                output.flush()
+            elif msg[0] == 'done':
+                return msg[1]
+    finally:
+        sock.close()
@@ -0,0 +1,363 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+==============
+Test Discovery
+==============
+
+This module contains the walk() function, which finds the packages
+under a directory for explore() to search for tests, and the
+modules() function, which uses it to find the test modules and
+packages explore() imports.  Each directory
+is listed exactly once, and the listing is used both to classify its
+entries as files and directories and to determine whether it is a
+package, by looking for its __init__ module; no other filesystem
+calls are made for the files.  Where available (os.scandir() on
+Python 3, or the ``scandir`` package on Python 2), directory entries
+are classified using the file types reported by the operating system,
+without calling stat(); otherwise, entries are examined with
+os.path.isdir(), except that entries whose names contain a period
+are taken to be files, since such a directory cannot be a package.
+
+Files and directories matching any of a list of glob patterns are
+ignored; a pattern may match either the name of the entry or its
+path relative to the directory being walked.  By default, hidden
+files and directories, byte-code caches, node_modules, and egg
+metadata are ignored, none of which normally hold test packages.
+Directories which may be packages, such as "build" and "dist", are
+only ignored if asked.
+
+The test modules are imported from the directory containing the
+packages walked with the help of a DTestImporter, which finds the
+modules in that directory for the thread importing the test modules
+only, so that tests already running in other threads see the import
+path unchanged.
+"""
+
+import fnmatch
+import imp
+import os
+import re
+import sys
+
+from greenlet import getcurrent
+
+from dtest import test
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+# Default patterns of files and directories to ignore
+DEF_IGNORE = ('.*', '__pycache__', 'node_modules', '*.egg-info')
+
+
+def suffixes():
+    """
+    Determine the suffixes of the files which may be imported as
+    modules, in order of preference.
+    """
+
+    return [sfx[0] for sfx in imp.get_suffixes()]
+
+
+# Compiled forms of the lists of patterns to ignore
+_ignore_res = {}
+
+
+def _ignore_re(ignore):
+    """
+    Compile the glob patterns in ``ignore`` into a single regular
+    expression.  Returns None if there are no patterns.
+    """
+
+    ignore = tuple(ignore)
+    try:
+        return _ignore_res[ignore]
+    except KeyError:
+        pass
+
+    regex = None
+    if ignore:
+        regex = re.compile('|'.join('(?:%s)' % fnmatch.translate(pat)
+                                    for pat in ignore))
+    _ignore_res[ignore] = regex
+    return regex
+
+
+def _ignored(regex, name, relpath):
+    """
+    Determine whether the entry ``name`` of the directory with the
+    path ``relpath``, relative to the directory being walked, matches
+    the compiled patterns ``regex``.
+    """
+
+    return regex is not None and (
+        regex.match(name) is not None or
+        regex.match(os.path.join(relpath, name)) is not None)
+
+
+def scan(path, relpath='', ignore=DEF_IGNORE):
+    """
+    List the directory ``path``, whose path relative to the directory
+    being walked is ``relpath``, leaving out entries matching the
+    glob patterns in ``ignore``.  Returns a tuple of a list of the
+    names of the files and a list of tuples of the names of the
+    subdirectories and whether they are symbolic links.  Without
+    scandir(), subdirectories whose names contain a period are
+    listed as files.
+    """
+
+    files = []
+    dirs = []
+    regex = _ignore_re(ignore)
+
+    # Prefer the file types from the directory listing
+    if scandir is not None:
+        for entry in scandir(path):
+            if _ignored(regex, entry.name, relpath):
+                continue
+            try:
+                if entry.is_dir():
+                    dirs.append((entry.name, entry.is_symlink()))
+                else:
+                    files.append(entry.name)
+            except OSError:
+                # Vanished while we were looking
+                pass
+
+        return files, dirs
+
+    # Fall back to examining the entries which could be packages
+    for name in os.listdir(path):
+        if _ignored(regex, name, relpath):
+            continue
+        fullpath = os.path.join(path, name)
+        if '.' not in name and os.path.isdir(fullpath):
+            dirs.append((name, os.path.islink(fullpath)))
+        else:
+            files.append(name)
+
+    return files, dirs
+
+
+def walk(top, ignore=DEF_IGNORE):
+    """
+    Walk the directory ``top`` and the packages beneath it, top-down,
+    listing each directory once.  Directories which are not packages
+    are not entered, and neither are symbolic links to packages,
+    although they are reported.  For ``top`` and each package,
+    generates a tuple of the path of the directory, a list of the
+    names of its files, and a list of the names of its subdirectories
+    which are packages.  As with os.walk(), the caller may remove
+    entries from the list of packages to avoid walking them.  Entries
+    matching the glob patterns in ``ignore`` are left out.
+    """
+
+    inits = set('__init__' + sfx for sfx in suffixes())
+
+    # Each stack entry holds the listing of a directory
+    try:
+        files, dirs = scan(top, '', ignore)
+    except OSError:
+        return
+    stack = [(top, '', files, dirs)]
+    while stack:
+        path, relpath, files, dirs = stack.pop()
+
+        # Determine which subdirectories are packages; their listings
+        # are kept for walking them
+        packages = []
+        listings = {}
+        for name, islink in dirs:
+            subrel = os.path.join(relpath, name)
+            try:
+                subfiles, subdirs = scan(os.path.join(path, name), subrel,
+                                         ignore)
+            except OSError:
+                # Unreadable; os.walk() would skip it, too
+                continue
+            if inits.intersection(subfiles):
+                packages.append(name)
+                listings[name] = (subrel, subfiles, subdirs, islink)
+
+        yield path, files, packages
+
+        # Walk the remaining packages, in order
+        for name in reversed(packages):
+            subrel, subfiles, subdirs, islink = listings[name]
+            if not islink:
+                stack.append((os.path.join(path, name), subrel, subfiles,
+                              subdirs))
+
+
+def base(directory):
+    """
+    Determine where the modules under ``directory`` are imported
+    from.  If ``directory`` is a package, its modules are imported
+    from the directory containing it.  Returns a tuple of the
+    directory to add to the import path and the name of the package,
+    or None if ``directory`` is not a package.
+    """
+
+    for sfx in suffixes():
+        if os.path.exists(os.path.join(directory, '__init__' + sfx)):
+            return os.path.split(directory)
+
+    return directory, None
+
+
+def modules(directory, ignore=DEF_IGNORE, failed=()):
+    """
+    Find the test modules and packages under ``directory``: those
+    whose names match the test regular expression.  The packages
+    under ``directory`` are walked, skipping entries matching the
+    glob patterns in ``ignore``; see walk().  Generates a tuple of the
+    path and the full module name of each, in the order they are to
+    be imported; if ``directory`` is itself a package, it comes first.
+    A package whose name has been added to ``failed`` by the time the
+    next module is requested is not walked; this is used to avoid
+    walking packages which cannot be imported.
+    """
+
+    sfxs = suffixes()
+    basedir, pkgname = base(directory)
+
+    # Start with the package itself
+    if pkgname is not None:
+        yield directory, pkgname
+        if pkgname in failed:
+            return
+
+    for root, files, packages in walk(directory, ignore):
+        # Let's determine the module's package path
+        if root == basedir:
+            pkgpath = ''
+        else:
+            subdir = root[len(basedir) + 1:]
+            pkgpath = '.'.join(subdir.split(os.sep)) + '.'
+
+        # Start with files...
+        for f in files:
+            # Does it match the testRE?
+            if not test.testRE.match(f):
+                continue
+
+            # Only interested in files we can load
+            for sfx in sfxs:
+                if f.endswith(sfx):
+                    yield os.path.join(root, f), pkgpath + f[:-len(sfx)]
+                    break
+
+        # Now we want to consider the subpackages
+        subdirs = []
+        for d in packages:
+            # Walk under those not matching the testRE...
+            if test.testRE.match(d):
+                # ...and those which match and can be imported
+                yield os.path.join(root, d), pkgpath + d
+                if pkgpath + d in failed:
+                    continue
+
+            subdirs.append(d)
+
+        # Make sure to set up our pruned subpackage list
+        packages[:] = subdirs
+
+
+class DTestImporter(object):
+    """
+    DTestImporter
+    =============
+
+    The DTestImporter class is an importer, as described by PEP 302,
+    which finds the top-level modules and packages in the directory
+    ``basedir``, as if it were at the front of the import path.
+    Between calls to its install() and remove() methods, it is
+    consulted by imports made in the thread which called install();
+    imports made in other threads are left to the import path.
+    """
+
+    def __init__(self, basedir):
+        """
+        Initialize a DTestImporter object for the directory
+        ``basedir``.
+        """
+
+        self.basedir = basedir
+
+        # The thread whose imports we handle
+        self._owner = None
+
+        # The modules found, awaiting loading
+        self._found = {}
+
+    def install(self):
+        """
+        Begin finding modules for the imports made by the current
+        thread.
+        """
+
+        self._owner = getcurrent()
+        sys.meta_path.insert(0, self)
+
+    def remove(self):
+        """
+        Stop finding modules.
+        """
+
+        sys.meta_path.remove(self)
+        self._owner = None
+        self._found = {}
+
+    def find_module(self, fullname, path=None):
+        """
+        Find the top-level module ``fullname`` in the base directory.
+        Returns the importer, if the module is found there and is
+        being imported by the thread which installed it; otherwise,
+        returns None.  Submodules are found through the paths of their
+        packages, as usual, and built-in modules are never found.
+        """
+
+        if (path is not None or getcurrent() is not self._owner or
+            fullname in sys.builtin_module_names):
+            return None
+
+        try:
+            self._found[fullname] = imp.find_module(fullname,
+                                                    [self.basedir])
+        except ImportError:
+            return None
+
+        return self
+
+    def load_module(self, fullname):
+        """
+        Load the module ``fullname`` found by find_module().  Returns
+        the module.
+        """
+
+        fobj, pathname, description = self._found.pop(fullname)
+        try:
+            return imp.load_module(fullname, fobj, pathname, description)
+        finally:
+            if fobj is not None:
+                fobj.close()
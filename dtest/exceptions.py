@@ -20,7 +20,8 @@ Test Framework Exceptions
 
 This module contains the DTestException class, which is an extension
 raised by the framework when an error is encountered while executing
-functions or methods of the framework itself.
+functions or methods of the framework itself, and the DTestTimeout
+class, which is raised in tests interrupted by a hard timeout.
 """
 
 
@@ -34,3 +35,28 @@ class DTestException(Exception):
     """
 
     pass
+
+
+class DTestTimeout(BaseException):
+    """
+    DTestTimeout
+    ============
+
+    The DTestTimeout exception is raised in a test which has exceeded
+    its @timed() limit by a hard timeout watchdog.  It is derived from
+    BaseException, so that a test catching Exception will not swallow
+    it.  If no message is given, the message is built from the
+    ``seconds`` class attribute.
+    """
+
+    seconds = None
+
+    def __init__(self, *args):
+        """
+        Initialize a DTestTimeout exception.
+        """
+
+        if not args and self.seconds is not None:
+            args = ("Timed out after %s seconds (hard timeout)" %
+                    self.seconds,)
+        super(DTestTimeout, self).__init__(*args)
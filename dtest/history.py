@@ -0,0 +1,144 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+============
+Test History
+============
+
+This module contains the DTestHistory class, which remembers
+information about tests from one test run to the next.  The duration
+of each test and test fixture is recorded; the durations are used by
+the scheduling code to decide which tests to start first.  The names
+of the tests and test fixtures which did not pass are recorded as
+well, so that they may be run again, or run first.  The history is
+stored as a JSON file, keyed by the fully qualified names of the
+tests.
+"""
+
+import json
+import os
+import tempfile
+
+from dtest.constants import *
+
+
+# Default history file
+DEF_HISTORY = '.dtest_history'
+
+# Test states which count as passing and as not passing
+_PASSED = frozenset([OK, XFAIL])
+_FAILED = frozenset([UOK, FAIL, ERROR, DEPFAIL])
+
+
+class DTestHistory(object):
+    """
+    DTestHistory
+    ============
+
+    The DTestHistory class keeps track of the durations of tests, and
+    of which tests failed, over multiple test runs.  The history is
+    loaded from ``path`` when the object is created, if the file
+    exists; the record() method updates the history from the results
+    of a test run, and the save() method writes it back out.  The
+    duration() method may be used to look up the most recently
+    recorded duration of a given test, and the failed() method to
+    determine whether the test failed the last time it ran.
+    """
+
+    def __init__(self, path=DEF_HISTORY):
+        """
+        Initialize a DTestHistory object, loading the history stored
+        in ``path`` (by default, the file ".dtest_history" in the
+        current directory).  A missing or unreadable history file
+        results in an empty history.
+        """
+
+        # Save the path
+        self.path = path
+
+        # Start out with an empty history
+        self.durations = {}
+        self.failures = set()
+
+        # Load the history, if there is one
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        self.durations = data.get('durations', {})
+        self.failures = set(data.get('failures', []))
+
+    def __len__(self):
+        """
+        Returns the number of tests for which history is available.
+        """
+
+        return len(self.durations)
+
+    def duration(self, dt):
+        """
+        Retrieve the most recently recorded duration, in seconds, of
+        the test ``dt``.  Returns None if no duration has been
+        recorded for the test.
+        """
+
+        return self.durations.get(str(dt))
+
+    def failed(self, dt):
+        """
+        Determine whether the test ``dt`` did not pass the last time
+        it was run: whether it failed, errored out, unexpectedly
+        passed, or could not run because a dependency failed.
+        """
+
+        return str(dt) in self.failures
+
+    def record(self, tests):
+        """
+        Update the history from the results of the most recent run of
+        the given ``tests``.  Tests which did not run leave their
+        recorded history untouched.
+        """
+
+        for dt in tests:
+            if dt.result is not None and dt.result.duration is not None:
+                self.durations[str(dt)] = dt.result.duration
+
+            # Remember whether the test passed
+            if dt.state in _FAILED:
+                self.failures.add(str(dt))
+            elif dt.state in _PASSED:
+                self.failures.discard(str(dt))
+
+    def save(self):
+        """
+        Write the history out to the file it was loaded from.  The
+        file is replaced atomically, so concurrent test runs sharing
+        a history file will not see a partially written history.
+        """
+
+        # Write to a temporary file in the same directory...
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpname = tempfile.mkstemp(prefix='.dtest_history', dir=dirname)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(durations=self.durations,
+                           failures=sorted(self.failures)),
+                      f, indent=1, sort_keys=True)
+
+        # ...then move it into place
+        os.rename(tmpname, self.path)
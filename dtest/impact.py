@@ -0,0 +1,451 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+====================
+Test Impact Analysis
+====================
+
+This module contains the DTestImpact class, which remembers which
+lines of which files each test and test fixture executed when it last
+ran, and the LineTracer class, which records that information while
+the tests run.  Together with the changes() function, which reads the
+lines changed since a given git revision, this allows selecting only
+the tests which may be affected by those changes.  The map is stored
+as a JSON file, keyed by the fully qualified names of the tests; only
+files under the current directory are recorded, by their paths
+relative to it.
+
+The tracer only records lines executed while a test runs, so the
+statements of a module which run when it is imported, such as its
+constants, class attributes, decorators, default argument values, and
+imports, are never recorded.  The imported_changes() function picks
+out the files in which such lines changed; every test defined in one
+of those modules, or in a module which uses one of them, directly or
+indirectly, is selected as well.
+"""
+
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+
+from dtest import cache
+from dtest.constants import *
+from dtest.exceptions import DTestException
+
+
+# Default impact map file
+DEF_IMPACT = '.dtest_impact'
+
+# Test states in which the test actually ran
+_RAN = frozenset([OK, UOK, FAIL, XFAIL, ERROR])
+
+# Matches the hunk headers of a unified diff
+_hunkRE = re.compile(r'^@@ -(\d+)(?:,(\d+))? ')
+
+
+class DTestImpact(object):
+    """
+    DTestImpact
+    ===========
+
+    The DTestImpact class keeps track of the lines executed by each
+    test.  The map is loaded from ``path`` when the object is created,
+    if the file exists; the record() method updates the map from the
+    lines collected by a LineTracer, and the save() method writes it
+    back out.  The affected() method selects the tests affected by a
+    set of changes, as returned by the changes() function.
+    """
+
+    def __init__(self, path=DEF_IMPACT):
+        """
+        Initialize a DTestImpact object, loading the map stored in
+        ``path`` (by default, the file ".dtest_impact" in the current
+        directory).  A missing or unreadable map file results in an
+        empty map.
+        """
+
+        # Save the path
+        self.path = path
+
+        # Start out with an empty map
+        self.lines = {}
+
+        # Load the map, if there is one
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        self.lines = data.get('lines', {})
+
+    def __len__(self):
+        """
+        Returns the number of tests for which the executed lines are
+        known.
+        """
+
+        return len(self.lines)
+
+    def record(self, tests, lines):
+        """
+        Update the map from the most recent run of the given
+        ``tests``, using the ``lines`` attribute of a LineTracer.
+        Tests which did not run, including those found in the cache
+        of passing tests, leave their recorded lines untouched.
+        """
+
+        for dt in tests:
+            if dt.state in _RAN and not dt.result.cached:
+                executed = lines.get(str(dt), {})
+                self.lines[str(dt)] = dict((fname, sorted(lnums))
+                                           for fname, lnums in
+                                           executed.items())
+
+    def save(self):
+        """
+        Write the map out to the file it was loaded from.  The file is
+        replaced atomically.
+        """
+
+        # Write to a temporary file in the same directory...
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpname = tempfile.mkstemp(prefix='.dtest_impact', dir=dirname)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(lines=self.lines), f, sort_keys=True)
+
+        # ...then move it into place
+        os.rename(tmpname, self.path)
+
+    def _hits(self, dt, changed, imported):
+        """
+        Determine whether the recorded lines of ``dt`` include any of
+        the ``changed`` lines, or any line of the ``imported`` files.
+        Tests for which nothing is recorded are assumed to be
+        affected.
+        """
+
+        executed = self.lines.get(str(dt))
+        if executed is None:
+            return True
+
+        for fname, lnums in executed.items():
+            if fname in imported:
+                return True
+            if fname not in changed:
+                continue
+            if changed[fname] is None or changed[fname] & set(lnums):
+                return True
+
+        return False
+
+    def affected(self, tests, changed, imported=()):
+        """
+        Select the tests from ``tests`` which may be affected by the
+        ``changed`` lines, a dictionary mapping file names to sets of
+        line numbers (or None, if the whole file changed).  A test is
+        affected if it executed a changed line, if nothing has been
+        recorded for it, or if it depends on a test fixture which
+        executed a changed line.  The optional ``imported`` argument
+        names the files whose import-time lines changed, as returned
+        by imported_changes(); tests defined in those modules or in
+        modules using them, and tests which executed any of their
+        lines, are affected too.  Returns a set of tests; fixtures
+        are not included.
+        """
+
+        tests = set(tests)
+        imported = set(imported)
+        users = _users(imported) if imported else set()
+        affected = set()
+        for dt in tests:
+            if (getattr(dt.test, '__module__', None) not in users and
+                not self._hits(dt, changed, imported)):
+                continue
+
+            # A changed fixture affects everything depending on it;
+            # for a tearDown() fixture, that means everything
+            # depending on its partner
+            pending = [dt]
+            if dt._partner is not None:
+                pending.append(dt._partner)
+            while pending:
+                dep = pending.pop()
+                if dep in affected:
+                    continue
+                affected.add(dep)
+                pending.extend(dep._revdeps)
+
+        return set(dt for dt in affected if dt in tests and dt.istest())
+
+
+class LineTracer(object):
+    """
+    LineTracer
+    ==========
+
+    The LineTracer class records the lines executed by each test,
+    using the Python trace hook.  The test running in the current
+    thread is identified by calling a function, which returns the
+    test or raises AttributeError.  Only files under the current
+    directory are traced.  The lines are collected in the ``lines``
+    attribute, a dictionary mapping test names to dictionaries
+    mapping file names to sets of line numbers.
+    """
+
+    def __init__(self, current):
+        """
+        Initialize a LineTracer.  The ``current`` function is called
+        to identify the test running in the current thread.
+        """
+
+        self.current = current
+        self.lines = {}
+        self.root = os.path.realpath(os.getcwd()) + os.sep
+        self._files = {}
+        self._active = False
+
+    def start(self):
+        """
+        Begin tracing the current thread and any threads started
+        afterwards.
+        """
+
+        self._active = True
+        threading.settrace(self._trace)
+        sys.settrace(self._trace)
+
+    def stop(self):
+        """
+        Stop tracing.
+        """
+
+        self._active = False
+        sys.settrace(None)
+        threading.settrace(None)
+
+    def _relpath(self, fname):
+        """
+        Determine the path of the file ``fname`` relative to the
+        current directory, or None if it lies outside of it.
+        """
+
+        try:
+            return self._files[fname]
+        except KeyError:
+            pass
+
+        path = os.path.realpath(fname)
+        rel = path[len(self.root):] if path.startswith(self.root) else None
+        self._files[fname] = rel
+        return rel
+
+    def _trace(self, frame, event, arg):
+        """
+        The global trace function.  Begins tracing the lines of each
+        function called by a test in a file of interest.
+        """
+
+        if not self._active or event != 'call':
+            return None
+
+        # Only interested in our own files...
+        fname = self._relpath(frame.f_code.co_filename)
+        if fname is None:
+            return None
+
+        # ...and only while a test is running
+        try:
+            dt = self.current()
+        except AttributeError:
+            return None
+        if dt is None:
+            return None
+
+        executed = self.lines.setdefault(str(dt), {}).setdefault(fname,
+                                                                 set())
+        executed.add(frame.f_lineno)
+
+        # Record the lines of this call
+        def trace_lines(frame, event, arg):
+            if event == 'line':
+                executed.add(frame.f_lineno)
+            return trace_lines
+
+        return trace_lines
+
+
+def _users(fnames):
+    """
+    Determine the names of the loaded modules whose source is one of
+    the files ``fnames``, given relative to the current directory,
+    along with the names of the modules under the current directory
+    which use them, directly or indirectly; see dtest.cache.uses().
+    Returns a set of module names.
+    """
+
+    # Find the modules under the current directory
+    root = os.path.realpath(os.getcwd()) + os.sep
+    local = {}
+    for modname, mod in sys.modules.items():
+        fname = getattr(mod, '__file__', None)
+        if fname is None:
+            continue
+        if fname.endswith(('.pyc', '.pyo')):
+            fname = fname[:-1]
+        path = os.path.realpath(fname)
+        if path.startswith(root):
+            local[modname] = (mod, path[len(root):])
+
+    # Invert the uses relation
+    used_by = {}
+    for modname, (mod, path) in local.items():
+        for other in cache.uses(mod):
+            used_by.setdefault(other, set()).add(modname)
+
+    # Collect the changed modules and everything using them
+    pending = [modname for modname, (mod, path) in local.items()
+               if path in fnames]
+    users = set()
+    while pending:
+        modname = pending.pop()
+        if modname in users:
+            continue
+        users.add(modname)
+        pending.extend(used_by.get(modname, ()))
+
+    return users
+
+
+def import_lines(source):
+    """
+    Determine the lines of the Python source ``source`` which run
+    when the module is imported: every statement outside the bodies
+    of functions, including the decorators and default argument
+    values of the functions themselves.  Returns a set of line
+    numbers, which is empty if the source cannot be parsed.
+    """
+
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, TypeError, ValueError):
+        return set()
+
+    lines = set()
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        lnum = getattr(node, 'lineno', None)
+        if lnum is not None:
+            lines.add(lnum)
+
+        if isinstance(node, (ast.FunctionDef, ast.Lambda)):
+            # Only the header of a function runs on import
+            pending.extend(getattr(node, 'decorator_list', []))
+            pending.extend(node.args.defaults)
+        else:
+            pending.extend(ast.iter_child_nodes(node))
+
+    return lines
+
+
+def imported_changes(rev, changed, directory=None):
+    """
+    Determine which of the Python files in ``changed``, as returned
+    by changes(), had lines changed which run when the module is
+    imported (see import_lines()).  The lines are looked up in the
+    version of each file at the git revision ``rev``, read from the
+    repository containing ``directory`` (by default, the current
+    directory).  Returns a set of file names.
+    """
+
+    imported = set()
+    for fname, lnums in changed.items():
+        # Nothing has run a new file yet
+        if lnums is None or not fname.endswith('.py'):
+            continue
+
+        try:
+            proc = subprocess.Popen(['git', 'show', '%s:./%s' % (rev, fname)],
+                                    cwd=directory, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            source, err = proc.communicate()
+        except OSError as exc:
+            raise DTestException("Unable to run git: %s" % exc)
+
+        # If we can't tell, assume the worst
+        if proc.returncode != 0 or lnums & import_lines(source):
+            imported.add(fname)
+
+    return imported
+
+
+def changes(rev, directory=None):
+    """
+    Determine the lines changed in the working tree since the git
+    revision ``rev``, for files under ``directory`` (by default, the
+    current directory).  Returns a dictionary mapping file names,
+    relative to that directory, to sets of line numbers in the
+    version of the file at ``rev``; the value is None for files which
+    are entirely new.
+    """
+
+    try:
+        proc = subprocess.Popen(['git', 'diff', '-U0', '--no-prefix',
+                                 '--no-renames', '--relative', rev, '--'],
+                                cwd=directory, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+    except OSError as exc:
+        raise DTestException("Unable to run git: %s" % exc)
+    if proc.returncode != 0:
+        raise DTestException("Unable to read changes since %r: %s" %
+                             (rev, err.strip()))
+
+    changed = {}
+    fname = None
+    for line in out.splitlines():
+        if line.startswith('--- '):
+            # The old name of the file; the lines we record are in
+            # the old version
+            fname = line[4:]
+            if fname == '/dev/null':
+                fname = None
+        elif line.startswith('+++ '):
+            # A new file; nothing could have executed it before
+            if fname is None:
+                changed[line[4:]] = None
+        elif fname is not None:
+            match = _hunkRE.match(line)
+            if match is None:
+                continue
+
+            # Lines were removed or replaced; if only added, mark the
+            # lines on either side of the insertion
+            start = int(match.group(1))
+            count = int(match.group(2) or 1)
+            lnums = changed.setdefault(fname, set())
+            if count:
+                lnums.update(range(start, start + count))
+            else:
+                lnums.update([start, start + 1])
+
+    return changed
@@ -0,0 +1,217 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+============
+Import Times
+============
+
+This module contains the DTestImportTimer class, which measures the
+time explore() spends importing test modules, including the time
+spent importing the modules they import in turn, and visiting them
+to find their tests.  While it is active, the built-in __import__()
+function is replaced by a wrapper which times each import that loads
+a new module; only the imports made by the thread which started the
+timer are timed, so that tests running while the test modules are
+discovered are not counted.  The time is charged to the module named
+in the import statement, or, if it was already loaded, to the first
+submodule named in a "from ... import" statement which was not; any
+other modules loaded along with it, such as its parent packages, are
+counted with it.
+
+For each module, the timer reports the cumulative time taken to
+import it, including the modules it imported, the time taken by the
+module itself, excluding those, and, for test modules, the time taken
+by visit_mod() to find its tests.  The report may be printed, sorted
+by the cumulative time, by DTestOutput.import_times(), or saved as a
+JSON file by the save() method.
+"""
+
+import __builtin__
+import json
+import sys
+import time
+
+from greenlet import getcurrent
+
+
+def _targets(name, globals, fromlist, level):
+    """
+    Determine the names of the modules an import of the module
+    ``name`` may load, in order of preference; the arguments are
+    those of __import__().  Python 2 tries an import relative to the
+    package of the importing module first, unless ``level`` is 0.
+    """
+
+    # Find the package of the importing module
+    package = None
+    if level != 0 and globals:
+        package = globals.get('__package__')
+        if not package and globals.get('__name__'):
+            package = globals['__name__']
+            if '__path__' not in globals:
+                package = package.rpartition('.')[0]
+
+    # Relative imports go up a level for each period after the first
+    bases = []
+    if package:
+        if level > 1:
+            package = '.'.join(package.split('.')[:1 - level])
+        bases.append('.'.join(part for part in (package, name) if part))
+    if level <= 0 and name:
+        bases.append(name)
+
+    # Submodules named in "from ... import" statements may be loaded
+    # along with the module
+    targets = list(bases)
+    for base in bases:
+        targets.extend('%s.%s' % (base, sub) for sub in fromlist or ()
+                       if sub != '*')
+    return targets
+
+
+class DTestImportTimer(object):
+    """
+    DTestImportTimer
+    ================
+
+    The DTestImportTimer class times the imports performed between
+    calls to its start() and stop() methods, which explore() makes;
+    it may be passed to several calls to explore() in turn.
+    explore() also reports the test modules it imports with the
+    test() method and the time taken to visit them with the visit()
+    method.  The report() method returns the times, sorted by the
+    cumulative time; the save() method writes them to a JSON file.
+    """
+
+    def __init__(self):
+        """
+        Initialize a DTestImportTimer object.
+        """
+
+        # The cumulative, self, and visit times of each module
+        self.times = {}
+
+        # The names of the test modules
+        self.tests = set()
+
+        # The time spent in the nested imports of each active import
+        self._nested = []
+
+        # The thread whose imports are timed
+        self._owner = None
+
+        # The real __import__()
+        self._import = None
+
+    def start(self):
+        """
+        Begin timing the imports made by the current thread.
+        """
+
+        self._owner = getcurrent()
+        self._import = __builtin__.__import__
+        __builtin__.__import__ = self._timed
+
+    def stop(self):
+        """
+        Stop timing imports.
+        """
+
+        # Other threads may still be in the wrapper, so it keeps the
+        # real __import__()
+        __builtin__.__import__ = self._import
+        self._owner = None
+
+    def _timed(self, name, globals=None, locals=None, fromlist=None,
+               level=-1):
+        """
+        Replacement for __import__(), which times the import of the
+        module ``name``.  The arguments are those of __import__().
+        Imports made by other threads are not timed.
+        """
+
+        if getcurrent() is not self._owner:
+            return self._import(name, globals, locals, fromlist, level)
+
+        # Which modules might this load that aren't loaded yet?
+        fresh = [modname for modname in _targets(name, globals, fromlist,
+                                                 level)
+                 if modname not in sys.modules]
+
+        self._nested.append(0.0)
+        start = time.time()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+            # Charge the first of them which was loaded
+            for modname in fresh:
+                if sys.modules.get(modname) is not None:
+                    times = self.times.setdefault(modname, [0.0, 0.0, 0.0])
+                    times[0] += elapsed
+                    times[1] += elapsed - nested
+                    break
+
+    def test(self, modname):
+        """
+        Note that the module ``modname`` is a test module.
+        """
+
+        self.tests.add(modname)
+
+    def visit(self, modname, elapsed):
+        """
+        Charge ``elapsed`` seconds spent visiting the test module
+        ``modname``.
+        """
+
+        self.times.setdefault(modname, [0.0, 0.0, 0.0])[2] += elapsed
+
+    def report(self):
+        """
+        Returns a list of dictionaries describing the modules
+        imported, sorted by decreasing cumulative time.  Each has the
+        keys "module", the module name; "cumulative", the time taken
+        to import it and the modules it imported; "self", the time
+        taken by the module itself; "visit", the time taken to visit
+        it; and "test", whether it is a test module.  Times are in
+        seconds; the cumulative time includes the time to visit it.
+        """
+
+        entries = [dict(module=modname, cumulative=cumul + visit,
+                        self=own, visit=visit,
+                        test=modname in self.tests)
+                   for modname, (cumul, own, visit) in self.times.items()]
+        entries.sort(key=lambda entry: (-entry['cumulative'],
+                                        entry['module']))
+        return entries
+
+    def save(self, path):
+        """
+        Write the report to the file ``path``, as a JSON object with
+        the key "modules", holding the list returned by report(), and
+        the key "total", holding the total time spent.
+        """
+
+        entries = self.report()
+        total = sum(entry['self'] + entry['visit'] for entry in entries)
+        with open(path, 'w') as f:
+            json.dump(dict(modules=entries, total=total), f, indent=2,
+                      sort_keys=True)
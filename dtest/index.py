@@ -0,0 +1,383 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+===============
+Discovery Index
+===============
+
+This module contains the DTestIndex class, which remembers the tests
+discovered in each test module, so that they need not be imported to
+find them again.  For each module, the index records the tests and
+test fixtures defined in it, their names, their types, the settings
+made by the @skip, @failing, @attr(), @timed(), and @repeat()
+decorators, their dependencies, the names of the classes defining
+them, and whether the modules defining them are packages.  It also
+records the modification time and size of the source of the module
+and of every module under the test directory or the current directory
+it uses, directly or indirectly; if any of them changes, the module
+must be imported and recorded again.
+
+The tests() method builds stand-ins for the recorded tests, which
+have the names, settings, and dependencies of the real tests but
+cannot be run.  They suffice to list the tests, draw the dependency
+graph, and select the tests to run; the modules defining the tests
+selected are then imported, and the real tests replace the
+stand-ins.  The index is stored as a JSON file.
+
+A module may also be recorded without importing it, from the stand-in
+built by parsing its source; see the dtest.static module.  Such a
+record is only used for static discovery; otherwise, the module is
+imported and recorded again.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import types
+
+from dtest import cache as tc
+from dtest.exceptions import DTestException
+from dtest import test
+from dtest import watch as tw
+
+
+# Default index file
+DEF_INDEX = '.dtest_index'
+
+# Version of the index format; bump to discard old indexes
+_INDEX_VERSION = 3
+
+# The classes of tests which may be recorded
+_KINDS = dict((cls.__name__, cls) for cls in
+              (test.DTest, test.DTestFixture, test.DTestFixtureSetUp,
+               test.DTestFixtureTearDown))
+
+# Attribute values which may be recorded as they are; others are
+# recorded as None, so that at least their presence is known
+_SIMPLE = (basestring, bool, int, long, float)
+
+
+def stub(name, modname, fname=None, lnum=None, package=None):
+    """
+    Build a function standing in for the test ``name`` defined in the
+    module ``modname``, and in the file ``fname`` at line ``lnum``, if
+    known.  If ``package`` is not None, it indicates whether the
+    module defining the test is a package, since the module may not
+    have been imported; see the dtest.shard module.  Running it raises
+    a DTestException.
+    """
+
+    def stub():
+        raise DTestException("%s has not been imported" % name)
+    stub.__name__ = name.rsplit('.', 1)[-1]
+    stub.__module__ = modname
+    if package is not None:
+        stub._dt_package = package
+
+    # Point the code at the real test, for the dependency graph
+    if fname is not None:
+        code = stub.func_code
+        stub.func_code = types.CodeType(
+            code.co_argcount, code.co_nlocals, code.co_stacksize,
+            code.co_flags, code.co_code, code.co_consts, code.co_names,
+            code.co_varnames, str(fname), code.co_name, lnum,
+            code.co_lnotab, code.co_freevars, code.co_cellvars)
+
+    return stub
+
+
+class DTestIndex(object):
+    """
+    DTestIndex
+    ==========
+
+    The DTestIndex class keeps track of the tests discovered in each
+    test module.  The index is loaded from ``path`` when the object
+    is created, if the file exists; if ``path`` is None, the index is
+    kept only in memory.  The stale() method determines whether a
+    module must be imported and recorded again, the record() method
+    records an imported module, and the save() method writes the
+    index back out.  The tests() method builds stand-ins for the
+    recorded tests.
+    """
+
+    def __init__(self, path=DEF_INDEX):
+        """
+        Initialize a DTestIndex object, loading the index stored in
+        ``path`` (by default, the file ".dtest_index" in the current
+        directory).  A missing or unreadable index file, or one from
+        another version of the framework, results in an empty index.
+        If ``path`` is None, the index starts out empty and is never
+        saved.
+        """
+
+        # Save the path
+        self.path = path
+
+        # Start out with an empty index
+        self.modules = {}
+        if path is None:
+            return
+
+        # Load the index, if there is one
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if data.get('version') == _INDEX_VERSION:
+            self.modules = data.get('modules', {})
+
+    def __len__(self):
+        """
+        Returns the number of modules recorded.
+        """
+
+        return len(self.modules)
+
+    def stale(self, modname, static=False):
+        """
+        Determine whether the module ``modname`` must be imported and
+        recorded again: whether it has not been recorded, or the
+        source of it or of any module it uses has changed since.  A
+        module recorded from its parsed source is stale unless
+        ``static`` is True.
+        """
+
+        rec = self.modules.get(modname)
+        if rec is None or (rec.get('static') and not static):
+            return True
+
+        for fname, (mtime, size) in rec['files'].items():
+            try:
+                st = os.stat(fname)
+            except OSError:
+                return True
+            if st.st_mtime != mtime or st.st_size != size:
+                return True
+
+        return False
+
+    def _files(self, mod, roots):
+        """
+        Determine the modification times and sizes of the sources of
+        the module ``mod`` and of the modules under ``roots`` it uses,
+        directly or indirectly.  Returns a dictionary mapping the
+        paths of the sources to lists of the modification time and
+        size, or None if the source of ``mod`` cannot be found.
+        """
+
+        prefixes = tuple(root + os.sep for root in roots)
+        files = {}
+        seen = set([mod.__name__])
+        pending = [mod]
+        while pending:
+            other = pending.pop()
+            fname = tw.source(other)
+            if fname is None or not fname.startswith(prefixes):
+                continue
+            try:
+                st = os.stat(fname)
+            except OSError:
+                continue
+            files[fname] = [st.st_mtime, st.st_size]
+
+            # Follow the modules it uses
+            for name in tc.uses(other):
+                if name not in seen and sys.modules.get(name) is not None:
+                    seen.add(name)
+                    pending.append(sys.modules[name])
+
+        if tw.source(mod) not in files:
+            return None
+        return files
+
+    @staticmethod
+    def _entry(dt):
+        """
+        Build the index entry for the test ``dt``.
+        """
+
+        attrs = dict((key, value if isinstance(value, _SIMPLE) or
+                      value is None else None)
+                     for key, value in dt._attrs.items())
+        code = getattr(dt.test, 'func_code', None)
+        mod = sys.modules.get(getattr(dt.test, '__module__', None))
+
+        return dict(name=str(dt), kind=dt.__class__.__name__,
+                    cls=(dt._class.__name__ if dt._class is not None
+                         else None),
+                    package=hasattr(mod, '__path__'),
+                    file=code.co_filename if code is not None else None,
+                    line=code.co_firstlineno if code is not None else None,
+                    skip=dt._skip, failing=dt._exp_fail, attrs=attrs,
+                    timeout=dt._timeout, repeat=dt._repeat,
+                    partner=(str(dt._partner) if dt._partner is not None
+                             else None),
+                    deps=sorted(str(dep) for dep in dt._deps),
+                    revdeps=sorted(str(dep) for dep in dt._revdeps))
+
+    def record(self, modname, roots, modnames=(), static=False):
+        """
+        Record the tests and test fixtures defined in the module
+        ``modname``, which must have been imported and visited; see
+        visit_mod().  The ``roots`` are the directories under which
+        the modules it uses are tracked.  The ``modnames`` are the
+        names of all the test modules and packages; the tests of
+        parent packages which are not among them are recorded with
+        the module.  If ``static`` is True, the module in sys.modules
+        is a stand-in built by parsing its source; see the
+        dtest.static module.  A module which could not be imported, or
+        whose source cannot be found, is forgotten, so that it is
+        imported again next time.
+        """
+
+        mod = sys.modules.get(modname)
+        visited = getattr(mod, '_dt_visited', None)
+        files = self._files(mod, roots) if visited is not None else None
+        if files is None:
+            self.modules.pop(modname, None)
+            return
+
+        # The tests of the parent packages are visited with it; leave
+        # out those recorded with the nearest test package
+        own = set(visited)
+        parts = modname.split('.')
+        for i in range(len(parts) - 1, 0, -1):
+            pkgname = '.'.join(parts[:i])
+            if pkgname in modnames:
+                own -= getattr(sys.modules.get(pkgname), '_dt_visited',
+                               set())
+                break
+
+        self.modules[modname] = dict(
+            files=files, static=static,
+            tests=[self._entry(dt) for dt in sorted(own, key=str)
+                   if dt.__class__.__name__ in _KINDS])
+
+    def prune(self, modnames):
+        """
+        Forget the modules not listed in ``modnames``.
+        """
+
+        modnames = set(modnames)
+        for modname in self.modules.keys():
+            if modname not in modnames:
+                del self.modules[modname]
+
+    def save(self):
+        """
+        Write the index out to the file it was loaded from.  The file
+        is replaced atomically.  An index kept only in memory is not
+        written.
+        """
+
+        if self.path is None:
+            return
+
+        # Write to a temporary file in the same directory...
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmpname = tempfile.mkstemp(prefix='.dtest_index', dir=dirname)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(version=_INDEX_VERSION, modules=self.modules),
+                      f, sort_keys=True)
+
+        # ...then move it into place
+        os.rename(tmpname, self.path)
+
+    def tests(self, modnames, recorded=()):
+        """
+        Build stand-ins for the tests and test fixtures recorded for
+        the modules named by ``modnames``.  The ``recorded`` argument
+        names the modules recorded most recently; a dependency between
+        a test of such a module and a test of another module is taken
+        from the former, since the latter may have been recorded
+        before the dependency changed.  The stand-ins report the name
+        of a module defining them as the ``__module__`` of their test
+        functions.  Returns a set of tests.
+        """
+
+        recorded = set(recorded)
+
+        # Determine which modules define each test; a test imported
+        # into other modules is best imported from its own
+        entries = {}
+        owners = {}
+        for modname in sorted(modnames):
+            rec = self.modules.get(modname)
+            if rec is None:
+                continue
+            for entry in rec['tests']:
+                name = entry['name']
+                if (name not in entries or
+                    name.startswith(modname + '.') and
+                    not name.startswith(entries[name][0] + '.')):
+                    entries[name] = (modname, entry)
+                owners.setdefault(name, set()).add(modname)
+
+        # Build the stand-ins, with stand-ins for their classes
+        stubs = {}
+        classes = {}
+        for name, (modname, entry) in entries.items():
+            name = str(name)
+            dt = _KINDS[entry['kind']](stub(name, str(modname),
+                                             entry['file'], entry['line'],
+                                             entry['package']))
+            dt._name = name
+            if entry['cls'] is not None:
+                key = (str(modname), str(entry['cls']))
+                if key not in classes:
+                    classes[key] = type(key[1], (object,),
+                                        dict(__module__=key[0]))
+                dt._class = classes[key]
+            dt._skip = entry['skip']
+            dt._exp_fail = entry['failing']
+            dt._attrs = dict((str(key), value)
+                             for key, value in entry['attrs'].items())
+            dt._timeout = entry['timeout']
+            dt._repeat = entry['repeat']
+            stubs[name] = dt
+
+        # Now link them up
+        for modname in modnames:
+            rec = self.modules.get(modname)
+            if rec is None:
+                continue
+            current = modname in recorded
+            for entry in rec['tests']:
+                name = entry['name']
+                if entry['partner'] in stubs:
+                    stubs[name]._partner = stubs[entry['partner']]
+
+                # Each dependency is a pair of the dependent test and
+                # the test it depends on
+                edges = ([(name, other) for other in entry['deps']] +
+                         [(other, name) for other in entry['revdeps']])
+                for dependent, dependency in edges:
+                    other = dependency if dependent == name else dependent
+                    if other not in stubs:
+                        # Since removed
+                        continue
+                    elif not current and owners[other] & recorded:
+                        # Recorded more recently elsewhere
+                        continue
+
+                    stubs[dependent]._deps.add(stubs[dependency])
+                    stubs[dependency]._revdeps.add(stubs[dependent])
+
+        return set(stubs.values())
@@ -0,0 +1,1154 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+====================================
+Multi-Process and Multi-Node Running
+====================================
+
+This module contains the WorkerPool classes, which allow DTestQueue
+to execute tests in a pool of workers rather than in greenthreads of
+a single interpreter, so that CPU-bound tests are not serialized by
+the global interpreter lock.  The ProcessPool class forks worker
+processes once all tests have been discovered, so each worker begins
+with all the test modules already imported.  The NodePool class
+instead listens on a TCP or Unix domain socket; workers, which may be
+on other machines, discover the tests themselves and connect using
+the serve() function.  Either way, each worker runs the tests it is
+handed using the ordinary DTestBase._run() method, in a greenthread
+of its own.
+
+All scheduling remains in the coordinating DTestQueue.  The state
+transitions of each test are relayed back to the coordinator as they
+happen and are replayed against the coordinator's copy of the test
+result, so the DTestOutput object sees exactly the notifications it
+would see if the tests were run in-process; when a test completes,
+its result and messages--including captured output and exception
+information--are relayed back as well.
+
+Test fixtures frequently set up in-process state used by the tests
+which depend on them.  For this reason, the setUpClass() fixture of a
+test class, its partner tearDownClass() fixture, and all the tests
+depending on the setUpClass() fixture are placed in the same group,
+and all tests in a group are run by the same worker.  The fixtures of
+modules and packages, on which most tests depend, are instead shared:
+once a setUp() fixture has run, it is replayed in each other worker
+before that worker runs anything depending on it, and its partner
+tearDown() fixture runs in one of the workers holding its state and
+is replayed in the others.
+
+Protocol
+--------
+
+The coordinator communicates with each worker over a socket.  Since
+messages are serialized with pickle, which can execute arbitrary code
+when unpickling, a coordinator and a worker connected over a
+listening socket authenticate each other before exchanging any
+messages, using a shared secret: each sends the other a random
+challenge, which must be answered with an HMAC of the challenge keyed
+by the secret, as with the authentication keys of the
+multiprocessing.connection module.  The secret is required when
+listening on TCP, where a host of 127.0.0.1 is used unless another is
+given; a Unix domain socket is only accessible to its owner, and may
+be used without one.  The secret may also be given in the
+DTEST_AUTHKEY environment variable.
+
+Each message is a tuple, serialized with pickle and prefixed with its
+length; see the dtest.wire module.  The worker begins by sending
+``('hello', host, pid)``.  The coordinator sends ``('run', name)`` to
+request that the test with the given name be run,
+``('replay', name)`` to request that a fixture be re-run silently,
+and ``('exit',)`` once all tests have completed.  The worker responds
+with ``('notify', name, state)`` for each state transition,
+``('status', name, message)`` for each status message,
+``('caught', exc)`` for internal exceptions, ``('unknown', name)`` if
+it has no test with the given name, and ``('result', name, result)``
+once the test has finished.  In response to ``('exit',)``, the worker
+releases any pooled resources and sends ``('resources', messages)``
+before exiting.
+"""
+
+import cPickle as pickle
+import hashlib
+import hmac
+import os
+import socket
+import sys
+import time
+import traceback
+
+import eventlet
+from eventlet import hubs, spawn_n
+from eventlet.event import Event
+from eventlet.semaphore import Semaphore
+
+from dtest import capture
+from dtest.constants import *
+from dtest.exceptions import DTestException
+from dtest import resource
+from dtest import result
+from dtest import test
+from dtest import wire
+from dtest.wire import send_msg, recv_msg
+
+
+# Default number of seconds a worker waits for the coordinator
+DEF_CONNECT_WAIT = 30
+
+# Number of seconds a peer has to complete authentication
+DEF_AUTH_WAIT = 10
+
+# Environment variable holding the shared secret
+AUTHKEY_ENV = 'DTEST_AUTHKEY'
+
+# Authentication messages; the challenge is followed by random bytes
+_CHALLENGE = 'dtest-challenge:'
+_CHALLENGE_LEN = 20
+_WELCOME = 'dtest-welcome'
+_FAILURE = 'dtest-failure'
+
+# Limit on the size of authentication messages
+_AUTH_MAX = 256
+
+def deliver_challenge(sock, authkey):
+    """
+    Challenge the peer on the socket ``sock`` to prove that it knows
+    the shared secret ``authkey``.  Raises DTestException if it does
+    not.
+    """
+
+    challenge = os.urandom(_CHALLENGE_LEN)
+    wire.send_raw(sock, _CHALLENGE + challenge)
+    response = wire.recv_raw(sock, _AUTH_MAX)
+    expected = hmac.new(authkey, challenge, hashlib.sha256).digest()
+    if response is None or not hmac.compare_digest(response, expected):
+        wire.send_raw(sock, _FAILURE)
+        raise DTestException("Peer failed to authenticate")
+    wire.send_raw(sock, _WELCOME)
+
+
+def answer_challenge(sock, authkey):
+    """
+    Answer the challenge sent by the peer on the socket ``sock``,
+    proving that we know the shared secret ``authkey``.  Raises
+    DTestException if the peer rejects the answer.
+    """
+
+    challenge = wire.recv_raw(sock, _AUTH_MAX)
+    if challenge is None or not challenge.startswith(_CHALLENGE):
+        raise DTestException("Invalid authentication challenge")
+    wire.send_raw(sock, hmac.new(authkey, challenge[len(_CHALLENGE):],
+                                 hashlib.sha256).digest())
+    if wire.recv_raw(sock, _AUTH_MAX) != _WELCOME:
+        raise DTestException("Peer rejected authentication")
+
+
+def get_authkey(address, authkey=None):
+    """
+    Determine the shared secret used to authenticate the peers
+    communicating over ``address``.  If ``authkey`` is None, the
+    secret is taken from the DTEST_AUTHKEY environment variable.  A
+    secret is required for TCP addresses; for Unix domain sockets, an
+    empty secret is returned if there is none.  Raises DTestException
+    if a secret is required but not given.
+    """
+
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV, '')
+
+    family, addr = parse_address(address)
+    if family != socket.AF_UNIX and not authkey:
+        raise DTestException("A shared secret is required to use a TCP "
+                             "address; set %s or use \"--authkey\"" %
+                             AUTHKEY_ENV)
+
+    return authkey
+
+
+class _RemoteCode(object):
+    """
+    _RemoteCode
+    ===========
+
+    The _RemoteCode class stands in for a code object in a traceback
+    relayed from another process.
+    """
+
+    def __init__(self, filename, name):
+        """
+        Initialize a _RemoteCode object.
+        """
+
+        self.co_filename = filename
+        self.co_name = name
+
+
+class _RemoteFrame(object):
+    """
+    _RemoteFrame
+    ============
+
+    The _RemoteFrame class stands in for a frame object in a traceback
+    relayed from another process.
+    """
+
+    def __init__(self, filename, name):
+        """
+        Initialize a _RemoteFrame object.
+        """
+
+        self.f_code = _RemoteCode(filename, name)
+        self.f_globals = {}
+
+
+class _RemoteTraceback(object):
+    """
+    _RemoteTraceback
+    ================
+
+    The _RemoteTraceback class stands in for a traceback object
+    relayed from another process.  It provides enough of the traceback
+    interface for the functions of the traceback module to format it.
+    """
+
+    def __init__(self, filename, lineno, name, tb_next):
+        """
+        Initialize a _RemoteTraceback object.
+        """
+
+        self.tb_frame = _RemoteFrame(filename, name)
+        self.tb_lineno = lineno
+        self.tb_next = tb_next
+
+
+def pack_exc(exc_type, exc_value, tb):
+    """
+    Convert the exception information ``exc_type``, ``exc_value``, and
+    ``tb`` into a form which may be pickled.  Exceptions which cannot
+    be pickled are converted into a description of the exception.
+    """
+
+    # Tracebacks can't be pickled; extract the stack entries
+    entries = traceback.extract_tb(tb) if tb is not None else None
+
+    # Try pickling the exception, making sure it can be unpickled, too
+    try:
+        data = pickle.dumps((exc_type, exc_value), pickle.HIGHEST_PROTOCOL)
+        pickle.loads(data)
+        return ('pickle', data, entries)
+    except Exception:
+        pass
+
+    # OK, describe it instead
+    return ('describe', (getattr(exc_type, '__module__', None),
+                         getattr(exc_type, '__name__', str(exc_type)),
+                         str(exc_value)), entries)
+
+
+def unpack_exc(packed):
+    """
+    Convert exception information packed by pack_exc() back into an
+    exception type, exception value, and traceback object.  The
+    traceback object will be a stand-in, suitable for passing to the
+    functions of the traceback module.
+    """
+
+    kind, data, entries = packed
+
+    # Recover the exception
+    if kind == 'pickle':
+        exc_type, exc_value = pickle.loads(data)
+    else:
+        # Make up an exception class with the same name
+        modname, name, value = data
+        exc_type = type(name, (Exception,), dict(__module__=modname))
+        exc_value = exc_type(value)
+
+    # Rebuild the traceback, innermost entry first
+    tb = None
+    if entries is not None:
+        for filename, lineno, name, line in reversed(entries):
+            tb = _RemoteTraceback(filename, lineno, name, tb)
+
+    return exc_type, exc_value, tb
+
+
+def _pack_msg(msg):
+    """
+    Convert the DTestMessage ``msg`` into a form which may be pickled.
+    """
+
+    exc = None
+    if msg.exc_type is not None:
+        exc = pack_exc(msg.exc_type, msg.exc_value, msg.exc_tb)
+
+    return (msg.captured, exc)
+
+
+def _unpack_msg(packed):
+    """
+    Convert a message packed by _pack_msg() back into a list of
+    captured output and a tuple of exception information.
+    """
+
+    captured, exc = packed
+    if exc is None:
+        return captured, (None, None, None)
+
+    return captured, unpack_exc(exc)
+
+
+def pack_result(res):
+    """
+    Convert the result information and messages of the DTestResult
+    ``res`` into a form which may be pickled.  The state is not
+    included, since state transitions are relayed separately.
+    """
+
+    # Pack up the messages
+    msgs = {}
+    for ctx, msg in res._msgs.items():
+        if res.multi and ctx == TEST:
+            msgs[ctx] = [(m.id, _pack_msg(m)) for m in msg]
+        else:
+            msgs[ctx] = _pack_msg(msg)
+
+    # Multi-results also need their counts
+    counts = None
+    if res.multi:
+        counts = (res._success_cnt, res._failure_cnt, res._error_cnt,
+                  res._total_cnt)
+
+    return (res._result, res._error, msgs, counts)
+
+
+def unpack_result(res, packed):
+    """
+    Update the DTestResult ``res`` with result information and
+    messages packed by pack_result().
+    """
+
+    res._result, res._error, msgs, counts = packed
+
+    # Rebuild the messages
+    for ctx, msg in msgs.items():
+        if res.multi and ctx == TEST:
+            for id, m in msg:
+                captured, exc = _unpack_msg(m)
+                res._msgseq[id] = result.DTestMessageMulti(ctx, id,
+                                                           captured, *exc)
+            res._msgs[ctx] = res._msgseq
+        else:
+            captured, exc = _unpack_msg(msg)
+            res._msgs[ctx] = result.DTestMessage(ctx, captured, *exc)
+
+    # Restore the counts
+    if counts is not None:
+        (res._success_cnt, res._failure_cnt, res._error_cnt,
+         res._total_cnt) = counts
+
+
+def _shared(dt):
+    """
+    Determine whether ``dt`` is a fixture defined in a module or
+    package rather than in a test class, whose state is set up in
+    every worker needing it.
+    """
+
+    return not dt.istest() and dt._class is None
+
+
+def fixture_groups(tests):
+    """
+    Determine which of the tests in ``tests`` must be run in the same
+    process.  A setUpClass() fixture is grouped with its partner
+    tearDownClass() fixture and with all the tests and fixtures which
+    depend on it.  Module and package fixtures are shared, and are
+    not placed in any group.  Returns a dictionary mapping each
+    grouped test to a key identifying its group; tests which are not
+    in a group are omitted.
+    """
+
+    tests = frozenset(tests)
+    parent = {}
+
+    # Find the representative of a group, compressing paths as we go
+    def find(dt):
+        parent.setdefault(dt, dt)
+        while parent[dt] is not dt:
+            parent[dt] = parent[parent[dt]]
+            dt = parent[dt]
+        return dt
+
+    # Merge two groups
+    def union(dt1, dt2):
+        root1, root2 = find(dt1), find(dt2)
+        if root1 is not root2:
+            parent[root2] = root1
+
+    for dt in tests:
+        # Group tests with the class setUp() fixtures they depend
+        # on...
+        for dep in dt._deps:
+            if (dep in tests and isinstance(dep, test.DTestFixtureSetUp)
+                and not _shared(dep)):
+                union(dep, dt)
+
+        # ...and class tearDown() fixtures with their partners
+        if (dt._partner is not None and dt._partner in tests and
+            not _shared(dt)):
+            union(dt._partner, dt)
+
+    return dict((dt, find(dt)) for dt in parent)
+
+
+class _WorkerOutput(object):
+    """
+    _WorkerOutput
+    =============
+
+    The _WorkerOutput class is used within a worker in place of a
+    DTestOutput object.  State transitions and status messages are
+    relayed to the coordinator, which passes them on to the real
+    DTestOutput object.  If ``sock`` is None, all messages are
+    discarded; this is used when replaying test fixtures.
+    """
+
+    def __init__(self, sock):
+        """
+        Initialize a _WorkerOutput object, which will relay messages
+        over the socket ``sock``.
+        """
+
+        self.sock = sock
+        self.lock = Semaphore()
+
+    def send(self, msg):
+        """
+        Send ``msg`` to the coordinator.  Messages from different
+        threads will not be interleaved.
+        """
+
+        if self.sock is None:
+            return
+
+        with self.lock:
+            send_msg(self.sock, msg)
+
+    def notify(self, test, state):
+        """
+        Relay a state transition of ``test`` to the coordinator.
+        """
+
+        self.send(('notify', str(test), state))
+
+    def status(self, dt, message):
+        """
+        Relay a status message from ``dt`` to the coordinator.
+        """
+
+        self.send(('status', str(dt), message))
+
+    def info(self, message):
+        """
+        Relay an informational message to the coordinator.
+        """
+
+        self.send(('info', message))
+
+
+def _worker(sock, tests, debug):
+    """
+    Main loop of a worker.  Runs the tests named in messages received
+    from the coordinator over ``sock``; ``tests`` is the collection of
+    all tests which may be run.  If ``debug`` is False, output is
+    captured.
+    """
+
+    # Avoid a circular import
+    from dtest.core import status
+
+    # Build an index of the tests
+    index = dict((str(dt), dt) for dt in tests)
+
+    output = _WorkerOutput(sock)
+    quiet = _WorkerOutput(None)
+    res_mgr = resource.ResourceManager()
+
+    # Introduce ourself
+    output.send(('hello', socket.gethostname(), os.getpid()))
+
+    # Install the capture proxies...
+    if not debug:
+        capture.install()
+
+    # Helper to run a single test
+    def run_test(dt):
+        # Set up the status stream for this thread
+        status.setup(output, dt)
+
+        # Execute the test
+        try:
+            dt._run(output, res_mgr)
+        except:
+            # Tell the coordinator about the exception
+            output.send(('caught', pack_exc(*sys.exc_info())))
+
+            # Manually transition the test to the ERROR state
+            dt._result._transition(ERROR, output=output)
+
+        # Send back the result
+        output.send(('result', str(dt), pack_result(dt._result)))
+
+    # Process requests until we're told to exit
+    while True:
+        msg = recv_msg(sock)
+        if msg is None or msg[0] == 'exit':
+            break
+
+        # Make sure we know the test
+        dt = index.get(msg[1])
+        if dt is None:
+            output.send(('unknown', msg[1]))
+            continue
+        dt._prepare()
+
+        if msg[0] == 'replay':
+            # Re-run a fixture which ran on a worker that has since
+            # died; must finish before any following test starts
+            status.setup(quiet, dt)
+            try:
+                dt._run(quiet, res_mgr)
+            except:
+                pass
+        else:
+            # Run the test in a thread of its own
+            spawn_n(run_test, dt)
+
+    # Uninstall the capture proxies
+    if not debug:
+        capture.uninstall()
+
+    # Clean up all left-over resources and report any errors
+    res_mgr.release_all()
+    msgs = [(res.__class__.__name__, res.key[1:], pack_exc(*exc_info))
+            for res, exc_info in res_mgr.messages]
+    output.send(('resources', msgs))
+
+
+def serve(address, tests, debug=False, wait=DEF_CONNECT_WAIT,
+          authkey=None):
+    """
+    Connect to the coordinator listening on ``address`` and run the
+    tests it requests.  The ``tests`` are the tests discovered by this
+    worker; they must have the same names as the tests discovered by
+    the coordinator.  If ``debug`` is False, output is captured.  If
+    the coordinator is not yet listening, connecting is retried for up
+    to ``wait`` seconds.  The worker and the coordinator authenticate
+    each other using the shared secret ``authkey``; see get_authkey().
+    Returns once the coordinator has finished with the worker.
+    """
+
+    # Connect to the coordinator, giving it time to start up
+    authkey = get_authkey(address, authkey)
+    family, addr = parse_address(address)
+    deadline = time.time() + wait
+    while True:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(addr)
+            break
+        except socket.error:
+            sock.close()
+            if time.time() >= deadline:
+                raise
+        eventlet.sleep(0.1)
+
+    try:
+        # Make sure we're talking to the coordinator, and prove that
+        # we may run its tests
+        sock.settimeout(DEF_AUTH_WAIT)
+        answer_challenge(sock, authkey)
+        deliver_challenge(sock, authkey)
+        sock.settimeout(None)
+
+        _worker(sock, tests, debug)
+    finally:
+        sock.close()
+
+
+def parse_address(address):
+    """
+    Parse ``address``, which may be either "host:port" or the path of
+    a Unix domain socket.  If the host is omitted, 127.0.0.1 is used.
+    Returns a tuple of the socket family and the address in the form
+    expected by the socket module.
+    """
+
+    # Anything containing a path separator or lacking a port is a
+    # Unix domain socket
+    if os.sep in address or ':' not in address:
+        return socket.AF_UNIX, address
+
+    host, port = address.rsplit(':', 1)
+    try:
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    except ValueError:
+        raise DTestException("Invalid port in address %r" % address)
+
+
+def _remote_resource(clsname, args):
+    """
+    Build a stand-in for a resource which reported an error while
+    being released in a worker.  The stand-in has a class with the
+    name ``clsname`` and a key built from ``args``, which is all
+    DTestOutput.resources() requires.
+    """
+
+    cls = type(clsname, (object,), {})
+    res = cls()
+    res.key = (cls,) + tuple(args)
+    return res
+
+
+class _WorkerProxy(object):
+    """
+    _WorkerProxy
+    ============
+
+    The _WorkerProxy class represents a worker within the coordinator.
+    It keeps track of the socket used to communicate with the worker
+    and the tests the worker is currently running.
+    """
+
+    def __init__(self, sock, pid=None):
+        """
+        Initialize a _WorkerProxy object for a worker communicating
+        over ``sock``.  If the worker is a child process, ``pid`` is
+        its process ID.
+        """
+
+        self.sock = sock
+        self.pid = pid
+        self.name = None
+        self.running = {}
+        self.alive = True
+        self.done = Event()
+        self.lock = Semaphore()
+
+    def __str__(self):
+        """
+        Return a description of the worker.
+        """
+
+        return self.name or 'worker %s' % self.pid
+
+    def send(self, *msgs):
+        """
+        Send ``msgs`` to the worker, in order.  Messages from
+        different threads will not be interleaved.  Returns False if
+        the worker has gone away.
+        """
+
+        try:
+            with self.lock:
+                for msg in msgs:
+                    send_msg(self.sock, msg)
+        except socket.error:
+            return False
+
+        return True
+
+
+class WorkerPool(object):
+    """
+    WorkerPool
+    ==========
+
+    The WorkerPool class manages a pool of workers on behalf of a
+    DTestQueue, which acts as the coordinator.  The start() method
+    prepares the pool; the run() method runs a test in one of the
+    workers, waiting for the test to complete; and the stop() method
+    shuts down the workers.  Subclasses must implement the _start()
+    method to create the workers, calling _add_worker() for each.
+
+    Before a worker runs a test, the shared module and package setUp()
+    fixtures the test needs are replayed on it, unless it already
+    holds their state or they have been torn down.
+
+    If a worker dies, the tests it was running are reassigned to
+    another worker.  Any setUp() fixtures of their fixture groups
+    which had completed on the dead worker are first replayed on the
+    new worker, so the fixture state is recreated there.  A test is
+    only reassigned once; if it is lost a second time, or if no
+    workers remain, it transitions to the ERROR state.
+    """
+
+    def __init__(self):
+        """
+        Initialize a WorkerPool object.
+        """
+
+        self.workers = []
+        self.index = {}
+        self.groups = {}
+        self.pinned = {}
+        self.hosts = {}
+        self.completed = {}
+        self.holders = {}
+        self.torn = set()
+        self.needs = {}
+        self.queue = None
+
+        # Accumulated resource errors from the workers
+        self.messages = []
+
+    def start(self, queue, tests, debug=False):
+        """
+        Start the workers.  The ``queue`` is the DTestQueue on whose
+        behalf tests will be run, and ``tests`` is the collection of
+        tests which may be run.  If ``debug`` is False, output is
+        captured within the workers.
+        """
+
+        self.queue = queue
+        self.index = dict((str(dt), dt) for dt in tests)
+        self.groups = fixture_groups(tests)
+        self.pinned = {}
+        self.hosts = {}
+        self.completed = {}
+        self.holders = {}
+        self.torn = set()
+        self.needs = {}
+        self.messages = []
+
+        self._start(tests, debug)
+
+    def _start(self, tests, debug):
+        """
+        Create the workers.  Must be implemented by subclasses.
+        """
+
+        raise DTestException("%s.%s._start() unimplemented" %
+                             (self.__class__.__module__,
+                              self.__class__.__name__))
+
+    def _add_worker(self, sock, pid=None):
+        """
+        Add a worker communicating over ``sock`` to the pool.  If the
+        worker is a child process, ``pid`` is its process ID.
+        """
+
+        worker = _WorkerProxy(sock, pid)
+        self.workers.append(worker)
+        spawn_n(self._reader, worker)
+
+    def _choose(self, dt):
+        """
+        Select the worker which will run ``dt``.  Tests in a fixture
+        group always go to the same worker; other tests go to the
+        worker running the fewest tests.  Returns None if there are no
+        live workers.
+        """
+
+        # A shared tearDown() fixture goes to a worker holding the
+        # state of its partner
+        if _shared(dt) and dt._partner is not None:
+            holders = [w for w in self.holders.get(dt._partner, ())
+                       if w.alive]
+            if holders:
+                return min(holders, key=lambda w: len(w.running))
+
+        # Is the test pinned to a worker?
+        group = self.groups.get(dt)
+        worker = self.pinned.get(group)
+        if worker is not None and worker.alive:
+            return worker
+
+        # Pick the least-loaded live worker
+        live = [w for w in self.workers if w.alive]
+        if not live:
+            return None
+        worker = min(live, key=lambda w: len(w.running))
+
+        # Pin the group to this worker
+        if group is not None:
+            self.pinned[group] = worker
+
+        return worker
+
+    def _needs(self, dt):
+        """
+        Determine the shared setUp() fixtures which must have run in a
+        worker before ``dt`` may run there, outermost first.
+        """
+
+        try:
+            return self.needs[dt]
+        except KeyError:
+            pass
+
+        # Only fixtures lead to shared fixtures
+        needs = []
+        for dep in sorted(dt._deps, key=str):
+            if dep.istest():
+                continue
+            found = self._needs(dep)
+            if _shared(dep) and isinstance(dep, test.DTestFixtureSetUp):
+                found = found + [dep]
+            needs.extend(fixture for fixture in found
+                         if fixture not in needs)
+
+        self.needs[dt] = needs
+        return needs
+
+    def run(self, dt):
+        """
+        Run the test ``dt`` in one of the workers.  Does not return
+        until the test has completed.
+        """
+
+        name = str(dt)
+        group = self.groups.get(dt)
+
+        for attempt in range(2):
+            # Select a worker
+            worker = self._choose(dt)
+            if worker is None:
+                break
+
+            # Ask it to run the test
+            event = Event()
+            worker.running[name] = event
+            msgs = []
+            for fixture in self._needs(dt):
+                # The worker must hold the state of the shared
+                # fixtures the test needs, unless they have been torn
+                # down...
+                holders = self.holders.get(fixture)
+                if (holders is not None and worker not in holders and
+                    (fixture not in self.torn or fixture is dt._partner)):
+                    holders.add(worker)
+                    msgs.append(('replay', str(fixture)))
+            if group is not None and worker not in self.hosts.get(group, ()):
+                # ...and of its group; have it replay the fixtures
+                # that have completed
+                self.hosts.setdefault(group, set()).add(worker)
+                msgs.extend(('replay', fixture)
+                            for fixture in self.completed.get(group, []))
+            msgs.append(('run', name))
+            worker.send(*msgs)
+
+            # The other workers holding the state of the partner of a
+            # shared tearDown() fixture replay it
+            if _shared(dt) and dt._partner is not None:
+                for other in self.holders.get(dt._partner, ()):
+                    if other is not worker and other.alive:
+                        other.send(('replay', name))
+                self.holders[dt._partner] = set([worker])
+                self.torn.add(dt._partner)
+
+            # Wait for the result; False means the worker couldn't
+            # run the test
+            if event.wait():
+                return
+
+            # Tell the user what's going on
+            self.queue.output.info("Worker %s failed to run %s" %
+                                   (worker, name))
+
+        # Couldn't run it
+        self._lost(dt)
+
+    def _lost(self, dt):
+        """
+        Transition ``dt`` to the ERROR state because it could not be
+        run by a worker.
+        """
+
+        # Manufacture a message describing the problem
+        exc = DTestException("Worker exited while running test")
+        dt._result._msgs[TEST] = result.DTestMessage(TEST, [], DTestException,
+                                                     exc, None)
+        dt._result._error = True
+
+        # Manually transition the test to the ERROR state
+        dt._result._transition(ERROR, output=self.queue.output)
+
+    def _reader(self, worker):
+        """
+        Process the messages sent by a worker.  This method is meant
+        to be run in a new thread.
+        """
+
+        output = self.queue.output
+        while True:
+            try:
+                msg = recv_msg(worker.sock)
+            except IOError:
+                # Includes socket.error
+                msg = None
+            if msg is None:
+                break
+
+            if msg[0] == 'hello':
+                worker.name = '%s:%s' % (msg[1], msg[2])
+            elif msg[0] == 'notify':
+                # Replay the state transition; a reassigned test has
+                # already been marked as running
+                dt = self.index[msg[1]]
+                if msg[2] != RUNNING or dt.state != RUNNING:
+                    dt._result._transition(msg[2], output=output)
+            elif msg[0] == 'status':
+                output.status(self.index[msg[1]], msg[2])
+            elif msg[0] == 'info':
+                output.info(msg[1])
+            elif msg[0] == 'caught':
+                self.queue.caught.append(unpack_exc(msg[1]))
+            elif msg[0] == 'result':
+                # Save the result...
+                dt = self.index[msg[1]]
+                unpack_result(dt._result, msg[2])
+
+                # ...remember completed setUp() fixtures, for
+                # replaying...
+                group = self.groups.get(dt)
+                if dt._result and isinstance(dt, test.DTestFixtureSetUp):
+                    if group is not None:
+                        self.completed.setdefault(group, []).append(msg[1])
+                    elif _shared(dt):
+                        self.holders[dt] = set([worker])
+
+                # ...and wake up the waiting thread
+                worker.running.pop(msg[1]).send(True)
+            elif msg[0] == 'unknown':
+                # The worker doesn't have the test
+                output.info("Worker %s does not know test %s" %
+                            (worker, msg[1]))
+                event = worker.running.pop(msg[1], None)
+                if event is not None:
+                    event.send(False)
+            elif msg[0] == 'resources':
+                for clsname, args, exc in msg[1]:
+                    self.messages.append((_remote_resource(clsname, args),
+                                          unpack_exc(exc)))
+
+        # The worker has gone away; anything it was running must be
+        # reassigned
+        worker.alive = False
+        for name, event in worker.running.items():
+            event.send(False)
+        worker.running = {}
+
+        # Clean up the worker
+        worker.sock.close()
+        if worker.pid is not None:
+            os.waitpid(worker.pid, 0)
+        worker.done.send()
+
+    def stop(self):
+        """
+        Shut down the workers, waiting for them to exit.
+        """
+
+        for worker in self.workers:
+            if worker.alive:
+                worker.send(('exit',))
+
+        for worker in self.workers:
+            worker.done.wait()
+
+        self.workers = []
+
+
+class ProcessPool(WorkerPool):
+    """
+    ProcessPool
+    ===========
+
+    The ProcessPool class is a WorkerPool which forks the requested
+    number of worker processes on the local machine.
+    """
+
+    def __init__(self, count):
+        """
+        Initialize a ProcessPool object which will run ``count``
+        worker processes.
+        """
+
+        super(ProcessPool, self).__init__()
+
+        self.count = count
+
+    def _start(self, tests, debug):
+        """
+        Fork the worker processes.
+        """
+
+        # Flush our output, so the workers don't duplicate it
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        for i in range(self.count):
+            psock, csock = socket.socketpair()
+            pid = os.fork()
+            if pid == 0:
+                # We're the worker; we need a fresh hub...
+                psock.close()
+                for worker in self.workers:
+                    worker.sock.close()
+                hubs.use_hub()
+
+                # ...then we can serve the coordinator
+                status = 0
+                try:
+                    _worker(csock, tests, debug)
+                except:
+                    status = 1
+                finally:
+                    os._exit(status)
+
+            # We're the coordinator; keep track of the worker
+            csock.close()
+            self._add_worker(psock, pid)
+
+
+class NodePool(WorkerPool):
+    """
+    NodePool
+    ========
+
+    The NodePool class is a WorkerPool which listens on a TCP or Unix
+    domain socket for workers to connect.  Workers are started
+    separately--possibly on other machines--using serve() (the
+    ``--worker`` command line option), after discovering the same
+    tests as the coordinator.  The test run begins once the requested
+    number of workers have connected and authenticated; workers
+    connecting later join the pool as they arrive.
+    """
+
+    def __init__(self, address, nodes=1, authkey=None):
+        """
+        Initialize a NodePool object which will listen on
+        ``address``--either "host:port" or the path of a Unix domain
+        socket--and wait for ``nodes`` workers to connect.  Workers
+        must authenticate using the shared secret ``authkey``; see
+        get_authkey().
+        """
+
+        super(NodePool, self).__init__()
+
+        self.address = address
+        self.nodes = nodes
+        self.authkey = get_authkey(address, authkey)
+        self.listener = None
+
+    def _start(self, tests, debug):
+        """
+        Listen for workers and wait for enough of them to connect.
+        """
+
+        # Set up the listening socket
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+        self.listener = socket.socket(family, socket.SOCK_STREAM)
+        if family != socket.AF_UNIX:
+            self.listener.setsockopt(socket.SOL_SOCKET,
+                                     socket.SO_REUSEADDR, 1)
+        if family == socket.AF_UNIX:
+            # Only we may connect; the socket must not be created with
+            # looser permissions, even briefly
+            umask = os.umask(077)
+            try:
+                self.listener.bind(addr)
+            finally:
+                os.umask(umask)
+        else:
+            self.listener.bind(addr)
+        self.listener.listen(max(self.nodes, 5))
+
+        # Wait for the initial workers...
+        self.queue.output.info("Waiting for %d worker(s) on %s" %
+                               (self.nodes, self.address))
+        count = 0
+        while count < self.nodes:
+            sock, peer = self.listener.accept()
+            if self._authenticate(sock, peer):
+                self._add_worker(sock)
+                count += 1
+
+        # ...and accept any latecomers in the background
+        spawn_n(self._acceptor, self.listener)
+
+    def _acceptor(self, listener):
+        """
+        Accept workers connecting after the test run has begun.  This
+        method is meant to be run in a new thread.
+        """
+
+        while True:
+            try:
+                sock, peer = listener.accept()
+            except IOError:
+                # Includes socket.error; the listener has been closed
+                return
+            spawn_n(self._admit, sock, peer)
+
+    def _authenticate(self, sock, peer):
+        """
+        Authenticate the worker which connected over ``sock`` from the
+        address ``peer``, and prove to it that we are the coordinator.
+        Returns False, having closed the socket, if authentication
+        fails.
+        """
+
+        try:
+            sock.settimeout(DEF_AUTH_WAIT)
+            deliver_challenge(sock, self.authkey)
+            answer_challenge(sock, self.authkey)
+            sock.settimeout(None)
+        except (DTestException, IOError):
+            # Includes socket.error and timeouts
+            self.queue.output.info("Rejected worker connecting from %s" %
+                                   (peer or self.address,))
+            sock.close()
+            return False
+
+        return True
+
+    def _admit(self, sock, peer):
+        """
+        Add the worker which connected over ``sock`` from the address
+        ``peer`` to the pool, once it has authenticated.  This method
+        is meant to be run in a new thread.
+        """
+
+        if self._authenticate(sock, peer):
+            self._add_worker(sock)
+
+    def stop(self):
+        """
+        Shut down the workers and stop listening.
+        """
+
+        if self.listener is not None:
+            family, addr = parse_address(self.address)
+            self.listener.close()
+            self.listener = None
+            if family == socket.AF_UNIX and os.path.exists(addr):
+                os.unlink(addr)
+
+        super(NodePool, self).stop()
@@ -35,8 +35,6 @@ in the dtest.test module.
 import functools
 import sys
 
-from eventlet import semaphore
-
 
 class ResourceObjectMeta(type):
     """
@@ -357,12 +355,17 @@ class ResourceManager(object):
     ResourceManager class, which manages a pool of resources.
     """
 
-    def __init__(self):
+    def __init__(self, lock=None):
         """
-        Initializes the resource pool.
+        Initializes the resource pool.  The ``lock`` argument may be
+        used to provide the lock protecting the pool; by default, a
+        greenthread semaphore is used.
         """
 
-        self._pool_lock = semaphore.Semaphore()
+        if lock is None:
+            from eventlet import semaphore
+            lock = semaphore.Semaphore()
+        self._pool_lock = lock
         self._pool = {}
 
         # Need a place to store error messages
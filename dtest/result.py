@@ -26,10 +26,12 @@ that were generated while running the test.  The output messages are
 contained in an instance of DTestMessage.
 """
 
+import time
+
+from dtest import backend
 from dtest import capture
 from dtest.constants import *
-
-from eventlet.timeout import Timeout
+from dtest import watchdog
 
 
 class ResultContext(object):
@@ -58,6 +60,7 @@ class ResultContext(object):
 
         # There's no timeout...
         self.timeout = None
+        self.watch = None
 
     def __enter__(self):
         """
@@ -70,10 +73,16 @@ class ResultContext(object):
 
         # If test should be timed, set up the timeout
         if self.result._test._timeout:
-            self.timeout = Timeout(self.result._test._timeout,
-                                   AssertionError("Timed out after %s "
-                                                  "seconds" %
-                                                  self.result._test._timeout))
+            self.timeout = backend.current().Timeout(
+                self.result._test._timeout,
+                AssertionError("Timed out after %s seconds" %
+                               self.result._test._timeout))
+
+            # Tests which don't yield are caught by the watchdog, if
+            # we're using hard timeouts
+            if watchdog.current() is not None:
+                self.watch = watchdog.current().watch(
+                    self.result._test._timeout)
 
     def __exit__(self, exc_type, exc_value, tb):
         """
@@ -83,9 +92,20 @@ class ResultContext(object):
         necessary.
         """
 
+        # Stop the watchdog from interrupting us
+        if self.watch is not None:
+            self.watch.cancel()
+            self.watch = None
+
         # Cancel the timeout if one is pending
         if self.timeout is not None:
             self.timeout.cancel()
+
+            # A timeout which could not interrupt the test fails it
+            # now
+            if exc_type is None and getattr(self.timeout, 'expired', False):
+                exc_type = type(self.timeout.exception)
+                exc_value = self.timeout.exception
             self.timeout = None
 
         # Get the output and clean up
@@ -112,11 +132,14 @@ class DTestResult(object):
     fixtures.  Various special methods are implemented, allowing the
     result to appear True if the test passed and False if the test did
     not pass, as well as allowing the messages to be accessed easily.
-    Three public properties are available: the ``test`` property
+    Five public properties are available: the ``test`` property
     returns the associated test; the ``state`` property returns the
-    state of the test, which can also indicate the final result; and
-    the ``msgs`` property returns a list of the messages generated
-    while executing the test.
+    state of the test, which can also indicate the final result; the
+    ``msgs`` property returns a list of the messages generated while
+    executing the test; the ``duration`` property returns the number
+    of seconds the test took to run; and the ``cached`` property
+    indicates whether the test passed in an earlier test run and was
+    not run again.
 
     Note that the string representation of a DTestResult object is
     identical to its state.
@@ -156,6 +179,9 @@ class DTestResult(object):
         self._result = None
         self._error = False
         self._msgs = {}
+        self._started = None
+        self._duration = None
+        self._cached = False
 
     def __nonzero__(self):
         """
@@ -241,6 +267,12 @@ class DTestResult(object):
             else:
                 state = XFAIL if self._test._exp_fail else FAIL
 
+        # Keep track of how long the test runs
+        if state == RUNNING:
+            self._started = time.time()
+        elif self._started is not None and self._duration is None:
+            self._duration = time.time() - self._started
+
         # Issue an appropriate notification
         if output is not None:
             output.notify(self._test, state)
@@ -248,6 +280,17 @@ class DTestResult(object):
         # Transition to the new state
         self._state = state
 
+    def _from_cache(self, output=None):
+        """
+        Marks the test as having passed without running it, because
+        it passed in an earlier test run and nothing it depends on has
+        changed since.  See the dtest.cache module.
+        """
+
+        self._result = True
+        self._cached = True
+        self._transition(OK, output=output)
+
     def _set_result(self, ctx, exc_type, exc_value, tb):
         """
         Determines the result or error status of the test.  Only
@@ -309,6 +352,31 @@ class DTestResult(object):
         # an attribute
         return self._state
 
+    @property
+    def duration(self):
+        """
+        Retrieve the number of seconds spent running the test
+        associated with this DTestResult object.  If the test has not
+        finished running--or was never run, because it was skipped or
+        one of its dependencies failed--returns None.
+        """
+
+        # We want the duration to be read-only, but to be accessed
+        # like an attribute
+        return self._duration
+
+    @property
+    def cached(self):
+        """
+        Retrieve a flag indicating whether the result of the test
+        associated with this DTestResult object was found in the
+        cache of passing tests, rather than by running the test.
+        """
+
+        # We want the flag to be read-only, but to be accessed like
+        # an attribute
+        return self._cached
+
     @property
     def msgs(self):
         """
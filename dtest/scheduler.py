@@ -0,0 +1,582 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+===============
+Test Schedulers
+===============
+
+This module contains the classes which decide the order in which
+ready tests are started by DTestQueue.  A scheduler holds the tests
+whose dependencies have all been satisfied; DTestQueue pushes tests
+onto it with push() and, whenever it is permitted to start another
+test, retrieves the next one with pop(); pop() may return None if
+none of the ready tests should be started yet.  Once a started test
+has finished, DTestQueue calls the finished() method.  Before a test
+run begins, the prepare() method is called with the set of tests that
+will be run, allowing the scheduler to analyze the dependency graph.
+This module contains FIFOScheduler, which starts tests in the order
+they become ready; CriticalPathScheduler, which starts the tests on
+the longest remaining path through the dependency graph first;
+AffinityScheduler, which finishes the tests of open test fixtures
+before opening new ones; and FailedFirstScheduler, which starts the
+tests which failed in the previous run before those chosen by another
+scheduler.
+"""
+
+from collections import deque
+import heapq
+
+from dtest.constants import *
+from dtest import test
+
+
+class FIFOScheduler(object):
+    """
+    FIFOScheduler
+    =============
+
+    The FIFOScheduler class is the default scheduler.  Ready tests are
+    started in the order in which they became ready.
+    """
+
+    def __init__(self):
+        """
+        Initialize a FIFOScheduler object.
+        """
+
+        self._ready = deque()
+
+    def __len__(self):
+        """
+        Returns the number of ready tests waiting to be started.
+        """
+
+        return len(self._ready)
+
+    def prepare(self, tests):
+        """
+        Prepares the scheduler for a test run involving ``tests``.
+        Discards any tests left over from a previous run.
+        """
+
+        self._ready.clear()
+
+    def push(self, dt):
+        """
+        Adds the ready test ``dt`` to the scheduler.
+        """
+
+        self._ready.append(dt)
+
+    def pop(self):
+        """
+        Removes and returns the next test to start.
+        """
+
+        return self._ready.popleft()
+
+    def finished(self, dt):
+        """
+        Called when the test ``dt``, previously returned by pop(), has
+        finished running.
+        """
+
+        pass
+
+
+class CriticalPathScheduler(FIFOScheduler):
+    """
+    CriticalPathScheduler
+    =====================
+
+    The CriticalPathScheduler class gives priority to the ready tests
+    on the longest remaining path through the dependency graph, as
+    measured by the durations of the tests in a DTestHistory.  The
+    remaining path of a test includes the test itself and its longest
+    chain of dependents.  Tests for which no duration has been
+    recorded are assumed to take the mean of the recorded durations;
+    ties--including every test when no history is available--are
+    broken by giving priority to the test with the larger number of
+    downstream dependents.  This is only useful when the number of
+    simultaneously executing tests is limited.
+    """
+
+    def __init__(self, history=None):
+        """
+        Initialize a CriticalPathScheduler object.  The ``history``
+        argument should be a DTestHistory object; if it is None, the
+        number of downstream dependents alone determines priority.
+        """
+
+        super(CriticalPathScheduler, self).__init__()
+
+        self.history = history
+        self.priority = {}
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        """
+        Returns the number of ready tests waiting to be started.
+        """
+
+        return len(self._heap)
+
+    def prepare(self, tests):
+        """
+        Prepares the scheduler for a test run involving ``tests``.
+        Computes the priority of each test from the durations in the
+        history and the structure of the dependency graph.
+        """
+
+        # Discard left-over tests
+        self._heap = []
+        self._seq = 0
+
+        # Look up the known durations
+        durations = {}
+        if self.history is not None:
+            for dt in tests:
+                duration = self.history.duration(dt)
+                if duration is not None:
+                    durations[dt] = duration
+
+        # Tests with no history take the mean duration
+        default = 0.0
+        if durations:
+            default = sum(durations.values()) / len(durations)
+
+        # Compute the longest remaining path and the number of
+        # downstream dependents for each test
+        path = longest_paths(tests, lambda dt: durations.get(dt, default))
+        down = downstream_counts(tests)
+
+        self.priority = dict((dt, (path[dt], down[dt])) for dt in tests)
+
+    def push(self, dt):
+        """
+        Adds the ready test ``dt`` to the scheduler.
+        """
+
+        # Negate the priority, since heapq pops the smallest item;
+        # the sequence number keeps equal priorities in FIFO order
+        prio = self.priority.get(dt, (0.0, 0))
+        heapq.heappush(self._heap, (-prio[0], -prio[1], self._seq, dt))
+        self._seq += 1
+
+    def pop(self):
+        """
+        Removes and returns the ready test with the highest priority.
+        """
+
+        return heapq.heappop(self._heap)[-1]
+
+
+def longest_paths(tests, weight):
+    """
+    Computes the length of the longest path from each test in
+    ``tests`` through its dependents, where the length of a path is
+    the sum of ``weight(dt)`` for each test ``dt`` along it.  Only
+    dependents contained in ``tests`` are considered.  Returns a
+    dictionary mapping each test to its path length.  Dependency
+    cycles are broken arbitrarily.
+    """
+
+    tests = frozenset(tests)
+    lengths = {}
+    active = set()
+    for root in tests:
+        if root in lengths:
+            continue
+
+        # Iterative post-order walk, so deep graphs don't exhaust
+        # the stack
+        stack = [(root, iter(root._revdeps))]
+        active.add(root)
+        while stack:
+            dt, children = stack[-1]
+            for child in children:
+                if child in tests and child not in lengths and \
+                        child not in active:
+                    active.add(child)
+                    stack.append((child, iter(child._revdeps)))
+                    break
+            else:
+                # All dependents are done; compute our length
+                stack.pop()
+                active.discard(dt)
+                lengths[dt] = weight(dt) + max(
+                    [lengths.get(child, 0.0) for child in dt._revdeps
+                     if child in tests] or [0.0])
+
+    return lengths
+
+
+def downstream_counts(tests):
+    """
+    Computes the number of tests in ``tests`` which are directly or
+    indirectly dependent on each test in ``tests``.  Returns a
+    dictionary mapping each test to its count.
+    """
+
+    tests = frozenset(tests)
+    counts = {}
+    for root in tests:
+        seen = set()
+        stack = [root]
+        while stack:
+            for child in stack.pop()._revdeps:
+                if child in tests and child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+        seen.discard(root)
+        counts[root] = len(seen)
+
+    return counts
+
+
+class AffinityScheduler(FIFOScheduler):
+    """
+    AffinityScheduler
+    =================
+
+    The AffinityScheduler class tries to finish the tests using a test
+    fixture before starting others, to reduce the number of fixtures
+    which are set up at the same time.  A fixture scope is opened when
+    a setUp() fixture with a partner tearDown() fixture starts, and
+    closed when the tearDown() fixture finishes (or when the setUp()
+    fixture fails).  Ready tests within open scopes are started before
+    any other ready tests.
+
+    If a ``cap`` is given, a setUp() fixture will not be started while
+    ``cap`` or more scopes are open, not counting the scopes enclosing
+    the fixture itself.  So that the test run can never stall, the cap
+    is ignored when no tests are running.
+    """
+
+    def __init__(self, cap=None):
+        """
+        Initialize an AffinityScheduler object.  The ``cap`` argument
+        limits the number of simultaneously open fixture scopes; if
+        None, the number is unlimited.
+        """
+
+        super(AffinityScheduler, self).__init__()
+
+        self.cap = cap
+        self.scopes = {}
+        self.ancestors = {}
+        self.open = []
+        self.running = 0
+        self.max_open = 0
+        self._ready = []
+
+    def prepare(self, tests):
+        """
+        Prepares the scheduler for a test run involving ``tests``.
+        Determines the fixture scopes and how they are nested.
+        """
+
+        # Discard left-over state
+        self._ready = []
+        self.open = []
+        self.running = 0
+        self.max_open = 0
+
+        # A scope is a setUp() fixture with a tearDown() partner
+        self.scopes = dict((dt._partner, dt) for dt in tests
+                           if dt._partner is not None and
+                           dt._partner in tests)
+        self.ancestors = fixture_ancestors(tests)
+
+    def _eligible(self, dt):
+        """
+        Determines whether ``dt`` may be started now without exceeding
+        the cap on open scopes.
+        """
+
+        # Only opening a new scope is restricted
+        if self.cap is None or dt not in self.scopes or self.running == 0:
+            return True
+
+        # Don't count the scopes enclosing this one
+        enclosing = self.ancestors.get(dt, ())
+        count = len([scope for scope in self.open
+                     if scope not in enclosing])
+
+        return count < self.cap
+
+    def pop(self):
+        """
+        Removes and returns the ready test to start next, preferring
+        tests within open scopes.  Returns None if no ready test may
+        be started without exceeding the cap on open scopes.
+        """
+
+        # Find the first eligible test, preferring those depending on
+        # an open scope
+        choice = None
+        for i, dt in enumerate(self._ready):
+            if not self._eligible(dt):
+                continue
+            elif [dep for dep in dt._deps if dep in self.open]:
+                choice = i
+                break
+            elif choice is None:
+                choice = i
+
+        if choice is None:
+            return None
+
+        # Starting a setUp() fixture opens a scope
+        dt = self._ready.pop(choice)
+        if dt in self.scopes:
+            self.open.append(dt)
+            self.max_open = max(self.max_open, len(self.open))
+        self.running += 1
+
+        return dt
+
+    def finished(self, dt):
+        """
+        Called when the test ``dt``, previously returned by pop(), has
+        finished running.  Closes the scope ``dt`` ends, if any.
+        """
+
+        self.running -= 1
+
+        # A tearDown() fixture closes its partner's scope, and so does
+        # a failing setUp() fixture, since the tearDown() won't run
+        if dt._partner in self.open:
+            self.open.remove(dt._partner)
+        elif dt in self.open and dt.state in (FAIL, XFAIL, ERROR, DEPFAIL,
+                                              NOTRUN):
+            self.open.remove(dt)
+
+
+class FailedFirstScheduler(object):
+    """
+    FailedFirstScheduler
+    ====================
+
+    The FailedFirstScheduler class starts the tests which did not pass
+    the last time they were run, according to a DTestHistory, before
+    any others, so that their results are known as soon as possible.
+    The tests they depend on, such as their test fixtures, are given
+    the same priority.  The remaining tests are handed to another
+    scheduler, which decides their order.
+    """
+
+    def __init__(self, history, scheduler=None):
+        """
+        Initialize a FailedFirstScheduler object.  The ``history``
+        argument should be a DTestHistory object.  The ``scheduler``
+        argument is the scheduler ordering the other tests; it
+        defaults to a FIFOScheduler.
+        """
+
+        if scheduler is None:
+            scheduler = FIFOScheduler()
+
+        self.history = history
+        self.scheduler = scheduler
+        self.priority = frozenset()
+        self._ready = deque()
+
+    def __len__(self):
+        """
+        Returns the number of ready tests waiting to be started.
+        """
+
+        return len(self._ready) + len(self.scheduler)
+
+    def prepare(self, tests):
+        """
+        Prepares the scheduler for a test run involving ``tests``.
+        Determines which tests failed last time and what they depend
+        on.
+        """
+
+        self._ready.clear()
+        self.scheduler.prepare(tests)
+
+        # Walk from the failed tests through their dependencies
+        tests = frozenset(tests)
+        priority = set(dt for dt in tests if self.history.failed(dt))
+        stack = list(priority)
+        while stack:
+            for dep in stack.pop()._deps:
+                if dep in tests and dep not in priority:
+                    priority.add(dep)
+                    stack.append(dep)
+
+        self.priority = frozenset(priority)
+
+    def push(self, dt):
+        """
+        Adds the ready test ``dt`` to the scheduler.
+        """
+
+        if dt in self.priority:
+            self._ready.append(dt)
+        else:
+            self.scheduler.push(dt)
+
+    def pop(self):
+        """
+        Removes and returns the next test to start, preferring the
+        tests which failed last time.  Returns None if the other
+        scheduler declines to start any of its tests.
+        """
+
+        if self._ready:
+            return self._ready.popleft()
+
+        return self.scheduler.pop()
+
+    def finished(self, dt):
+        """
+        Called when the test ``dt``, previously returned by pop(), has
+        finished running.
+        """
+
+        # The other scheduler only hears about its own tests
+        if dt not in self.priority:
+            self.scheduler.finished(dt)
+
+
+def fixture_ancestors(tests):
+    """
+    Computes the setUp() fixtures in ``tests`` which each test in
+    ``tests`` depends on, directly or indirectly.  Returns a
+    dictionary mapping each test to a frozenset of setUp() fixtures.
+    """
+
+    tests = frozenset(tests)
+    ancestors = {}
+    for root in tests:
+        seen = set()
+        stack = [root]
+        while stack:
+            for dep in stack.pop()._deps:
+                if dep in tests and dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        ancestors[root] = frozenset(dt for dt in seen
+                                    if isinstance(dt, test.DTestFixtureSetUp))
+
+    return ancestors
+
+
+def find_cycles(tests):
+    """
+    Finds the dependency cycles among ``tests``, using an iterative
+    form of Tarjan's strongly connected components algorithm, which
+    runs in time linear in the size of the dependency graph.  Only
+    dependencies contained in ``tests`` are considered.  Returns a
+    list of cycles; each cycle is a list of the tests making up a
+    strongly connected component, along with any test which depends
+    on itself.
+    """
+
+    tests = frozenset(tests)
+    index = {}
+    lowlink = {}
+    stack = []
+    onstack = set()
+    cycles = []
+
+    for root in tests:
+        if root in index:
+            continue
+
+        # Each frame holds a test and an iterator over its
+        # dependencies
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        onstack.add(root)
+        frames = [(root, iter(root._deps))]
+        while frames:
+            dt, deps = frames[-1]
+            for dep in deps:
+                if dep not in tests:
+                    continue
+                elif dep not in index:
+                    # Descend into the dependency
+                    index[dep] = lowlink[dep] = len(index)
+                    stack.append(dep)
+                    onstack.add(dep)
+                    frames.append((dep, iter(dep._deps)))
+                    break
+                elif dep in onstack:
+                    lowlink[dt] = min(lowlink[dt], index[dep])
+            else:
+                # Done with this test's dependencies
+                frames.pop()
+                if frames:
+                    parent = frames[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[dt])
+
+                # Is this the root of a strongly connected component?
+                if lowlink[dt] == index[dt]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        onstack.discard(member)
+                        component.append(member)
+                        if member is dt:
+                            break
+
+                    # Single tests only count if they depend on
+                    # themselves
+                    if len(component) > 1 or dt in dt._deps:
+                        cycles.append(component)
+
+    return cycles
+
+
+def cycle_path(cycle):
+    """
+    Finds a shortest path of dependencies through the tests in
+    ``cycle``--one of the lists returned by find_cycles()--which
+    starts and ends at the same test.  Returns the list of tests along
+    the path, beginning and ending with the same test.
+    """
+
+    members = frozenset(cycle)
+    start = min(cycle, key=str)
+
+    # Breadth-first search back to the start
+    prev = {}
+    queue = deque([start])
+    while queue:
+        dt = queue.popleft()
+        for dep in sorted(dt._deps, key=str):
+            if dep is start:
+                # Found it; unwind the path
+                path = [start]
+                while dt is not start:
+                    path.append(dt)
+                    dt = prev[dt]
+                path.append(start)
+                path.reverse()
+                return path
+            elif dep in members and dep not in prev:
+                prev[dep] = dt
+                queue.append(dep)
+
+    # Can't happen for a real cycle
+    return [start]
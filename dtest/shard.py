@@ -0,0 +1,227 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+=============
+Test Sharding
+=============
+
+This module contains the functions used to split a test suite into
+shards, so that a suite may be divided among several machines, each
+of which discovers the same tests and runs one shard.  The tests are
+first divided into units, which are never split between shards: tests
+which depend on one another, directly or through test fixtures, and
+tests sharing a class or module fixture are in the same unit.  The
+units are then assigned to shards so as to balance the durations
+recorded in the test history; without a history, the shards are
+balanced by the number of tests.  Finally, each shard is given the
+fixtures its tests depend on, found by following the dependencies of
+the tests; fixtures defined in packages usually apply to tests
+throughout the suite, so they are run by every shard needing them
+rather than joining their tests into one unit.
+
+The partition depends only on the names of the tests and on the
+history, so every machine computes the same partition independently,
+as long as each uses the same history file.
+"""
+
+import sys
+
+from dtest.exceptions import DTestException
+
+
+def parse(value):
+    """
+    Parse a shard specification of the form "INDEX/COUNT", where
+    INDEX counts from 1.  Returns a tuple of the index and count.
+    """
+
+    try:
+        index, count = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise DTestException("Invalid shard %r; expected INDEX/COUNT" %
+                             value)
+
+    if count < 1 or index < 1 or index > count:
+        raise DTestException("Invalid shard %r; INDEX must be between 1 "
+                             "and COUNT" % value)
+
+    return index, count
+
+
+def _shared(dt):
+    """
+    Determine whether ``dt`` is a fixture defined in a package, which
+    is run by every shard needing it.
+    """
+
+    if dt.istest() or dt._class is not None:
+        return False
+
+    # The stand-ins for tests which have not been imported know
+    # whether their modules are packages
+    package = getattr(dt._test, '_dt_package', None)
+    if package is not None:
+        return package
+
+    mod = sys.modules.get(dt._test.__module__)
+    return hasattr(mod, '__path__')
+
+
+def units(tests):
+    """
+    Divide ``tests`` into units which must be run together.  Two tests
+    are in the same unit if one depends on the other, or if one is
+    the partner of the other, unless either is a fixture defined in a
+    package; such fixtures are not placed in any unit.  Dependencies
+    on tests outside of ``tests`` are ignored.  Returns a list of
+    units, each a list of tests sorted by name, in order of the name
+    of their first test.
+    """
+
+    tests = frozenset(dt for dt in tests if not _shared(dt))
+    parent = {}
+
+    # Find the representative of a unit, compressing paths as we go
+    def find(dt):
+        parent.setdefault(dt, dt)
+        while parent[dt] is not dt:
+            parent[dt] = parent[parent[dt]]
+            dt = parent[dt]
+        return dt
+
+    # Merge two units
+    def union(dt1, dt2):
+        root1, root2 = find(dt1), find(dt2)
+        if root1 is not root2:
+            parent[root2] = root1
+
+    for dt in tests:
+        find(dt)
+
+        # Join tests with their dependencies...
+        for dep in dt._deps:
+            if dep in tests:
+                union(dep, dt)
+
+        # ...and tearDown() fixtures with their partners
+        if dt._partner is not None and dt._partner in tests:
+            union(dt._partner, dt)
+
+    # Collect the members of each unit
+    members = {}
+    for dt in tests:
+        members.setdefault(find(dt), []).append(dt)
+
+    # Sort everything by name, so the order doesn't depend on where
+    # the tests happen to live in memory
+    result = [sorted(unit, key=str) for unit in members.values()]
+    result.sort(key=lambda unit: str(unit[0]))
+    return result
+
+
+def closure(shard, tests):
+    """
+    Add to the set ``shard`` the fixtures in ``tests`` which its
+    members depend on, directly or indirectly, along with the
+    partners of those fixtures.
+    """
+
+    pending = list(shard)
+    while pending:
+        dt = pending.pop()
+        for dep in dt._deps:
+            if dep in tests and dep not in shard:
+                shard.add(dep)
+                pending.append(dep)
+
+    # Add the tearDown() fixtures whose partners are present
+    for dt in tests:
+        if dt._partner is not None and dt._partner in shard:
+            shard.add(dt)
+
+
+def _weigher(tests, history):
+    """
+    Build a function which returns the expected duration of a test.
+    Durations recorded in ``history`` are used where available;
+    otherwise, tests are assumed to take the mean of the recorded
+    test durations (or 1 second, if there are none) and fixtures are
+    assumed to take no time.
+    """
+
+    known = {}
+    if history is not None:
+        for dt in tests:
+            dur = history.duration(dt)
+            if dur is not None:
+                known[dt] = dur
+
+    # Figure out the default duration of a test
+    durations = [dur for dt, dur in known.items() if dt.istest()]
+    default = sum(durations) / len(durations) if durations else 1.0
+
+    def weigh(dt):
+        if dt in known:
+            return known[dt]
+        return default if dt.istest() else 0.0
+
+    return weigh
+
+
+def partition(tests, count, history=None):
+    """
+    Partition ``tests`` into ``count`` shards, balancing the
+    durations recorded in ``history`` (a DTestHistory object).  Units
+    are assigned in order of decreasing duration, each to the shard
+    with the least total duration so far; each shard then receives
+    the fixtures its tests depend on.  Returns a list of ``count``
+    sets of tests; only fixtures appear in more than one set.
+    """
+
+    tests = list(tests)
+    weigh = _weigher(tests, history)
+
+    # Weigh each unit; sort by decreasing weight, breaking ties by
+    # name so the order is deterministic
+    weighed = [(sum(weigh(dt) for dt in unit), unit)
+               for unit in units(tests)]
+    weighed.sort(key=lambda (weight, unit): (-weight, str(unit[0])))
+
+    # Assign each unit to the least-loaded shard
+    shards = [set() for i in range(count)]
+    loads = [0.0] * count
+    for weight, unit in weighed:
+        idx = min(range(count), key=lambda i: (loads[i], i))
+        shards[idx].update(unit)
+        loads[idx] += weight
+
+    # Give each shard the fixtures its tests need
+    tests = frozenset(tests)
+    for tshard in shards:
+        if tshard:
+            closure(tshard, tests)
+
+    return shards
+
+
+def select(tests, index, count, history=None):
+    """
+    Select the tests of shard ``index`` (counting from 1) out of
+    ``count`` shards of ``tests``.  See partition().  Returns a set
+    of tests.
+    """
+
+    return partition(tests, count, history)[index - 1]
@@ -0,0 +1,438 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+================
+Static Discovery
+================
+
+This module contains the DTestStatic class, which discovers the tests
+defined in test modules without importing them, by parsing their
+sources.  For each module, a stand-in module is built, holding
+stand-ins for the functions and classes defined in it which look like
+tests or test fixtures: functions and methods whose names match the
+test regular expression, setUp() and tearDown() functions,
+setUpClass() and tearDownClass() methods, subclasses of DTestCase,
+and anything decorated with the decorators of the dtest.test module.
+The decorators are applied to the stand-ins just as they would be to
+the real functions, and the stand-in modules are then visited just as
+imported modules are, so that the same tests, test fixtures, and
+dependencies are found; see visit_mod().
+
+Some things cannot be determined without running the code: tests
+created or imported in other ways than by plain definitions and
+"from ... import" statements, base classes defined outside of the
+modules under the test directory, and decorator arguments other than
+literals, which are taken to be None.  The @depends() decorator is
+followed only to functions and methods defined in the module, or in
+other modules under the test directory, which are parsed in turn.
+The tests found are thus provisional; they suffice to list and select
+the tests, after which the modules defining the tests selected are
+imported, and the real tests replace them.  The stand-in modules are
+recorded in the discovery index; see the dtest.index module.
+"""
+
+import ast
+import os
+import sys
+import types
+
+from dtest import discovery as dc
+from dtest.exceptions import DTestException
+from dtest import index as ix
+from dtest import test
+
+
+# Decorators applied to the function alone
+_PLAIN = dict(istest=test.istest, nottest=test.nottest, skip=test.skip,
+              failing=test.failing)
+
+# Decorators with a single literal argument, and the attributes of the
+# test they set
+_SETTINGS = dict(timed='_timeout', repeat='_repeat')
+
+# Other decorators making the function a test; their arguments only
+# matter when the test is run
+_OTHERS = frozenset(['raises', 'require', 'strategy', 'parallel', 'policy',
+                     'threshold'])
+
+# All the decorators recognized
+_DECORATORS = (frozenset(_PLAIN) | frozenset(_SETTINGS) | _OTHERS |
+               frozenset(['attr', 'depends', 'isfixture']))
+
+# Names of the test fixtures
+_FIXTURES = frozenset([test.SETUP, test.TEARDOWN, test.SETUP + test.CLASS,
+                       test.TEARDOWN + test.CLASS])
+
+
+def _source(basedir, modname):
+    """
+    Determine the path of the source file of the module ``modname``,
+    imported from ``basedir``.  Returns None if there is none.
+    """
+
+    path = os.path.join(basedir, *modname.split('.'))
+    if os.path.isdir(path):
+        path = os.path.join(path, '__init__.py')
+    else:
+        path += '.py'
+
+    return path if os.path.isfile(path) else None
+
+
+def _decorator(node):
+    """
+    Interpret the decorator expression ``node``.  Returns a tuple of
+    the name of the decorator, or None if it is not a simple or
+    dotted name, and the call node, if the decorator is called.
+    """
+
+    call = node if isinstance(node, ast.Call) else None
+    if call is not None:
+        node = call.func
+
+    if isinstance(node, ast.Attribute):
+        return node.attr, call
+    elif isinstance(node, ast.Name):
+        return node.id, call
+    return None, call
+
+
+def _literal(node):
+    """
+    Evaluate ``node`` if it is a literal; otherwise, returns None.
+    """
+
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        return None
+
+
+class DTestStatic(object):
+    """
+    DTestStatic
+    ===========
+
+    The DTestStatic class builds stand-ins for the test modules named
+    ``modnames`` under ``directory``, and for their parent packages,
+    by parsing their sources.  It is used as a context manager: on
+    entry, the stand-in modules replace any real modules of the same
+    names in sys.modules and are visited, so that they may be
+    recorded in the discovery index; on exit, sys.modules is
+    restored.  The ``caught`` attribute lists the modules which could
+    not be parsed, in the form used by explore() for the modules
+    which could not be imported.
+    """
+
+    def __init__(self, directory, modnames):
+        """
+        Initialize a DTestStatic object for the test modules
+        ``modnames`` under ``directory``.
+        """
+
+        self.basedir = dc.base(directory)[0]
+        self.modnames = set(modnames)
+
+        # The stand-in modules, or None for those which could not be
+        # built
+        self.modules = {}
+
+        # Information about the modules which could not be parsed
+        self.caught = []
+
+        # The names bound by the import statements of each module
+        self._aliases = {}
+
+        # The dependencies yet to be set up
+        self._pending = []
+
+        # The modules replaced in sys.modules
+        self._saved = {}
+
+    def __enter__(self):
+        """
+        Build the stand-in modules, install them in sys.modules, and
+        visit them.
+        """
+
+        # Build the modules and their parent packages
+        for modname in sorted(self.modnames):
+            parts = modname.split('.')
+            for i in range(1, len(parts) + 1):
+                self._build('.'.join(parts[:i]), True)
+
+        # Set up the dependencies; this may build more modules
+        while self._pending:
+            func, args, modname, scope = self._pending.pop(0)
+            deps = [self._resolve(arg, modname, scope) for arg in args]
+            test.depends(*[dep for dep in deps if callable(dep)])(func)
+
+        # Install the stand-ins
+        for modname, mod in self.modules.items():
+            self._saved[modname] = sys.modules.get(modname)
+            if mod is None:
+                sys.modules.pop(modname, None)
+            else:
+                sys.modules[modname] = mod
+
+        # Visit those whose parent packages could be built, too
+        for modname in sorted(self.modnames):
+            parts = modname.split('.')
+            if all(self.modules.get('.'.join(parts[:i])) is not None
+                   for i in range(1, len(parts) + 1)):
+                test.visit_mod(self.modules[modname], set())
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        """
+        Restore the modules replaced in sys.modules.
+        """
+
+        for modname, mod in self._saved.items():
+            if mod is None:
+                sys.modules.pop(modname, None)
+            else:
+                sys.modules[modname] = mod
+        self._saved = {}
+
+        return False
+
+    def _build(self, modname, required=False):
+        """
+        Build the stand-in for the module ``modname``, if it has not
+        been built already.  If the module cannot be parsed and it is
+        ``required``, the reason is added to ``caught``.  Returns the
+        stand-in module, or None if there is none.
+        """
+
+        if modname in self.modules:
+            return self.modules[modname]
+        self.modules[modname] = None
+
+        # Parse the source
+        fname = _source(self.basedir, modname)
+        try:
+            if fname is None:
+                raise DTestException("No source found for module %s" %
+                                     modname)
+            with open(fname) as f:
+                tree = ast.parse(f.read(), fname)
+        except (DTestException, EnvironmentError, SyntaxError):
+            if required:
+                self.caught.append((fname, modname, sys.exc_info()))
+            return None
+
+        # Set up the module; others may refer to it while it's built,
+        # just as with a circular import
+        mod = types.ModuleType(modname)
+        mod.__file__ = fname
+        self.modules[modname] = mod
+        aliases = self._aliases[modname] = {}
+        if os.path.basename(fname) == '__init__.py':
+            # Packages are marked as such, just as imported ones are
+            mod.__path__ = [os.path.dirname(fname)]
+            package = modname
+        else:
+            package = modname.rpartition('.')[0]
+
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef):
+                func = self._function(node, modname, node.name, fname,
+                                      [vars(mod)])
+                if func is not None:
+                    setattr(mod, node.name, func)
+            elif isinstance(node, ast.ClassDef):
+                cls = self._class(node, modname, fname, mod)
+                if cls is not None:
+                    setattr(mod, node.name, cls)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname is not None:
+                        aliases[alias.asname] = self._absolute(
+                            package, alias.name)
+                    else:
+                        first = alias.name.split('.')[0]
+                        aliases[first] = self._absolute(package, first)
+            elif isinstance(node, ast.ImportFrom):
+                self._import_from(node, modname, package, mod)
+
+        return mod
+
+    def _absolute(self, package, name, level=0):
+        """
+        Determine the absolute name of the module ``name`` imported
+        by a module of the package ``package``, at the relative
+        import ``level``.  Without a level, a module of the package
+        is preferred, as with implicit relative imports.
+        """
+
+        if level > 0:
+            parts = package.split('.') if package else []
+            parts = parts[:len(parts) - level + 1]
+            return '.'.join(parts + ([name] if name else []))
+        elif package and _source(self.basedir, '%s.%s' %
+                                 (package, name.split('.')[0])):
+            return '%s.%s' % (package, name)
+        return name
+
+    def _import_from(self, node, modname, package, mod):
+        """
+        Handle the "from ... import" statement ``node`` of the module
+        ``modname``, of the package ``package``, whose stand-in is
+        ``mod``.  Functions and classes imported from modules under
+        the test directory are bound in the stand-in, as they would
+        be found in the real module.
+        """
+
+        base = self._absolute(package, node.module or '',
+                              node.level or 0)
+        for alias in node.names:
+            if alias.name == '*':
+                continue
+            local = alias.asname or alias.name
+            self._aliases[modname][local] = '%s.%s' % (base, alias.name)
+
+            obj = self._lookup('%s.%s' % (base, alias.name))
+            if isinstance(obj, (type, types.FunctionType)):
+                setattr(mod, local, obj)
+
+    def _lookup(self, dotted):
+        """
+        Look up the function, class, or module with the full dotted
+        name ``dotted`` among the modules under the test directory,
+        building the module if need be.  Returns None if it cannot be
+        found.
+        """
+
+        parts = dotted.split('.')
+        for i in range(len(parts), 0, -1):
+            modname = '.'.join(parts[:i])
+            if _source(self.basedir, modname) is None:
+                continue
+
+            obj = self._build(modname)
+            for part in parts[i:]:
+                obj = getattr(obj, part, None)
+            return obj
+
+        return None
+
+    def _resolve(self, node, modname, scope):
+        """
+        Determine the object the expression ``node``, in the module
+        ``modname``, refers to, if it is a simple or dotted name.  The
+        ``scope`` is a list of the namespaces to search, innermost
+        first; names bound by import statements are looked up with
+        _lookup().  Returns None if the object cannot be determined.
+        """
+
+        # Break up the dotted name
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.insert(0, node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+
+        # Look the name up
+        for namespace in scope:
+            if node.id in namespace:
+                obj = namespace[node.id]
+                for part in parts:
+                    obj = getattr(obj, part, None)
+                return obj
+
+        aliases = self._aliases.get(modname, {})
+        if node.id in aliases:
+            return self._lookup('.'.join([aliases[node.id]] + parts))
+        return None
+
+    def _function(self, node, modname, qualname, fname, scope):
+        """
+        Build the stand-in for the function or method defined by the
+        ``node``, in the module ``modname`` and the file ``fname``.
+        The ``qualname`` is the name of the function, prefixed by the
+        name of the class for a method, and the ``scope`` is a list of
+        the namespaces its decorators are evaluated in.  Returns None
+        if it does not look like a test or test fixture.
+        """
+
+        decorators = [_decorator(dec) for dec in node.decorator_list]
+        if not (test.testRE.match(node.name) or node.name in _FIXTURES or
+                [name for name, call in decorators if name in _DECORATORS]):
+            return None
+
+        func = ix.stub('%s.%s' % (modname, qualname), modname, fname,
+                       node.lineno)
+
+        # Apply the decorators, innermost first
+        wrapper = None
+        for name, call in reversed(decorators):
+            if name in ('classmethod', 'staticmethod') and call is None:
+                wrapper = classmethod if name == 'classmethod' \
+                    else staticmethod
+            elif name in _PLAIN and call is None:
+                _PLAIN[name](func)
+            elif name in _OTHERS:
+                test.istest(func)
+            elif call is None:
+                continue
+            elif name == 'attr':
+                test.attr(**dict((kw.arg, _literal(kw.value))
+                                 for kw in call.keywords))(func)
+            elif name in _SETTINGS:
+                dt = test.istest(func)._dt_dtest
+                if call.args and _literal(call.args[0]) is not None:
+                    setattr(dt, _SETTINGS[name], _literal(call.args[0]))
+            elif name == 'depends':
+                # The tests depended on may not have been built yet
+                test.istest(func)
+                self._pending.append((func, call.args, modname, scope))
+
+        return wrapper(func) if wrapper is not None else func
+
+    def _class(self, node, modname, fname, mod):
+        """
+        Build the stand-in for the class defined by the ``node``, in
+        the module ``modname`` and the file ``fname``, whose stand-in
+        is ``mod``.  Returns None unless it is a subclass of
+        DTestCase.
+        """
+
+        # Find the bases which are test cases
+        bases = []
+        for base in node.bases:
+            obj = self._resolve(base, modname, [vars(mod)])
+            if obj is None and _decorator(base)[0] == 'DTestCase':
+                obj = test.DTestCase
+            if isinstance(obj, type) and issubclass(obj, test.DTestCase):
+                bases.append(obj)
+        if not bases:
+            return None
+
+        # Build the methods...
+        dict_ = dict(__module__=modname)
+        scope = [dict_, vars(mod)]
+        for item in node.body:
+            if isinstance(item, ast.FunctionDef):
+                func = self._function(item, modname, '%s.%s' %
+                                      (node.name, item.name), fname, scope)
+                if func is not None:
+                    dict_[item.name] = func
+
+        # ...and the class, which finds the tests in it
+        return test.DTestCaseMeta(node.name, tuple(bases), dict_)
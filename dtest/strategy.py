@@ -29,9 +29,7 @@ LimitedParallelStrategy.
 
 import dtest
 
-from eventlet import spawn_n
-from eventlet.event import Event
-from eventlet.semaphore import Semaphore
+from dtest import backend
 
 
 class SerialStrategy(object):
@@ -90,9 +88,11 @@ class UnlimitedParallelStrategy(object):
         event to be signaled when all tests are done.
         """
 
-        # Initialize the counter and the event
+        # Initialize the counter and the event, using the threads of
+        # the current backend
+        self.backend = backend.current()
         self.count = 0
-        self.lock = Semaphore()
+        self.lock = self.backend.Semaphore()
         self.event = None
 
         # Save the output and test for the status stream
@@ -107,8 +107,9 @@ class UnlimitedParallelStrategy(object):
         """
 
         # Spawn our internal function in a separate thread
-        self.count += 1
-        spawn_n(self._spawn, call, args, kwargs)
+        with self.lock:
+            self.count += 1
+        self.backend.spawn_n(self._spawn, call, args, kwargs)
 
     def _spawn(self, call, args, kwargs):
         """
@@ -123,11 +124,9 @@ class UnlimitedParallelStrategy(object):
         # Call the call
         call(*args, **kwargs)
 
-        # Decrement the count
-        self.count -= 1
-
-        # Signal the event, if necessary
+        # Decrement the count and signal the event, if necessary
         with self.lock:
+            self.count -= 1
             if self.count == 0 and self.event is not None:
                 self.event.send()
 
@@ -143,7 +142,7 @@ class UnlimitedParallelStrategy(object):
                 return
 
             # OK, let's initialize the event...
-            self.event = Event()
+            self.event = self.backend.Event()
 
         # Now we wait on the event
         self.event.wait()
@@ -184,7 +183,7 @@ class LimitedParallelStrategy(UnlimitedParallelStrategy):
         super(LimitedParallelStrategy, self).prepare()
 
         # Also initialize a limiting semaphore
-        self.limit_sem = Semaphore(self.limit)
+        self.limit_sem = self.backend.Semaphore(self.limit)
 
     def _spawn(self, call, args, kwargs):
         """
@@ -29,12 +29,12 @@ number of decorators, such as @istest, @nottest, @skip, @failing,
 utility function dot().
 """
 
-import inspect
 import re
 import sys
 import types
 
 from dtest.constants import *
+from dtest import coroutine
 from dtest import exceptions
 from dtest import policy as pol
 from dtest import result
@@ -527,6 +527,10 @@ class DTestBase(object):
             if obj is not None:
                 method = getattr(obj, method.__name__)
 
+            # Coroutines are run on the shared event loop
+            if coroutine.iscoroutinefunction(method):
+                method = coroutine.wrap(method, self._timeout)
+
             # Now call it
             return method
 
@@ -669,10 +673,20 @@ class DTestBase(object):
         dictionary of function keyword arguments.  Any element except
         the callable may be omitted.  Generators may also return a
         bare callable.
+
+        Coroutine functions are not treated as generators; they are
+        run as tasks on the event loop shared by all coroutine tests.
         """
 
-        # First, check if this is a generator function
-        if inspect.isgeneratorfunction(call):
+        import inspect
+
+        # Coroutines are run on the shared event loop; they may look
+        # like generator functions, so check for them first
+        if coroutine.iscoroutinefunction(call):
+            call = coroutine.wrap(call, self._timeout)
+
+        # Next, check if this is a generator function
+        elif inspect.isgeneratorfunction(call):
             # Allocate and use a context for the generator itself
             with self._result.accumulate(TEST, id=name):
                 # OK, we need to iterate over the result
@@ -719,6 +733,10 @@ class DTestBase(object):
                 # Set our own state to SKIPPED
                 self._result._transition(SKIPPED, output=output)
                 return False
+            elif dep.state == NOTRUN:
+                # The test run was stopped early
+                self._result._transition(NOTRUN)
+                return False
             elif dep.state != OK and dep.state != UOK:
                 # Dependencies haven't finished up, yet
                 return False
@@ -764,6 +782,8 @@ class DTestBase(object):
         instance.
         """
 
+        import inspect
+
         # Select the correct result container
         if self._repeat > 1 or inspect.isgeneratorfunction(self._test):
             # Will have multiple results
@@ -919,6 +939,10 @@ class DTestFixtureTearDown(DTestFixture):
                 # Set our own state to SKIPPED
                 self._result._transition(SKIPPED, output=output)
                 return False
+            elif self._partner.state == NOTRUN:
+                # The test run was stopped early
+                self._result._transition(NOTRUN)
+                return False
 
         # Other dependencies must not be un-run or in the RUNNING
         # state
@@ -1339,14 +1363,39 @@ def require(**resources):
 testRE = re.compile(r'(?:^|[\b_\.-])[Tt]est')
 
 
+def _findtest(obj, name):
+    """
+    Helper for DTestCaseMeta which retrieves the test attached to the
+    attribute ``name`` of ``obj``.  Callables whose names match
+    testRE, and which are not marked with @nottest, are made into
+    tests if they are not already tests.  Returns None if the
+    attribute is not a test.
+    """
+
+    # Get the value
+    v = getattr(obj, name)
+
+    # Skip non-callables
+    if not callable(v):
+        return None
+
+    # Is it explicitly not a test?
+    if hasattr(v, '_dt_nottest') and v._dt_nottest:
+        return None
+
+    # OK, let's try to get the test
+    return _gettest(v, DTest if testRE.match(name) else None)
+
+
 def visit_mod(mod, tests):
     """
     Helper function which searches a module object, specified by
     ``mod``, for all tests, test classes, and test fixtures, then sets
-    up proper dependency information.  All discovered tests are added
-    to the set specified by ``tests``.  Returns a tuple containing the
-    closest discovered test fixtures (needed because visit_mod() is
-    recursive).
+    up proper dependency information.  Only the callables defined in
+    the module, and those imported under names matching testRE, are
+    considered.  All discovered tests are added to the set specified
+    by ``tests``.  Returns a tuple containing the closest discovered
+    test fixtures (needed because visit_mod() is recursive).
     """
 
     # Have we visited this module before?
@@ -1405,18 +1454,22 @@ def visit_mod(mod, tests):
 
     # Now, let's scan all the module attributes and set them up as
     # tests with appropriate dependencies...
-    for k in dir(mod):
+    for k, v in mod.__dict__.items():
         # Skip internal attributes and the fixtures
         if k[0] == '_' or k == SETUP or k == TEARDOWN:
             continue
 
-        # Get the value
-        v = getattr(mod, k)
-
         # Skip non-callables
         if not callable(v):
             continue
 
+        # Only names which look like tests may be imported from
+        # elsewhere; this saves examining every name of the APIs the
+        # module imports
+        if (not testRE.match(k) and
+            getattr(v, '__module__', None) != mod.__name__):
+            continue
+
         # Is it explicitly not a test?
         if hasattr(v, '_dt_nottest') and v._dt_nottest:
             continue
@@ -1473,6 +1526,34 @@ def visit_mod(mod, tests):
     return setUp, tearDown
 
 
+def unvisit_mod(mod):
+    """
+    Helper function which undoes the work of visit_mod() for the
+    module object ``mod``, so that the module may be reloaded and
+    visited again.  The tests and test fixtures defined in the module
+    are detached from the dependency graph, so tests elsewhere no
+    longer depend on them.  Returns the set of detached tests.
+    """
+
+    # Forget that we visited the module
+    visited = getattr(mod, '_dt_visited', set())
+    for attr in ('_dt_visited', '_dt_setUp', '_dt_tearDown'):
+        if hasattr(mod, attr):
+            delattr(mod, attr)
+
+    # The visited set includes the parent package's tests; only
+    # detach our own
+    removed = set(dt for dt in visited
+                  if getattr(dt.test, '__module__', None) == mod.__name__)
+    for dt in removed:
+        for dep in dt._deps:
+            dep._revdeps.discard(dt)
+        for dep in dt._revdeps:
+            dep._deps.discard(dt)
+
+    return removed
+
+
 class DTestCaseMeta(type):
     """
     DTestCaseMeta
@@ -1516,38 +1597,44 @@ class DTestCaseMeta(type):
         if setUpClass is not None and tearDownClass is not None:
             tearDownClass._set_partner(setUpClass)
 
-        # Now, let's scan all the class attributes and set them up as
-        # tests with appropriate dependencies...
-        tests = []
-        for k in dir(cls):
-            # Skip internal attributes and the fixtures
-            if (k[0] == '_' or k == SETUP or k == TEARDOWN or
-                k == SETUP + CLASS or k == TEARDOWN + CLASS):
-                continue
-
-            # Get the value
-            v = getattr(cls, k)
-
-            # Skip non-callables
-            if not callable(v):
-                continue
-
-            # Is it explicitly not a test?
-            if hasattr(v, '_dt_nottest') and v._dt_nottest:
-                continue
+        # Now, let's find the tests among the class attributes.  Each
+        # attribute is found in the first class of the MRO defining
+        # it; the tests defined by DTestCase classes were found when
+        # those classes were constructed, and are kept in their
+        # _dt_names tables, so only the attributes of this class and
+        # of any other base classes need be examined
+        names = {}
+        seen = set()
+        for klass in cls.__mro__:
+            table = klass.__dict__.get('_dt_names')
+            for k in klass.__dict__:
+                # Skip attributes already found, internal attributes,
+                # and the fixtures
+                if k in seen:
+                    continue
+                seen.add(k)
+                if (k[0] == '_' or k == SETUP or k == TEARDOWN or
+                    k == SETUP + CLASS or k == TEARDOWN + CLASS):
+                    continue
+
+                # OK, let's try to get the test
+                if table is not None:
+                    dt = table.get(k)
+                else:
+                    dt = _findtest(cls, k)
+                if dt is not None:
+                    names[k] = dt
 
-            # OK, let's try to get the test
-            dt = _gettest(v, DTest if testRE.match(k) else None)
-            if dt is None:
-                # Not a test
-                continue
+            # Remember the tests this class defines
+            if klass is cls:
+                cls._dt_names = dict(names)
 
+        # Now set them up with appropriate dependencies...
+        tests = set(names.values())
+        for dt in tests:
             # Attach the class to the test
             dt._attach(cls)
 
-            # Keep a list of the tests in this class
-            tests.append(dt)
-
             # We now have a test; let's attach fixtures as
             # appropriate...
             if dt._pre is None and setUp is not None:
@@ -1563,7 +1650,7 @@ class DTestCaseMeta(type):
                 depends(dt)(tearDownClass)
 
         # Save the list of tests
-        cls._dt_tests = set(tests)
+        cls._dt_tests = tests
 
         # Also need to list the fixtures
         if setUpClass is not None:
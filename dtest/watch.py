@@ -0,0 +1,441 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+==========
+Watch Mode
+==========
+
+This module contains the support for rerunning tests as source files
+change, without starting a new interpreter.  The InotifyWatcher class
+uses the Linux inotify interface to learn of changes to Python source
+files; where inotify is not available, the PollingWatcher class scans
+for changes periodically instead.  The watcher() function selects the
+best watcher available.  Both watch every directory under the given
+roots, other than hidden directories.
+
+The refresh() function reloads the modules loaded from a set of
+changed files, along with every module using them, directly or
+indirectly, so that no module is left holding functions or classes
+from an old version of another.  The tests defined by the reloaded
+modules are detached from the dependency graph before each module is
+reloaded; exploring the tests again then builds new tests for the
+reloaded modules, while the tests of the other modules are reused.
+The dtest package itself is never reloaded.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from dtest import cache as tc
+from dtest import test
+
+
+# The inotify events of interest
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+            _IN_CREATE | _IN_DELETE)
+
+# The header of an inotify event: watch descriptor, mask, cookie, and
+# length of the name
+_inotify_event = struct.Struct('iIII')
+
+
+def roots(directory=None):
+    """
+    Determine the directories to watch for tests in ``directory`` (by
+    default, the current directory): the directory and the current
+    directory, which usually contains the code under test, unless one
+    contains the other.  Returns a list of real paths.
+    """
+
+    cwd = os.path.realpath(os.getcwd())
+    directory = os.path.realpath(directory or cwd)
+
+    if directory == cwd or directory.startswith(cwd + os.sep):
+        return [cwd]
+    elif cwd.startswith(directory + os.sep):
+        return [directory]
+    return [directory, cwd]
+
+
+def _walk(roots):
+    """
+    Generate the directories under ``roots``, skipping hidden
+    directories.
+    """
+
+    for root in roots:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            yield dirpath, filenames
+
+
+class PollingWatcher(object):
+    """
+    PollingWatcher
+    ==============
+
+    The PollingWatcher class detects changes to Python source files by
+    scanning the watched directories every ``interval`` seconds and
+    comparing the modification times of the files.
+    """
+
+    def __init__(self, roots, interval=1.0):
+        """
+        Initialize a PollingWatcher for the directories under
+        ``roots``.
+        """
+
+        self.roots = roots
+        self.interval = interval
+        self._mtimes = self._scan()
+
+    def _scan(self):
+        """
+        Determine the modification times of the Python source files.
+        Returns a dictionary mapping paths to modification times.
+        """
+
+        mtimes = {}
+        for dirpath, filenames in _walk(self.roots):
+            for fname in filenames:
+                if not fname.endswith('.py'):
+                    continue
+                path = os.path.join(dirpath, fname)
+                try:
+                    mtimes[path] = os.stat(path).st_mtime
+                except OSError:
+                    # Deleted while we were looking
+                    pass
+
+        return mtimes
+
+    def wait(self):
+        """
+        Wait until Python source files are created, modified, or
+        deleted.  Returns the set of their paths.
+        """
+
+        while True:
+            time.sleep(self.interval)
+
+            mtimes = self._scan()
+            changed = set(path for path in set(mtimes) | set(self._mtimes)
+                          if mtimes.get(path) != self._mtimes.get(path))
+            self._mtimes = mtimes
+            if changed:
+                return changed
+
+    def close(self):
+        """
+        Stop watching.  Does nothing.
+        """
+
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    InotifyWatcher
+    ==============
+
+    The InotifyWatcher class detects changes to Python source files
+    using the Linux inotify interface, through ctypes.  Editors often
+    write a file in several steps, so once a change is seen, changes
+    are collected until none have been seen for ``settle`` seconds.
+    Creating the watcher raises OSError if inotify is not available.
+    """
+
+    def __init__(self, roots, settle=0.1):
+        """
+        Initialize an InotifyWatcher for the directories under
+        ``roots``.
+        """
+
+        self.roots = roots
+        self.settle = settle
+
+        # Find inotify in the C library
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+            self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                                        ctypes.c_uint32]
+            fd = libc.inotify_init()
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        # Watch all the directories
+        self._fd = fd
+        self._dirs = {}
+        for dirpath, filenames in _walk(roots):
+            self._watch(dirpath)
+
+    def _watch(self, path):
+        """
+        Begin watching the directory ``path``.
+        """
+
+        wd = self._add_watch(self._fd, path, _IN_MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def _all(self):
+        """
+        Determine the paths of all the Python source files being
+        watched; used when the kernel's event queue overflows.
+        """
+
+        return set(os.path.join(dirpath, fname)
+                   for dirpath, filenames in _walk(self.roots)
+                   for fname in filenames if fname.endswith('.py'))
+
+    def _read(self, timeout):
+        """
+        Wait up to ``timeout`` seconds (forever, if None) for events,
+        and process them.  Returns None if there were no events, or
+        the set of paths of the Python source files changed.
+        """
+
+        ready = select.select([self._fd], [], [], timeout)[0]
+        if not ready:
+            return None
+
+        data = os.read(self._fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _inotify_event.unpack_from(data,
+                                                                  offset)
+            offset += _inotify_event.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+
+            # Did we miss events?
+            if mask & _IN_Q_OVERFLOW:
+                changed |= self._all()
+                continue
+
+            # Was a watch removed along with its directory?
+            dirpath = self._dirs.get(wd)
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            elif dirpath is None:
+                continue
+
+            path = os.path.join(dirpath, name)
+            if mask & _IN_ISDIR:
+                # Watch new directories, and the files in them
+                if (mask & (_IN_CREATE | _IN_MOVED_TO) and
+                    not name.startswith('.')):
+                    for subdir, filenames in _walk([path]):
+                        self._watch(subdir)
+                        changed |= set(os.path.join(subdir, fname)
+                                       for fname in filenames
+                                       if fname.endswith('.py'))
+            elif name.endswith('.py'):
+                changed.add(path)
+
+        return changed
+
+    def wait(self):
+        """
+        Wait until Python source files are created, modified, or
+        deleted.  Returns the set of their paths.
+        """
+
+        changed = set()
+        while True:
+            # Once something changes, wait for things to settle down
+            events = self._read(self.settle if changed else None)
+            if events is None:
+                return changed
+            changed |= events
+
+    def close(self):
+        """
+        Stop watching.
+        """
+
+        os.close(self._fd)
+
+
+def watcher(roots):
+    """
+    Select a watcher for the directories under ``roots``: an
+    InotifyWatcher where possible, or a PollingWatcher otherwise.
+    """
+
+    try:
+        return InotifyWatcher(roots)
+    except OSError:
+        return PollingWatcher(roots)
+
+
+def source(mod):
+    """
+    Determine the path of the source file of the module ``mod``, or
+    None if it has none.
+    """
+
+    fname = getattr(mod, '__file__', None)
+    if fname is None:
+        return None
+    if fname.endswith(('.pyc', '.pyo')):
+        fname = fname[:-1]
+    return os.path.realpath(fname)
+
+
+def _modules(roots):
+    """
+    Find the modules loaded from source files under ``roots``, other
+    than the dtest package.  Returns a dictionary mapping the paths of
+    the source files to the module names.
+    """
+
+    prefixes = tuple(root + os.sep for root in roots)
+    files = {}
+    for modname, mod in sys.modules.items():
+        if (mod is None or modname == '__main__' or modname == 'dtest' or
+            modname.startswith('dtest.')):
+            continue
+
+        fname = source(mod)
+        if fname is not None and fname.startswith(prefixes):
+            files[fname] = modname
+
+    return files
+
+
+def _order(modnames):
+    """
+    Order the modules named by ``modnames`` so that each module comes
+    after the modules it uses.  Cycles are broken arbitrarily.
+    """
+
+    modnames = set(modnames)
+    order = []
+    done = set()
+    for root in sorted(modnames):
+        if root in done:
+            continue
+
+        # Iterative post-order walk over the modules used
+        done.add(root)
+        stack = [(root, iter(sorted(tc.uses(sys.modules[root]))))]
+        while stack:
+            modname, used = stack[-1]
+            for other in used:
+                if other in modnames and other not in done:
+                    done.add(other)
+                    stack.append((other, iter(sorted(
+                        tc.uses(sys.modules[other])))))
+                    break
+            else:
+                stack.pop()
+                order.append(modname)
+
+    return order
+
+
+def refresh(changed, roots):
+    """
+    Reload the modules loaded from the ``changed`` files and the
+    modules under ``roots`` using them, directly or indirectly.
+    Modules whose files were deleted are removed instead.  Returns a
+    tuple of the set of names of the affected modules and a list of
+    tuples describing the exceptions raised while reloading, as
+    reported by explore(): the path, the module name, and the
+    exception information.  A module which fails to reload is left
+    empty, and is reloaded again once its file changes.
+    """
+
+    files = _modules(roots)
+    stale = set(files[fname] for fname in
+                (os.path.realpath(path) for path in changed)
+                if fname in files)
+
+    # Find the users of each module...
+    users = {}
+    for modname in files.values():
+        for other in tc.uses(sys.modules[modname]):
+            users.setdefault(other, set()).add(modname)
+
+    # ...and add in the users of the stale modules
+    pending = list(stale)
+    while pending:
+        for user in users.get(pending.pop(), ()):
+            if user not in stale:
+                stale.add(user)
+                pending.append(user)
+
+    caught = []
+    for modname in _order(stale):
+        mod = sys.modules[modname]
+        fname = source(mod)
+
+        # Detach the old tests
+        test.unvisit_mod(mod)
+
+        # Forget modules which no longer exist
+        if not os.path.exists(fname):
+            del sys.modules[modname]
+            continue
+
+        # Empty the namespace, so nothing deleted from the source
+        # lingers; keep the special attributes and the submodules of
+        # a package, though
+        for name, value in vars(mod).items():
+            if name.startswith('__') and name.endswith('__'):
+                continue
+            elif (getattr(value, '__name__', None) ==
+                  '%s.%s' % (modname, name) and
+                  sys.modules.get(value.__name__) is value):
+                continue
+            delattr(mod, name)
+
+        # Compiled files only record the modification time of the
+        # source to the second, so a quick edit could go unnoticed
+        for compiled in (fname + 'c', fname + 'o'):
+            try:
+                os.remove(compiled)
+            except OSError:
+                pass
+
+        try:
+            reload(mod)
+        except Exception:
+            caught.append((fname, modname, sys.exc_info()))
+
+    return stale, caught
@@ -0,0 +1,329 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+======================
+Hard Timeout Watchdogs
+======================
+
+The @timed() decorator is normally implemented with an eventlet
+Timeout, which can only fire when the test yields to other
+greenthreads; a test which spins on the CPU is never interrupted.
+This module contains watchdogs which enforce @timed() limits from
+outside of the event loop, raising DTestTimeout in the overrunning
+test.  The test then ends in the ERROR state, and the rest of the
+tests carry on.  Watchdogs allow a test GRACE seconds beyond its
+limit, so that a timeout which can interrupt the test normally, such
+as the eventlet Timeout, fires first.
+
+SignalWatchdog uses the SIGALRM signal, and must be started in the
+main thread; it interrupts tests running in greenthreads of the main
+thread, which includes all tests run by the green backend and by
+worker processes.  ThreadWatchdog runs in a thread of its own and
+interrupts tests running in native threads, as with the thread
+backend, by asynchronously raising an exception in the test's thread.
+Neither can interrupt a test which is blocked in a call into C code;
+the exception is raised once the call returns.
+
+Each watchdog provides the start() and stop() methods, which begin
+and end watching, and the watch() method, which returns an object
+whose cancel() method must be called when the watched code has
+finished.  The watchdog in use for the current test run is available
+from the current() function.
+"""
+
+import signal
+import time
+
+from greenlet import getcurrent
+
+from dtest.exceptions import DTestException, DTestTimeout
+
+
+# How often to re-check tests which are overdue but not running
+RECHECK = 0.1
+
+# How long past its limit a test may run before being interrupted
+GRACE = 0.1
+
+
+class _Watch(object):
+    """
+    _Watch
+    ======
+
+    The _Watch class represents a piece of code being watched by a
+    watchdog.  Its cancel() method stops the watch.  The ``fired``
+    attribute is set once the watchdog has interrupted the code.
+    """
+
+    def __init__(self, watchdog, seconds, target):
+        """
+        Initialize a _Watch object.  The watched code belongs to
+        ``target``, which identifies the greenthread or thread running
+        it, and must complete within ``seconds`` seconds, plus GRACE.
+        """
+
+        self.watchdog = watchdog
+        self.seconds = seconds
+        self.target = target
+        self.deadline = time.time() + seconds + GRACE
+        self.fired = False
+
+    def cancel(self):
+        """
+        Stop watching the code.
+        """
+
+        try:
+            self.watchdog._cancel(self)
+        except DTestTimeout:
+            # The watchdog fired just as the code finished; it's too
+            # late to interrupt it
+            pass
+
+
+class SignalWatchdog(object):
+    """
+    SignalWatchdog
+    ==============
+
+    The SignalWatchdog class enforces time limits using the SIGALRM
+    signal.  When the signal arrives, the handler raises DTestTimeout
+    if the greenthread which was interrupted has exceeded its limit.
+    Overdue greenthreads which were not running are rechecked
+    periodically; normally, their eventlet Timeout will have fired
+    first.
+    """
+
+    def __init__(self):
+        """
+        Initialize a SignalWatchdog.
+        """
+
+        self.watches = set()
+        self._old_handler = None
+
+    def start(self):
+        """
+        Begin watching by installing the SIGALRM handler.
+        """
+
+        try:
+            self._old_handler = signal.signal(signal.SIGALRM, self._alarm)
+        except ValueError:
+            raise DTestException("Hard timeouts must be started from the "
+                                 "main thread.")
+
+        # Don't make system calls fail with EINTR if we can help it
+        signal.siginterrupt(signal.SIGALRM, False)
+
+    def stop(self):
+        """
+        Stop watching and restore the previous SIGALRM handler.
+        """
+
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self._old_handler or signal.SIG_DFL)
+        self.watches = set()
+
+    def watch(self, seconds):
+        """
+        Watch the current greenthread, which must finish within
+        ``seconds`` seconds.
+        """
+
+        w = _Watch(self, seconds, getcurrent())
+        self.watches.add(w)
+        self._arm()
+        return w
+
+    def _cancel(self, w):
+        """
+        Stop watching ``w``.
+        """
+
+        self.watches.discard(w)
+        self._arm()
+
+    def _arm(self):
+        """
+        Set the alarm for the next deadline.
+        """
+
+        if not self.watches:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            return
+
+        delay = min(w.deadline for w in self.watches) - time.time()
+        signal.setitimer(signal.ITIMER_REAL, max(delay, RECHECK))
+
+    def _alarm(self, signum, frame):
+        """
+        Handle SIGALRM.  Raises DTestTimeout if the greenthread which
+        was interrupted has exceeded its limit.
+        """
+
+        now = time.time()
+        current = getcurrent()
+        for w in list(self.watches):
+            if w.deadline <= now and w.target is current:
+                self.watches.discard(w)
+                self._arm()
+                raise DTestTimeout("Timed out after %s seconds (hard "
+                                   "timeout)" % w.seconds)
+
+        self._arm()
+
+
+class ThreadWatchdog(object):
+    """
+    ThreadWatchdog
+    ==============
+
+    The ThreadWatchdog class enforces time limits on tests running in
+    native threads.  A thread of its own waits for the next deadline,
+    then raises DTestTimeout in the overrunning thread using the
+    PyThreadState_SetAsyncExc() function of the CPython API.
+    """
+
+    def __init__(self):
+        """
+        Initialize a ThreadWatchdog.
+        """
+
+        from dtest import backend as bk
+        threading = bk.original('threading')
+
+        # Only this watchdog needs ctypes; import it now, rather than
+        # in the watchdog thread, which mustn't wait for the import
+        # lock while holding the condition
+        import ctypes
+        self._ctypes = ctypes
+
+        self.watches = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """
+        Begin watching by starting the watchdog thread.
+        """
+
+        from dtest import backend as bk
+        threading = bk.original('threading')
+        self._running = True
+        self._thread = threading.Thread(target=self._watchdog,
+                                        name='dtest-watchdog')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop watching and wait for the watchdog thread to exit.
+        """
+
+        with self._cond:
+            self._running = False
+            self.watches = set()
+            self._cond.notify()
+        self._thread.join()
+
+    def watch(self, seconds):
+        """
+        Watch the current thread, which must finish within
+        ``seconds`` seconds.
+        """
+
+        from dtest import backend as bk
+        thread = bk.original('thread')
+        w = _Watch(self, seconds, thread.get_ident())
+        with self._cond:
+            self.watches.add(w)
+            self._cond.notify()
+        return w
+
+    def _cancel(self, w):
+        """
+        Stop watching ``w``.
+        """
+
+        with self._cond:
+            self.watches.discard(w)
+
+            # The exception may have been posted but not yet raised;
+            # the watched code has finished, so withdraw it
+            if w.fired:
+                ctypes = self._ctypes
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_long(w.target), None)
+
+    def _watchdog(self):
+        """
+        Wait for deadlines to pass, interrupting the overrunning
+        threads.  Runs in the watchdog thread.
+        """
+
+        with self._cond:
+            while self._running:
+                now = time.time()
+                for w in list(self.watches):
+                    if w.deadline <= now:
+                        self.watches.discard(w)
+                        w.fired = True
+                        self._interrupt(w)
+
+                if self.watches:
+                    delay = min(w.deadline for w in self.watches) - now
+                    self._cond.wait(max(delay, 0.01))
+                else:
+                    self._cond.wait()
+
+    def _interrupt(self, w):
+        """
+        Raise DTestTimeout in the thread being watched by ``w``.
+        """
+
+        # Only an exception class may be given, so make one which
+        # knows the time limit
+        exc = type('DTestTimeout', (DTestTimeout,), dict(seconds=w.seconds))
+        ctypes = self._ctypes
+        ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(w.target),
+                                                   ctypes.py_object(exc))
+
+
+# The watchdog in use, if any
+_current = None
+
+
+def current():
+    """
+    Retrieve the watchdog in use for the current test run, or None
+    if hard timeouts are not in use.
+    """
+
+    return _current
+
+
+def use(watchdog):
+    """
+    Select the ``watchdog`` to use for subsequent test runs; None
+    disables hard timeouts.
+    """
+
+    global _current
+
+    _current = watchdog
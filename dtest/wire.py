@@ -0,0 +1,100 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+===============
+Message Framing
+===============
+
+This module contains the functions which send and receive the
+messages exchanged by the processes of a test run: between the
+coordinator and its workers (see the dtest.process module) and
+between the daemon and its clients (see the dtest.daemon module).
+Each message is a tuple, serialized with pickle and prefixed with its
+length.  This module imports nothing beyond the standard library, so
+that a client of the daemon stays light.
+"""
+
+import cPickle as pickle
+import struct
+
+
+# Format of the length prefix for messages
+_LENFMT = '!I'
+_LENSIZE = struct.calcsize(_LENFMT)
+
+
+def recv_exact(sock, size):
+    """
+    Receive exactly ``size`` bytes from the socket ``sock``.  Returns
+    None if the connection is closed first.
+    """
+
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return ''.join(chunks)
+
+
+def send_raw(sock, data):
+    """
+    Send the string ``data`` over the socket ``sock``, prefixed with
+    its length.
+    """
+
+    sock.sendall(struct.pack(_LENFMT, len(data)) + data)
+
+
+def recv_raw(sock, maxsize=None):
+    """
+    Receive a string sent by send_raw() from the socket ``sock``.
+    Returns None if the connection is closed first, or if the string
+    is longer than ``maxsize`` bytes, if given.
+    """
+
+    hdr = recv_exact(sock, _LENSIZE)
+    if hdr is None:
+        return None
+
+    size = struct.unpack(_LENFMT, hdr)[0]
+    if maxsize is not None and size > maxsize:
+        return None
+    return recv_exact(sock, size)
+
+
+def send_msg(sock, msg):
+    """
+    Send the tuple ``msg`` over the socket ``sock``.
+    """
+
+    send_raw(sock, pickle.dumps(msg, pickle.HIGHEST_PROTOCOL))
+
+
+def recv_msg(sock):
+    """
+    Receive a message tuple from the socket ``sock``.  Returns None if
+    the connection has been closed.
+    """
+
+    data = recv_raw(sock)
+    if data is None:
+        return None
+
+    return pickle.loads(data)
@@ -18,6 +18,7 @@
 import sys
 
 import dtest
+from dtest import discovery
 from dtest import util
 
 
@@ -115,16 +116,12 @@ opts = dtest.opts_to_args(options)
 if 'directory' not in opts:
     opts['directory'] = 'tests'
 
-# Need to allocate a queue; select some suboptions for the task
-subopts = {'skip': lambda dt: hasattr(dt, 'must_skip') and dt.must_skip}
-if 'maxth' in opts:
-    subopts['maxth'] = opts['maxth']
-if 'output' in opts:
-    subopts['output'] = opts['output']
-queue = dtest.DTestQueue(**subopts)
+# Allocate a queue to discover the tests in
+queue = dtest.DTestQueue()
 
 # OK, we need to do the explore
-dtest.explore(opts['directory'], queue)
+dtest.explore(opts['directory'], queue,
+              opts.get('ignore', discovery.DEF_IGNORE))
 
 # Now, set up the dependency between tests.tearDown and our
 # test_ordering() test and the test_partner_*() tests
@@ -138,23 +135,9 @@ queue.add_test(test_discovery)
 queue.add_test(test_partner_setUp)
 queue.add_test(test_partner_tearDown)
 
-# Implement the rest of dtest.main()
-if not opts.get('dryrun', False):
-    # Execute the tests
-    result = queue.run(opts.get('debug', False))
-else:
-    result = True
-
-    # Print out the names of the tests
-    print "Discovered tests:\n"
-    for dt in queue.tests:
-        if dt.istest():
-            print str(dt)
-
-# Are we to dump the dependency graph?
-if 'dotpath' in opts:
-    with open(opts['dotpath'], 'w') as f:
-        print >>f, queue.dot()
+# Let dtest.main() do the rest, with all the other options
+opts['skip'] = lambda dt: hasattr(dt, 'must_skip') and dt.must_skip
+result = dtest.main(tests=queue.tests, **opts)
 
 # All done!
 sys.exit(not result)
@@ -0,0 +1,63 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+import dtest
+from dtest.util import *
+
+
+# Module-level fixture state; must be set up in the worker running
+# the tests
+state = {}
+
+
+def setUp():
+    state['pid'] = os.getpid()
+
+
+def tearDown():
+    assert_equal(state['pid'], os.getpid())
+
+
+class TestNodes(dtest.DTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pid = os.getpid()
+
+    def test_state(self):
+        assert_equal(state['pid'], os.getpid())
+        assert_equal(self.pid, os.getpid())
+
+    def test_dies(self):
+        # Kill our worker the first time through; the test should be
+        # reassigned, with the fixtures replayed on the new worker
+        marker = os.environ['DTEST_NODES_MARKER']
+        if not os.path.exists(marker):
+            open(marker, 'w').close()
+            os._exit(1)
+
+        assert_equal(state['pid'], os.getpid())
+        assert_equal(self.pid, os.getpid())
+
+
+def test_fails():
+    print "captured"
+    assert_equal(1, 2)
+
+
+@dtest.depends(test_fails)
+def test_depfail():
+    pass
@@ -0,0 +1,42 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import time
+
+
+# Package-level fixture state; must be set up in every worker running
+# the tests
+state = {}
+
+
+def record(name):
+    # Note that the fixture ran, and in which process
+    with open(os.environ['DTEST_PROCS_LOG'], 'a') as f:
+        f.write('%s %d\n' % (name, os.getpid()))
+
+
+def work():
+    # Keep a worker busy, so the tests spread out over the workers
+    time.sleep(0.2)
+
+
+def setUp():
+    record('procpkg.setUp')
+    state['pid'] = os.getpid()
+
+
+def tearDown():
+    record('procpkg.tearDown')
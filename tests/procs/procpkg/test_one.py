@@ -0,0 +1,45 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from dtest.util import *
+
+import procpkg
+
+
+# Module-level fixture state
+state = {}
+
+
+def setUp():
+    procpkg.record('procpkg.test_one.setUp')
+    state['pid'] = os.getpid()
+
+
+def tearDown():
+    procpkg.record('procpkg.test_one.tearDown')
+
+
+def test_a():
+    procpkg.work()
+    assert_equal(procpkg.state['pid'], os.getpid())
+    assert_equal(state['pid'], os.getpid())
+
+
+def test_b():
+    procpkg.work()
+    assert_equal(procpkg.state['pid'], os.getpid())
+    assert_equal(state['pid'], os.getpid())
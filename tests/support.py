@@ -0,0 +1,66 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from dtest import *
+"""
+Helpers shared by the tests and the benchmarks.
+"""
+
+
+# Runs the dtest command line in a subprocess
+DRIVER = """
+import sys
+from dtest import core
+opts, args = core.optparser().parse_args(sys.argv[1:])
+sys.exit(not core.main(**core.opts_to_args(opts)))
+"""
+
+
+def write(path, source):
+    """
+    Write out the ``source`` file at ``path``.
+    """
+
+    with open(path, 'w') as f:
+        f.write(source)
+
+
+def mkfunc(name, body=None, modname=None):
+    """
+    Build a distinct function with the given ``name``, which calls
+    ``body``, if given.  The function appears to belong to the module
+    ``modname``, if given.
+    """
+
+    def func():
+        if body is not None:
+            body()
+    func.__name__ = name
+    if modname is not None:
+        func.__module__ = modname
+    return func
+
+
+def graph(tests):
+    """
+    Describe the ``tests``, their settings, and their dependencies by
+    name, so that tests built in different ways may be compared.
+    """
+
+    return dict((str(dt), (dt.__class__.__name__, dt._skip, dt._exp_fail,
+                           dt._attrs, dt._timeout, dt._repeat,
+                           str(dt._partner),
+                           sorted(str(dep) for dep in dt._deps)))
+                for dt in tests)
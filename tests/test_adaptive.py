@@ -0,0 +1,111 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from dtest import *
+from dtest import adaptive
+from dtest import test
+from dtest.util import *
+
+
+class FakeResult(object):
+    def __init__(self, duration):
+        self.duration = duration
+
+
+class FakeTest(object):
+    def __init__(self, duration, state=OK):
+        self.result = FakeResult(duration)
+        self.state = state
+
+    def istest(self):
+        return True
+
+
+class FakeOutput(object):
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(message)
+
+
+def window(limit, duration, state=OK):
+    # Complete one window's worth of tests
+    for i in range(int(limit)):
+        limit.finished(FakeTest(duration, state))
+
+
+def test_aimd():
+    output = FakeOutput()
+    limit = adaptive.AdaptiveLimit(initial=4, maximum=6, max_load=1000.0)
+    limit.start(output)
+
+    # Healthy windows raise the limit additively, up to the maximum
+    window(limit, 0.1)
+    assert_equal(int(limit), 5)
+    window(limit, 0.1)
+    window(limit, 0.1)
+    assert_equal(int(limit), 6)
+
+    # Slow tests halve it
+    window(limit, 1.0)
+    assert_equal(int(limit), 3)
+
+    # So do errors
+    window(limit, 0.1)
+    window(limit, 0.1, ERROR)
+    assert_equal(int(limit), 2)
+
+    # Each change was recorded and reported
+    assert_equal([lim for when, lim in limit.curve], [4, 5, 6, 3, 4, 2])
+    assert_equal(len(output.messages), 5)
+    assert_in('raised from 4 to 5', output.messages[0])
+    assert_in('raised from 5 to 6', output.messages[1])
+    assert_in('mean test time', output.messages[2])
+    assert_in('raised from 3 to 4', output.messages[3])
+    assert_in('errored out', output.messages[4])
+
+
+def test_default_maximum():
+    limit = adaptive.AdaptiveLimit(initial=adaptive.DEF_MAXIMUM - 1,
+                                   max_load=1000.0)
+
+    # Without a maximum, the limit still stops growing somewhere
+    window(limit, 0.1)
+    window(limit, 0.1)
+    assert_equal(int(limit), adaptive.DEF_MAXIMUM)
+
+
+def test_queue():
+    # The queue should honor and report the adaptive limit
+    limit = adaptive.AdaptiveLimit(initial=1, max_load=1000.0)
+
+    def func():
+        pass
+
+    tests = [test.DTest(func) for i in range(5)]
+    queue = DTestQueue(limit, output=DTestOutput(open(os.devnull, 'w')))
+    queue.add_tests(tests)
+    assert_true(queue.run(debug=True))
+
+    assert_equal(limit.curve[0], (0.0, 1))
+    assert_true(len(limit.curve) > 1)
+
+    # "auto" asks for a new adaptive limit
+    queue = DTestQueue('auto', output=DTestOutput(open(os.devnull, 'w')))
+    assert_is_instance(queue.maxth, adaptive.AdaptiveLimit)
+    assert_is(queue.limiter, queue.maxth)
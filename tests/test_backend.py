@@ -0,0 +1,87 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import time
+
+from eventlet import patcher
+
+from dtest import *
+from dtest import backend
+from dtest.util import *
+
+
+def test_thread_event():
+    ev = backend.ThreadEvent()
+    assert_false(ev.ready())
+
+    ev.send('value')
+    assert_true(ev.ready())
+    assert_equal(ev.wait(), 'value')
+
+    # Events may only be sent once
+    assert_raises(AssertionError, ev.send)
+
+
+def test_soft_timeout():
+    exc = AssertionError("Timed out")
+
+    tm = backend.SoftTimeout(60, exc)
+    tm.cancel()
+    assert_false(tm.expired)
+
+    tm = backend.SoftTimeout(0.01, exc)
+    time.sleep(0.05)
+    tm.cancel()
+    assert_true(tm.expired)
+    assert_is(tm.exception, exc)
+
+
+def test_thread_patched():
+    # Under the green backend, native threads are unavailable
+    if not patcher.is_monkey_patched('thread'):
+        return
+
+    try:
+        tb = backend.ThreadBackend()
+    except DTestException:
+        # The futures package isn't installed
+        return
+
+    assert_raises(DTestException, tb.setup)
+
+
+class Counter(backend.ThreadLocal):
+    def __init__(self, start):
+        self.value = start
+
+
+def test_thread_local():
+    loc = Counter(5)
+    loc.value = 6
+
+    # Another thread sees a freshly initialized value
+    seen = []
+    done = backend.current().Event()
+
+    def other():
+        seen.append(loc.value)
+        loc.value = 7
+        done.send()
+
+    backend.current().spawn_n(other)
+    done.wait()
+
+    assert_equal(seen, [5])
+    assert_equal(loc.value, 6)
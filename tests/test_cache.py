@@ -0,0 +1,187 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from dtest import *
+from dtest import cache
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+calls = []
+
+
+def passing():
+    calls.append('passing')
+
+
+def failing():
+    calls.append('failing')
+    assert False
+
+
+def fixture():
+    pass
+
+
+def unstored():
+    pass
+
+
+def test_cached_run():
+    tests = [test.DTest(passing), test.DTest(failing)]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        def run():
+            del calls[:]
+            queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')),
+                               cache=cache.DTestCache(tmpdir))
+            queue.add_tests(tests)
+            queue.run(debug=True)
+
+        # The first run caches the passing test...
+        run()
+        assert_equal(sorted(calls), ['failing', 'passing'])
+        assert_false(tests[0].result.cached)
+
+        # ...so the second doesn't run it
+        run()
+        assert_equal(calls, ['failing'])
+        assert_equal(tests[0].state, OK)
+        assert_true(tests[0].result.cached)
+        assert_equal(tests[1].state, FAIL)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_key():
+    setUp = test.DTestFixtureSetUp(fixture)
+    dt = test.DTest(passing)
+    depends(setUp)(dt)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tcache = cache.DTestCache(tmpdir)
+
+        # Fixtures are never cached
+        assert_is_none(tcache.key(setUp))
+
+        # The key depends on the results of the dependencies
+        setUp._prepare()
+        setUp._result._transition(OK)
+        key = tcache.key(dt)
+        assert_is_not_none(key)
+        assert_equal(tcache.key(dt), key)
+        setUp._result._transition(FAIL)
+        assert_not_equal(tcache.key(dt), key)
+
+        # It doesn't depend on the cache, though
+        assert_equal(cache.DTestCache(tmpdir).key(dt), tcache.key(dt))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_key_submodule():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'cachedpkg')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        # A test module which imports a submodule of a helper package;
+        # only the package is bound in its namespace
+        support.write(os.path.join(pkgdir, '__init__.py'), '')
+        support.write(os.path.join(pkgdir, 'db.py'), 'value = 1\n')
+        support.write(os.path.join(tmpdir, 'cached_user.py'),
+                      'import cachedpkg.db\n\n'
+                      'def test_db():\n    assert cachedpkg.db.value == 1\n')
+
+        import cached_user
+        assert_in('cachedpkg.db', cache.uses(cached_user))
+
+        # Only sources under the root are considered
+        tcache = cache.DTestCache(os.path.join(tmpdir, 'cache'))
+        tcache.root = tmpdir + os.sep
+        dt = test.DTest(cached_user.test_db)
+        key = tcache.key(dt)
+        assert_is_not_none(key)
+
+        # Editing the submodule changes the key
+        support.write(os.path.join(pkgdir, 'db.py'), 'value = 2\n')
+        tcache.reset()
+        assert_not_equal(tcache.key(dt), key)
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if (modname in ('cachedpkg', 'cached_user') or
+                modname.startswith('cachedpkg.')):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
+
+
+def test_evict():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tcache = cache.DTestCache(tmpdir, max_size=250)
+
+        # Five entries of 100 bytes, the oldest first
+        entries = []
+        for i in range(5):
+            entry = os.path.join(tmpdir, '%02d' % i, 'entry')
+            os.makedirs(os.path.dirname(entry))
+            with open(entry, 'w') as f:
+                f.write('x' * 100)
+            os.utime(entry, (1000 + i, 1000 + i))
+            entries.append(entry)
+
+        # An entry someone else is still writing is left alone
+        partial = os.path.join(tmpdir, '00', '.tmpwriting')
+        with open(partial, 'w') as f:
+            f.write('x' * 100)
+        os.utime(partial, (999, 999))
+
+        # Only the newest two fit
+        tcache.evict()
+        assert_equal([os.path.exists(entry) for entry in entries],
+                     [False, False, False, True, True])
+        assert_true(os.path.exists(partial))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_record_failure():
+    dt = test.DTest(unstored)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tcache = cache.DTestCache(tmpdir)
+
+        # Something else is in the way of the entry's directory
+        dirname = os.path.dirname(tcache._entry(tcache.key(dt)))
+        with open(dirname, 'w') as f:
+            f.write('blocker')
+
+        # The test still runs and passes, without being cached
+        queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')),
+                           cache=tcache)
+        queue.add_test(dt)
+        assert_true(queue.run(debug=True))
+        assert_equal(os.listdir(tmpdir), [os.path.basename(dirname)])
+        assert_true(os.path.isfile(dirname))
+    finally:
+        shutil.rmtree(tmpdir)
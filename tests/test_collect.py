@@ -0,0 +1,74 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import types
+
+from dtest import *
+from dtest import test
+from dtest.util import *
+
+
+def test_visit_imported():
+    # A library module, with a test helper and a test
+    lib = types.ModuleType('collect_lib')
+    exec ('from dtest import *\n\n'
+          '@istest\n'
+          'def helper():\n    pass\n\n'
+          'def test_shared():\n    pass\n\n'
+          'def api():\n    pass\n') in lib.__dict__
+
+    # A test module importing everything from it
+    mod = types.ModuleType('collect_mod')
+    mod.__dict__.update((k, v) for k, v in lib.__dict__.items()
+                        if k[0] != '_')
+    exec ('@istest\n'
+          'def checker():\n    pass\n\n'
+          'def test_own():\n    pass\n') in mod.__dict__
+
+    # Only its own tests, and tests imported by test names, are found
+    tests = set()
+    test.visit_mod(mod, tests)
+    assert_equal(sorted(dt.test.__name__ for dt in tests),
+                 ['checker', 'test_own', 'test_shared'])
+
+
+def test_inherited_tables():
+    class Mixin(object):
+        def test_mixed(self):
+            pass
+
+    class TestBase(DTestCase):
+        def test_a(self):
+            pass
+
+        def test_b(self):
+            pass
+
+    class TestChild(Mixin, TestBase):
+        # Hide test_b, and add a test
+        test_b = None
+
+        def test_c(self):
+            pass
+
+    # Each DTestCase class remembers the tests it defines...
+    assert_equal(sorted(TestBase._dt_names), ['test_a', 'test_b'])
+    assert_equal(sorted(TestChild._dt_names), ['test_c'])
+
+    # ...and has all the tests it inherits
+    assert_equal(sorted(dt.test.__name__ for dt in TestChild._dt_tests),
+                 ['test_a', 'test_c', 'test_mixed'])
+    assert_true(TestBase.__dict__['test_a']._dt_dtest in
+                TestChild._dt_tests)
@@ -0,0 +1,205 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import heapq
+import itertools
+import sys
+import time
+
+from eventlet import Timeout
+from eventlet import sleep
+
+from dtest import *
+from dtest import backend
+from dtest import capture
+from dtest import coroutine
+from dtest.util import *
+
+try:
+    import trollius
+    from trollius import From, Return
+except ImportError:
+    trollius = None
+
+
+class FakeCancelledError(Exception):
+    pass
+
+
+class FakeTimeoutError(Exception):
+    pass
+
+
+class FakeLoop(object):
+    # Stands in for an asyncio event loop, running its callbacks in a
+    # native thread; only what the coroutine module uses is provided
+    def __init__(self):
+        threading = backend.original('threading')
+        self.cond = threading.Condition()
+        self.calls = []
+        self.seq = itertools.count()
+        th = threading.Thread(target=self._run, name='fake-event-loop')
+        th.daemon = True
+        th.start()
+
+    def call_later(self, delay, func, *args):
+        with self.cond:
+            heapq.heappush(self.calls, (time.time() + delay, next(self.seq),
+                                        func, args))
+            self.cond.notify()
+
+    def call_soon_threadsafe(self, func, *args):
+        self.call_later(0, func, *args)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.calls or self.calls[0][0] > time.time():
+                    self.cond.wait(self.calls[0][0] - time.time()
+                                   if self.calls else None)
+                when, seq, func, args = heapq.heappop(self.calls)
+            func(*args)
+
+
+class FakeTask(object):
+    # Stands in for an asyncio task driving a generator, which yields
+    # the number of seconds to sleep
+    def __init__(self, coro, loop):
+        self.coro = coro
+        self.loop = loop
+        self.callbacks = []
+        self.cancelled = False
+        self.exc_info = None
+        loop.call_soon_threadsafe(self._step)
+
+    def add_done_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def result(self):
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+
+    def _step(self):
+        try:
+            if self.cancelled:
+                delay = self.coro.throw(FakeCancelledError())
+            else:
+                delay = self.coro.send(None)
+        except StopIteration:
+            pass
+        except BaseException:
+            self.exc_info = sys.exc_info()
+        else:
+            self.loop.call_later(delay, self._step)
+            return
+
+        for callback in self.callbacks:
+            callback(self)
+
+
+class FakeLib(object):
+    # Stands in for the asyncio library
+    TimeoutError = FakeTimeoutError
+
+    @staticmethod
+    def ensure_future(coro, loop):
+        return FakeTask(coro, loop)
+
+
+def napper(events, steps, fail=False):
+    # A coroutine taking ``steps`` steps of 0.1 seconds each
+    try:
+        for i in range(steps):
+            print "step %d" % i
+            yield 0.1
+    except FakeCancelledError:
+        events.append('cancelled')
+        raise
+    if fail:
+        raise ValueError("failed")
+
+
+def _call(coro):
+    # Start ``coro`` on a fake event loop
+    loop = FakeLoop()
+    call = coroutine._Call(coro, loop, FakeLib)
+    loop.call_soon_threadsafe(call.start)
+    return call
+
+
+def test_bridge():
+    # The coroutine completes, and its output is ours
+    events = []
+    assert_is_none(_call(napper(events, 1)).wait())
+    if isinstance(sys.stdout, capture.CaptureProxy):
+        assert_in('step 0', capture.current()['stdout'].getvalue())
+
+    # Its exceptions are raised in the calling thread
+    with assert_raises(ValueError):
+        _call(napper(events, 1, True)).wait()
+    assert_equal(events, [])
+
+
+def test_interrupted():
+    # A caller giving up on the coroutine cancels it; the coroutine
+    # would otherwise outlast a busy hub
+    events = []
+    call = _call(napper(events, 100))
+    timeout = Timeout(0.05)
+    try:
+        assert_raises(Timeout, call.wait)
+    finally:
+        timeout.cancel()
+
+    for i in range(100):
+        if events:
+            break
+        sleep(0.05)
+    assert_equal(events, ['cancelled'])
+
+
+if trollius is not None:
+    @trollius.coroutine
+    def sleeper(delay, value):
+        yield From(trollius.sleep(delay))
+        print "slept for %s" % delay
+        raise Return(value)
+
+    @trollius.coroutine
+    def test_coroutine():
+        # Runs as a task on the shared event loop
+        assert_true(coroutine.iscoroutinefunction(sleeper))
+        result = yield From(sleeper(0.01, 42))
+        assert_equal(result, 42)
+
+    def test_run():
+        assert_equal(coroutine.run(sleeper(0, 'value')), 'value')
+
+        # Output from the coroutine is ours
+        if isinstance(sys.stdout, capture.CaptureProxy):
+            assert_in('slept for 0', capture.current()['stdout'].getvalue())
+
+    def test_timeout():
+        with assert_raises(AssertionError):
+            coroutine.run(sleeper(10, None), 0.05)
+
+    @raises(AssertionError)
+    @timed(0.05)
+    @trollius.coroutine
+    def test_timed():
+        yield From(trollius.sleep(10))
@@ -0,0 +1,127 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+
+from dtest import *
+from dtest import core
+from dtest import daemon
+from dtest import test
+from dtest import wire
+from dtest.util import *
+
+
+calls = []
+
+
+# Runs the dtest command line as a client of the daemon, reporting
+# whether eventlet was imported
+CLIENT = """
+import runpy
+import sys
+try:
+    runpy.run_module('dtest.core', run_name='__main__')
+except SystemExit as exc:
+    print 'eventlet' in sys.modules, exc.code
+"""
+
+
+def first():
+    calls.append('first')
+
+
+def second():
+    calls.append('second')
+
+
+def _request(handler, args):
+    # Send a request and collect the responses
+    client, server = socket.socketpair()
+    try:
+        wire.send_msg(client, ('run', args))
+        daemon._handle(server, handler)
+        server.close()
+
+        msgs = []
+        while True:
+            msg = wire.recv_msg(client)
+            if msg is None:
+                return msgs
+            msgs.append(msg)
+    finally:
+        client.close()
+        server.close()
+
+
+def test_handle():
+    def handler(args, stream):
+        print >>stream, 'running %s' % ' '.join(args)
+        stream.flush()
+        if args == ['bad']:
+            raise DTestException('bad request')
+        print 'done'
+        return args == ['good']
+
+    assert_equal(_request(handler, ['good']),
+                 [('output', 'running good\n'), ('output', 'done\n'),
+                  ('done', True)])
+    assert_equal(_request(handler, ['bad']),
+                 [('output', 'running bad\n'), ('output', 'bad request\n'),
+                  ('done', False)])
+
+
+def test_request():
+    tests = set([test.DTest(first), test.DTest(second)])
+    devnull = open(os.devnull, 'w')
+
+    # The given tests are run, without discovering any...
+    del calls[:]
+    assert_true(core._request(tests, ['-m', '1'], devnull))
+    assert_equal(sorted(calls), ['first', 'second'])
+
+    # ...and may be picked out by name
+    del calls[:]
+    assert_true(core._request(tests, ['tests.test_daemon.second'], devnull))
+    assert_equal(calls, ['second'])
+
+    # Some options can't be changed once the daemon is running
+    assert_raises(DTestException, core._request, tests, ['--watch'],
+                  devnull)
+
+
+def test_client():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([basedir] + sys.path)
+
+        # Without a daemon, the client fails cleanly, and in any case
+        # it never loads the execution machinery
+        proc = subprocess.Popen([sys.executable, '-c', CLIENT, '--connect',
+                                 os.path.join(tmpdir, 'sock')], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        assert_equal(out, 'False True\n')
+        assert_in('Unable to connect to the daemon', err)
+        assert_not_in('Traceback', err)
+    finally:
+        shutil.rmtree(tmpdir)
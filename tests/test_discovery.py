@@ -0,0 +1,82 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from dtest import discovery
+from dtest.util import *
+
+
+def _touch(tmpdir, *paths):
+    # Create empty files, and the directories holding them
+    for path in paths:
+        fullpath = os.path.join(tmpdir, path)
+        if not os.path.isdir(os.path.dirname(fullpath)):
+            os.makedirs(os.path.dirname(fullpath))
+        open(fullpath, 'w').close()
+
+
+def test_walk():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        _touch(tmpdir, 'test_top.py', 'README',
+               'pkg/__init__.py', 'pkg/test_a.py',
+               'pkg/sub/__init__.py', 'pkg/sub/test_b.py',
+               'pkg/data/test_c.py',
+               'pkg/fixtures/__init__.py',
+               'pkg/build/__init__.py',
+               'pkg/node_modules/__init__.py',
+               '.hidden/__init__.py')
+        os.symlink(os.path.join(tmpdir, 'pkg', 'sub'),
+                   os.path.join(tmpdir, 'link'))
+
+        def walk(ignore=discovery.DEF_IGNORE):
+            return dict((os.path.relpath(path, tmpdir),
+                         (sorted(files), sorted(packages)))
+                        for path, files, packages in
+                        discovery.walk(tmpdir, ignore))
+
+        # Only packages are walked, and symbolic links are reported
+        # but not walked; packages named like build outputs are still
+        # packages
+        assert_equal(walk(), {
+                '.': (['README', 'test_top.py'], ['link', 'pkg']),
+                'pkg': (['__init__.py', 'test_a.py'],
+                        ['build', 'fixtures', 'sub']),
+                'pkg/build': (['__init__.py'], []),
+                'pkg/fixtures': (['__init__.py'], []),
+                'pkg/sub': (['__init__.py', 'test_b.py'], []),
+                })
+
+        # Patterns may match names or relative paths
+        assert_equal(walk(discovery.DEF_IGNORE +
+                          ('README', 'pkg/fixtures', 'link', 'build')), {
+                '.': (['test_top.py'], ['pkg']),
+                'pkg': (['__init__.py', 'test_a.py'], ['sub']),
+                'pkg/sub': (['__init__.py', 'test_b.py'], []),
+                })
+
+        # Removing a package from the list skips it
+        walked = []
+        for path, files, packages in discovery.walk(tmpdir):
+            walked.append(os.path.relpath(path, tmpdir))
+            if 'sub' in packages:
+                packages.remove('sub')
+        assert_equal(sorted(walked), ['.', 'pkg', 'pkg/build',
+                                      'pkg/fixtures'])
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,162 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from eventlet import greenthread
+from eventlet.green import subprocess
+
+from dtest import *
+from dtest import impact
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+def traced():
+    return 42
+
+
+def test_tracer():
+    me = greenthread.getcurrent()
+    dt = test.DTest(support.mkfunc('traced_test'))
+
+    # Only lines executed by this greenthread count
+    tracer = impact.LineTracer(lambda: dt if greenthread.getcurrent() is me
+                               else None)
+    tracer.start()
+    try:
+        traced()
+    finally:
+        tracer.stop()
+
+    executed = tracer.lines[str(dt)]
+    fname = os.path.relpath(os.path.realpath(traced.func_code.co_filename))
+    lnum = traced.func_code.co_firstlineno
+    assert_equal(executed[fname], set([lnum, lnum + 1]))
+
+
+def test_affected():
+    setUp = test.DTestFixtureSetUp(support.mkfunc('setUp'))
+    t1 = test.DTest(support.mkfunc('t1'))
+    t2 = test.DTest(support.mkfunc('t2'))
+    t3 = test.DTest(support.mkfunc('t3'))
+    depends(setUp)(t2)
+    tests = [setUp, t1, t2, t3]
+
+    imap = impact.DTestImpact('/nonexistent/impact')
+    imap.lines = {
+        str(setUp): {'lib.py': [10, 11]},
+        str(t1): {'lib.py': [1, 2], 'test.py': [5]},
+        str(t2): {'test.py': [8]},
+        }
+
+    # t3 has never been recorded, so it's always run
+    assert_equal(imap.affected(tests, {}), set([t3]))
+    assert_equal(imap.affected(tests, {'lib.py': set([2])}), set([t1, t3]))
+    assert_equal(imap.affected(tests, {'test.py': None}), set([t1, t2, t3]))
+
+    # A changed fixture affects the tests depending on it
+    assert_equal(imap.affected(tests, {'lib.py': set([11])}), set([t2, t3]))
+
+
+def test_affected_imported():
+    t1 = test.DTest(support.mkfunc('t1'))
+    t2 = test.DTest(support.mkfunc('t2', modname=__name__))
+    t3 = test.DTest(support.mkfunc('t3', modname='dtest.util'))
+    tests = [t1, t2, t3]
+
+    imap = impact.DTestImpact('/nonexistent/impact')
+    imap.lines = {
+        str(t1): {'test.py': [1]},
+        str(t2): {'test.py': [2]},
+        str(t3): {'lib.py': [3]},
+        }
+
+    # A module-level change affects the tests defined in the module
+    # and in the modules using it...
+    fname = support.__file__
+    if fname.endswith(('.pyc', '.pyo')):
+        fname = fname[:-1]
+    fname = os.path.relpath(os.path.realpath(fname))
+    assert_equal(imap.affected(tests, {fname: set([1])}), set())
+    assert_equal(imap.affected(tests, {fname: set([1])}, [fname]),
+                 set([t1, t2]))
+
+    # ...and those which executed any of its lines
+    assert_equal(imap.affected(tests, {'lib.py': set([9])}, ['lib.py']),
+                 set([t3]))
+
+
+def test_import_lines():
+    source = ('import os\n'
+              '\n'
+              'LIMIT = 5\n'
+              '\n'
+              '@decorate\n'
+              'def func(limit=LIMIT):\n'
+              '    return limit\n'
+              '\n'
+              'class Class(object):\n'
+              '    attr = 1\n'
+              '\n'
+              '    def method(self):\n'
+              '        return self.attr\n')
+
+    assert_equal(impact.import_lines(source), set([1, 3, 5, 6, 9, 10, 12]))
+    assert_equal(impact.import_lines('def broken(:\n'), set())
+
+
+def test_changes():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        def git(*args):
+            subprocess.check_call(['git', '-c', 'user.name=dtest',
+                                   '-c', 'user.email=dtest@example.com'] +
+                                  list(args), cwd=tmpdir,
+                                  stdout=open(os.devnull, 'w'))
+
+        try:
+            git('init', '-q')
+        except OSError:
+            # No git here
+            return
+
+        support.write(os.path.join(tmpdir, 'lib.py'), 'a = 1\nb = 2\nc = 3\n')
+        support.write(os.path.join(tmpdir, 'func.py'),
+                      'def func():\n    return 1\n')
+        git('add', 'lib.py', 'func.py')
+        git('commit', '-q', '-m', 'initial')
+
+        # Change one line of each file and add a file
+        support.write(os.path.join(tmpdir, 'lib.py'), 'a = 1\nb = 4\nc = 3\n')
+        support.write(os.path.join(tmpdir, 'func.py'),
+                      'def func():\n    return 2\n')
+        support.write(os.path.join(tmpdir, 'new.py'), 'd = 5\n')
+        git('add', 'new.py')
+
+        changed = impact.changes('HEAD', tmpdir)
+        assert_equal(changed, {'lib.py': set([2]), 'func.py': set([2]),
+                               'new.py': None})
+        assert_raises(DTestException, impact.changes, 'nonexistent', tmpdir)
+
+        # Only the module-level change runs on import
+        assert_equal(impact.imported_changes('HEAD', changed, tmpdir),
+                     set(['lib.py']))
+    finally:
+        shutil.rmtree(tmpdir)
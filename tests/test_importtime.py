@@ -0,0 +1,102 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import __builtin__
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from eventlet import spawn
+
+from dtest import *
+from dtest import importtime
+from dtest.util import *
+
+from tests import support
+
+
+def test_import_times():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'timed')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        support.write(os.path.join(pkgdir, '__init__.py'), '')
+        support.write(os.path.join(pkgdir, 'test_one.py'),
+                      'import timed_helper\n\n'
+                      'def test_x():\n    pass\n')
+        # Spin rather than sleep, so no other test runs meanwhile
+        support.write(os.path.join(tmpdir, 'timed_helper.py'),
+                      'import time\n'
+                      'end = time.time() + 0.1\n'
+                      'while time.time() < end:\n    pass\n')
+
+        # Time the discovery
+        timer = importtime.DTestImportTimer()
+        real_import = __builtin__.__import__
+        queue = explore(pkgdir, timer=timer)
+        assert_equal(__builtin__.__import__, real_import)
+        assert_equal(len(queue.tests), 1)
+
+        # The helper's time is charged to it, and to the test module
+        # importing it
+        byname = dict((entry['module'], entry) for entry in timer.report())
+        helper = byname['timed_helper']
+        test_one = byname['timed.test_one']
+        assert_false(helper['test'])
+        assert_true(test_one['test'])
+        assert_true(helper['self'] >= 0.1)
+        assert_true(test_one['cumulative'] >= helper['cumulative'])
+        assert_true(test_one['self'] < helper['self'])
+
+        # The report may be saved
+        path = os.path.join(tmpdir, 'times.json')
+        timer.save(path)
+        with open(path) as f:
+            data = json.load(f)
+        assert_equal(sorted(entry['module'] for entry in data['modules']),
+                     sorted(byname))
+        assert_true(data['total'] >= 0.1)
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if (modname in ('timed', 'timed_helper') or
+                modname.startswith('timed.')):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
+
+
+def test_other_threads():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    sys.path.insert(0, tmpdir)
+    try:
+        support.write(os.path.join(tmpdir, 'untimed_helper.py'), '')
+
+        # Imports made by another thread, such as a test running
+        # while discovery goes on, are not timed
+        timer = importtime.DTestImportTimer()
+        timer.start()
+        try:
+            spawn(__import__, 'untimed_helper').wait()
+        finally:
+            timer.stop()
+        assert_in('untimed_helper', sys.modules)
+        assert_equal(timer.report(), [])
+    finally:
+        sys.path.remove(tmpdir)
+        sys.modules.pop('untimed_helper', None)
+        shutil.rmtree(tmpdir)
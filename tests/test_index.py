@@ -0,0 +1,181 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from dtest import *
+from dtest import index
+from dtest import shard
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+def test_index():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'indexed')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        support.write(os.path.join(pkgdir, '__init__.py'),
+                      'def setUp():\n    pass\n\n'
+                      'def tearDown():\n    pass\n')
+        support.write(os.path.join(pkgdir, 'test_one.py'),
+                      'from dtest import *\n\n'
+                      '@attr(speed="slow")\n'
+                      'def test_x():\n    pass\n\n'
+                      '@skip\n@depends(test_x)\n'
+                      'def test_y():\n    pass\n')
+
+        import indexed.test_one
+        tests = set()
+        test.visit_mod(indexed.test_one, tests)
+
+        # Record the package and the module, and read them back
+        path = os.path.join(tmpdir, 'index')
+        idx = index.DTestIndex(path)
+        modnames = ['indexed', 'indexed.test_one']
+        for modname in modnames:
+            idx.record(modname, [tmpdir], modnames)
+        idx.save()
+        idx = index.DTestIndex(path)
+        assert_equal(len(idx), 2)
+        assert_false(idx.stale('indexed.test_one'))
+
+        # The stand-ins look like the real tests...
+        stubs = idx.tests(modnames)
+        assert_equal(support.graph(stubs), support.graph(tests))
+        byname = dict((str(dt), dt) for dt in stubs)
+        assert_equal(byname['indexed.test_one.test_x'].speed, 'slow')
+        assert_true(byname['indexed.test_one.test_y'].skip)
+        assert_equal(byname['indexed.tearDown']._partner,
+                     byname['indexed.setUp'])
+        assert_equal(byname['indexed.test_one.test_x'].test.__module__,
+                     'indexed.test_one')
+
+        # ...but can't be run
+        assert_raises(DTestException, byname['indexed.test_one.test_x'].test)
+
+        # Changing the module makes it stale
+        support.write(os.path.join(pkgdir, 'test_one.py'),
+                      'def test_z():\n    pass\n')
+        assert_true(idx.stale('indexed.test_one'))
+        assert_false(idx.stale('indexed'))
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if modname == 'indexed' or modname.startswith('indexed.'):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
+
+
+def test_stale_submodule():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'indexedpkg')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        # A test module whose tests are decorated by a submodule of a
+        # helper package; only the package is bound in its namespace
+        support.write(os.path.join(pkgdir, '__init__.py'), '')
+        support.write(os.path.join(pkgdir, 'deco.py'),
+                      'import functools\n\n'
+                      'def wrap(func):\n'
+                      '    @functools.wraps(func)\n'
+                      '    def wrapper():\n        return func()\n'
+                      '    return wrapper\n')
+        support.write(os.path.join(tmpdir, 'indexed_user.py'),
+                      'import indexedpkg.deco\n\n'
+                      '@indexedpkg.deco.wrap\n'
+                      'def test_deco():\n    pass\n')
+
+        import indexed_user
+        tests = set()
+        test.visit_mod(indexed_user, tests)
+
+        idx = index.DTestIndex(os.path.join(tmpdir, 'index'))
+        idx.record('indexed_user', [tmpdir], ['indexed_user'])
+        assert_false(idx.stale('indexed_user'))
+
+        # Changing the submodule makes the test module stale
+        support.write(os.path.join(pkgdir, 'deco.py'),
+                      'def wrap(func):\n    return func\n')
+        assert_true(idx.stale('indexed_user'))
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if (modname in ('indexedpkg', 'indexed_user') or
+                modname.startswith('indexedpkg.')):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
+
+
+def test_shard():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'indexshard')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        # A package fixture, a class with class fixtures, and two
+        # independent tests
+        support.write(os.path.join(pkgdir, '__init__.py'),
+                      'def setUp():\n    pass\n\n'
+                      'def tearDown():\n    pass\n')
+        support.write(os.path.join(pkgdir, 'test_one.py'),
+                      'from dtest import *\n\n'
+                      'class TestCls(DTestCase):\n'
+                      '    @classmethod\n'
+                      '    def setUpClass(cls):\n        pass\n\n'
+                      '    def test_a(self):\n        pass\n\n'
+                      '    def test_b(self):\n        pass\n')
+        support.write(os.path.join(pkgdir, 'test_two.py'),
+                      'def test_c():\n    pass\n\n'
+                      'def test_d():\n    pass\n')
+
+        import indexshard.test_one
+        import indexshard.test_two
+        tests = set()
+        test.visit_mod(indexshard.test_one, tests)
+        test.visit_mod(indexshard.test_two, tests)
+
+        idx = index.DTestIndex(None)
+        modnames = ['indexshard', 'indexshard.test_one',
+                    'indexshard.test_two']
+        for modname in modnames:
+            idx.record(modname, [tmpdir], modnames)
+
+        # Shard the stand-ins without the modules
+        for modname in modnames:
+            del sys.modules[modname]
+        stubs = idx.tests(modnames)
+        byname = dict((str(dt), dt) for dt in stubs)
+        assert_equal(
+            byname['indexshard.test_one.TestCls.test_a']._class.__name__,
+            'TestCls')
+        shards = shard.partition(stubs, 2)
+        assert_equal([len([dt for dt in s if dt.istest()]) for s in shards],
+                     [2, 2])
+        for s in shards:
+            assert_in(byname['indexshard.setUp'], s)
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if modname == 'indexshard' or modname.startswith('indexshard.'):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
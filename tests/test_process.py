@@ -0,0 +1,251 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import traceback
+
+from eventlet import spawn
+from eventlet.green import socket as green_socket
+from eventlet.green import subprocess
+
+from dtest import *
+from dtest import process
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+class TwoArgError(Exception):
+    # Can be pickled, but not unpickled
+    def __init__(self, a, b):
+        super(TwoArgError, self).__init__('%s/%s' % (a, b))
+
+
+def raiser(exc):
+    raise exc
+
+
+def packed(exc):
+    # Raise the exception and pack up the result
+    try:
+        raiser(exc)
+    except:
+        return process.pack_exc(*sys.exc_info())
+
+
+def test_exc_roundtrip():
+    exc_type, exc_value, tb = process.unpack_exc(
+        packed(AssertionError("oops")))
+
+    assert_is(exc_type, AssertionError)
+    assert_equal(str(exc_value), "oops")
+
+    # The traceback must be formattable
+    text = ''.join(traceback.format_exception(exc_type, exc_value, tb))
+    assert_in('in raiser', text)
+    assert_in('AssertionError: oops', text)
+
+
+def test_exc_unpicklable():
+    exc_type, exc_value, tb = process.unpack_exc(packed(TwoArgError(1, 2)))
+
+    assert_equal(exc_type.__name__, 'TwoArgError')
+    assert_equal(str(exc_value), '1/2')
+    assert_equal(len(traceback.extract_tb(tb)), 2)
+
+
+def test_messages():
+    sock1, sock2 = socket.socketpair()
+    try:
+        process.send_msg(sock1, ('run', 'tests.test_process.test_messages'))
+        process.send_msg(sock1, ('exit',))
+        sock1.close()
+
+        assert_equal(process.recv_msg(sock2),
+                     ('run', 'tests.test_process.test_messages'))
+        assert_equal(process.recv_msg(sock2), ('exit',))
+        assert_is_none(process.recv_msg(sock2))
+    finally:
+        sock2.close()
+
+
+def test_authenticate():
+    def handshake(server_key, client_key):
+        # Run both sides of the handshake, as the coordinator and a
+        # worker do
+        server, client = green_socket.socketpair()
+        try:
+            def serve():
+                # Return any failure rather than raising it, which
+                # would have the hub print it
+                try:
+                    process.deliver_challenge(server, server_key)
+                    process.answer_challenge(server, server_key)
+                except DTestException as exc:
+                    return exc
+            thread = spawn(serve)
+            try:
+                process.answer_challenge(client, client_key)
+                process.deliver_challenge(client, client_key)
+            finally:
+                client.close()
+                failure = thread.wait()
+            if failure is not None:
+                raise failure
+        finally:
+            server.close()
+
+    # Both sides must know the secret
+    handshake('secret', 'secret')
+    assert_raises(DTestException, handshake, 'secret', 'guess')
+
+
+def test_addresses():
+    # TCP addresses default to the loopback interface...
+    assert_equal(process.parse_address(':1234'),
+                 (socket.AF_INET, ('127.0.0.1', 1234)))
+    assert_equal(process.get_authkey(':1234', 'secret'), 'secret')
+
+    # ...and need a shared secret, unlike Unix domain sockets
+    if process.AUTHKEY_ENV not in os.environ:
+        assert_raises(DTestException, process.get_authkey, ':1234')
+        assert_equal(process.get_authkey('/tmp/dtest.sock'), '')
+
+
+def test_fixture_groups():
+    def func():
+        pass
+
+    class TestClass(object):
+        pass
+
+    # A package fixture pair, a class fixture pair nested in it, and
+    # a lone test
+    outer = test.DTestFixtureSetUp(func)
+    inner = test.DTestFixtureSetUp(func)
+    inner_down = test.DTestFixtureTearDown(func)
+    outer_down = test.DTestFixtureTearDown(func)
+    t1 = test.DTest(func)
+    t2 = test.DTest(func)
+    lone = test.DTest(func)
+    inner._attach(TestClass)
+    inner_down._attach(TestClass)
+    depends(outer)(inner)
+    depends(inner)(t1)
+    depends(inner)(t2)
+    depends(outer)(lone)
+    depends(t1, t2)(inner_down)
+    depends(inner_down, lone)(outer_down)
+    inner_down._set_partner(inner)
+    outer_down._set_partner(outer)
+
+    groups = process.fixture_groups([outer, inner, inner_down, outer_down,
+                                     t1, t2, lone])
+
+    # The package fixtures are shared, so they don't tie the lone
+    # test to the class
+    assert_not_in(lone, groups)
+    assert_not_in(outer, groups)
+    assert_not_in(outer_down, groups)
+    assert_equal(len(set(groups.values())), 1)
+    assert_equal(sorted(groups, key=id),
+                 sorted([inner, inner_down, t1, t2], key=id))
+
+
+def test_nodes():
+    # Run the suite in tests/nodes with two local worker processes
+    # standing in for remote nodes
+    tmpdir = tempfile.mkdtemp()
+    try:
+        basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        suite = os.path.join(basedir, 'tests', 'nodes')
+        sockpath = os.path.join(tmpdir, 'sock')
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([basedir] + sys.path)
+        env['DTEST_NODES_MARKER'] = os.path.join(tmpdir, 'died')
+
+        def dtest(*args):
+            return subprocess.Popen([sys.executable, '-c', support.DRIVER,
+                                     '-d', suite] + list(args), env=env,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+
+        coord = dtest('--listen', sockpath, '--nodes', '2')
+        workers = [dtest('--worker', sockpath) for i in range(2)]
+
+        out = coord.communicate()[0]
+        for w in workers:
+            w.communicate()
+
+        # One test fails and one fails due to dependencies...
+        assert_equal(coord.returncode, 1, out)
+        assert_regexp_matches(out, r'test_nodes\.test_fails +FAIL')
+        assert_regexp_matches(out, r'test_nodes\.test_depfail +DEPFAIL')
+        assert_in('captured', out)
+
+        # ...but the fixtures stay with their tests, even after a
+        # worker dies
+        assert_regexp_matches(out, r'TestNodes\.test_state +OK')
+        assert_regexp_matches(out, r'TestNodes\.test_dies +OK')
+        assert_in('failed to run test_nodes.TestNodes.test_dies', out)
+        assert_not_in('resource teardown errors', out)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_processes():
+    # Run the suite in tests/procs with two worker processes
+    tmpdir = tempfile.mkdtemp()
+    try:
+        basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        suite = os.path.join(basedir, 'tests', 'procs')
+        logpath = os.path.join(tmpdir, 'log')
+
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([basedir] + sys.path)
+        env['DTEST_PROCS_LOG'] = logpath
+
+        proc = subprocess.Popen([sys.executable, '-c', support.DRIVER,
+                                 '-d', suite, '-p', '2'], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        out = proc.communicate()[0]
+        assert_equal(proc.returncode, 0, out)
+
+        # Gather the processes each fixture ran in
+        ran = {}
+        with open(logpath) as f:
+            for line in f:
+                name, pid = line.split()
+                ran.setdefault(name, []).append(pid)
+
+        # The package fixtures are shared by both workers...
+        assert_equal(len(set(ran['procpkg.setUp'])), 2)
+
+        # ...and every shared fixture is set up once in each worker
+        # needing it, and torn down once in each of those
+        for scope in ('procpkg', 'procpkg.test_one', 'procpkg.test_two'):
+            setups = ran[scope + '.setUp']
+            teardowns = ran[scope + '.tearDown']
+            assert_equal(len(setups), len(set(setups)), out)
+            assert_equal(sorted(teardowns), sorted(setups), out)
+    finally:
+        shutil.rmtree(tmpdir)
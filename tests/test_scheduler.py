@@ -0,0 +1,323 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from eventlet import sleep
+
+from dtest import *
+from dtest import history
+from dtest import scheduler
+from dtest import test
+from dtest.util import *
+
+
+def mkgraph(*names):
+    # Build a set of unattached tests with the given names
+    tests = {}
+    for name in names:
+        def func():
+            pass
+        func.__name__ = name
+        tests[name] = test.DTest(func)
+
+    return tests
+
+
+class FakeHistory(object):
+    def __init__(self, durations, failures=()):
+        self.durations = durations
+        self.failures = failures
+
+    def duration(self, dt):
+        return self.durations.get(dt.test.__name__)
+
+    def failed(self, dt):
+        return dt.test.__name__ in self.failures
+
+
+def test_longest_paths():
+    # Build a graph: a -> b -> c, a -> d
+    g = mkgraph('a', 'b', 'c', 'd')
+    depends(g['a'])(g['b'])
+    depends(g['b'])(g['c'])
+    depends(g['a'])(g['d'])
+
+    weights = dict(a=1.0, b=2.0, c=3.0, d=10.0)
+    paths = scheduler.longest_paths(g.values(),
+                                    lambda dt: weights[dt.test.__name__])
+
+    assert_almost_equal(paths[g['c']], 3.0)
+    assert_almost_equal(paths[g['b']], 5.0)
+    assert_almost_equal(paths[g['d']], 10.0)
+    assert_almost_equal(paths[g['a']], 11.0)
+
+
+def test_downstream_counts():
+    # Build a graph: a -> b -> c, a -> c, d
+    g = mkgraph('a', 'b', 'c', 'd')
+    depends(g['a'])(g['b'])
+    depends(g['b'])(g['c'])
+    depends(g['a'])(g['c'])
+
+    counts = scheduler.downstream_counts(g.values())
+
+    assert_equal(counts[g['a']], 2)
+    assert_equal(counts[g['b']], 1)
+    assert_equal(counts[g['c']], 0)
+    assert_equal(counts[g['d']], 0)
+
+
+def test_critical_path_order():
+    # Two independent chains; the slow one should come first, and
+    # the test without history falls back to its dependents
+    g = mkgraph('fast', 'slow', 'slow_next', 'unknown', 'after1', 'after2')
+    depends(g['slow'])(g['slow_next'])
+    depends(g['unknown'])(g['after1'])
+    depends(g['unknown'])(g['after2'])
+
+    sch = scheduler.CriticalPathScheduler(FakeHistory(dict(
+                fast=1.0, slow=2.0, slow_next=2.0)))
+    sch.prepare(set([g['fast'], g['slow'], g['slow_next']]))
+    for name in ('fast', 'slow'):
+        sch.push(g[name])
+    assert_equal(sch.pop(), g['slow'])
+    assert_equal(sch.pop(), g['fast'])
+
+    sch = scheduler.CriticalPathScheduler()
+    sch.prepare(set(g.values()))
+    for name in ('fast', 'unknown', 'slow'):
+        sch.push(g[name])
+    assert_equal(sch.pop(), g['unknown'])
+    assert_equal(sch.pop(), g['slow'])
+    assert_equal(sch.pop(), g['fast'])
+
+
+def test_affinity_order():
+    # Two fixture scopes, each with a setUp, two tests, and a tearDown
+    def func():
+        pass
+
+    scopes = []
+    for i in range(2):
+        setup = test.DTestFixtureSetUp(func)
+        teardown = test.DTestFixtureTearDown(func)
+        tests = [test.DTest(func), test.DTest(func)]
+        depends(setup)(tests[0])
+        depends(setup)(tests[1])
+        depends(*tests)(teardown)
+        teardown._set_partner(setup)
+        scopes.append((setup, tests, teardown))
+
+    alltests = set()
+    for setup, tests, teardown in scopes:
+        alltests |= set([setup, teardown] + tests)
+
+    sch = scheduler.AffinityScheduler(1)
+    sch.prepare(alltests)
+    sch.push(scopes[0][0])
+    sch.push(scopes[1][0])
+
+    for setup, tests, teardown in scopes:
+        # The second scope can't be opened until the first closes
+        assert_equal(sch.pop(), setup)
+        assert_is_none(sch.pop())
+        sch.finished(setup)
+
+        # Tests in the open scope are preferred
+        for dt in tests:
+            sch.push(dt)
+        assert_equal(set([sch.pop(), sch.pop()]), set(tests))
+        assert_is_none(sch.pop())
+        for dt in tests:
+            sch.finished(dt)
+
+        sch.push(teardown)
+        assert_equal(sch.pop(), teardown)
+        assert_is_none(sch.pop())
+        sch.finished(teardown)
+
+    assert_equal(sch.max_open, 1)
+
+
+def test_failed_first_order():
+    # The failed test and its dependency come first; the rest are
+    # ordered by the critical path
+    g = mkgraph('fixture', 'failed', 'slow', 'fast')
+    depends(g['fixture'])(g['failed'])
+
+    hist = FakeHistory(dict(slow=2.0, fast=1.0), ['failed'])
+    sch = scheduler.FailedFirstScheduler(
+        hist, scheduler.CriticalPathScheduler(hist))
+    sch.prepare(set(g.values()))
+    assert_equal(sch.priority, frozenset([g['fixture'], g['failed']]))
+
+    for name in ('fast', 'slow', 'fixture'):
+        sch.push(g[name])
+    assert_equal(len(sch), 3)
+    assert_equal(sch.pop(), g['fixture'])
+    sch.push(g['failed'])
+    assert_equal(sch.pop(), g['failed'])
+    assert_equal(sch.pop(), g['slow'])
+    assert_equal(sch.pop(), g['fast'])
+
+
+def test_history_failures():
+    # The history remembers which tests didn't pass
+    fixed = []
+
+    def passing():
+        pass
+
+    def failing():
+        assert fixed
+
+    tests = [test.DTest(passing), test.DTest(failing)]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'history')
+
+        def run(skip=lambda dt: False):
+            queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')),
+                               skip=skip, history=history.DTestHistory(path))
+            queue.add_tests(tests)
+            queue.run(debug=True)
+            return history.DTestHistory(path)
+
+        hist = run()
+        assert_false(hist.failed(tests[0]))
+        assert_true(hist.failed(tests[1]))
+
+        # Not running leaves the failure alone; passing clears it
+        hist = run(skip=lambda dt: True)
+        assert_true(hist.failed(tests[1]))
+        fixed.append(True)
+        hist = run()
+        assert_false(hist.failed(tests[1]))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_find_cycles():
+    # a -> b -> c -> a is a cycle, d depends on it, e depends on
+    # itself, and f is independent
+    g = mkgraph('a', 'b', 'c', 'd', 'e', 'f')
+    depends(g['b'])(g['a'])
+    depends(g['c'])(g['b'])
+    depends(g['a'])(g['c'])
+    depends(g['a'])(g['d'])
+    depends(g['e'])(g['e'])
+
+    cycles = scheduler.find_cycles(g.values())
+
+    assert_equal(sorted(sorted(dt.test.__name__ for dt in cycle)
+                        for cycle in cycles),
+                 [['a', 'b', 'c'], ['e']])
+
+    for cycle in cycles:
+        path = scheduler.cycle_path(cycle)
+        assert_is(path[0], path[-1])
+        for dt, dep in zip(path, path[1:]):
+            assert_in(dep, dt._deps)
+
+
+class CycleOutput(DTestOutput):
+    def __init__(self):
+        super(CycleOutput, self).__init__(open(os.devnull, 'w'))
+        self.found = None
+
+    def cycles(self, cycles):
+        self.found = cycles
+
+
+def test_queue_cycles():
+    # A cycle should fail before anything runs, along with its
+    # dependents, while unrelated tests still run
+    g = mkgraph('a', 'b', 'c', 'd')
+    depends(g['b'])(g['a'])
+    depends(g['a'])(g['b'])
+    depends(g['a'])(g['c'])
+
+    output = CycleOutput()
+    queue = DTestQueue(output=output)
+    queue.add_tests(g.values())
+    queue.run(debug=True)
+
+    assert_equal(len(output.found), 1)
+    assert_equal(set(output.found[0]), set([g['a'], g['b']]))
+    assert_equal(g['a'].state, DEPFAIL)
+    assert_equal(g['b'].state, DEPFAIL)
+    assert_equal(g['c'].state, DEPFAIL)
+    assert_equal(g['d'].state, OK)
+
+
+def test_max_failures():
+    # After the first failure, the other tests shouldn't run, but the
+    # fixture should still be torn down
+    def fail():
+        assert False
+
+    def fixture():
+        pass
+
+    setUp = test.DTestFixtureSetUp(fixture)
+    tearDown = test.DTestFixtureTearDown(fixture)
+    tearDown._set_partner(setUp)
+    tests = [test.DTest(fail) for i in range(3)]
+    for dt in tests:
+        depends(setUp)(dt)
+        depends(dt)(tearDown)
+
+    queue = DTestQueue(1, output=DTestOutput(open(os.devnull, 'w')),
+                       max_failures=1)
+    queue.add_tests(tests + [setUp, tearDown])
+    assert_false(queue.run(debug=True))
+
+    states = sorted(dt.state for dt in tests)
+    assert_equal(states, [FAIL, NOTRUN, NOTRUN])
+    assert_equal(setUp.state, OK)
+    assert_equal(tearDown.state, OK)
+
+
+def test_max_failures_fixtures():
+    # A failing fixture doesn't count as a failure; its test doesn't
+    # run, but the tests started after it fails do
+    def fail():
+        assert False
+
+    def succeed():
+        pass
+
+    def slow():
+        sleep(0.1)
+
+    setUp = test.DTestFixtureSetUp(fail)
+    broken = test.DTest(succeed)
+    depends(setUp)(broken)
+    first = test.DTest(slow)
+    tests = [test.DTest(succeed) for i in range(2)]
+    for dt in tests:
+        depends(first)(dt)
+
+    queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')),
+                       max_failures=1)
+    queue.add_tests(tests + [setUp, broken, first])
+    assert_false(queue.run(debug=True))
+
+    assert_equal(setUp.state, FAIL)
+    assert_equal(broken.state, DEPFAIL)
+    assert_equal([dt.state for dt in tests], [OK, OK])
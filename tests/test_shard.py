@@ -0,0 +1,129 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from eventlet.green import subprocess
+
+from dtest import *
+from dtest import history
+from dtest import shard
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+def _mksuite():
+    # A fixture group of two tests, plus four independent tests, all
+    # under a package fixture
+    setUp = test.DTestFixtureSetUp(support.mkfunc('setUp'))
+    tearDown = test.DTestFixtureTearDown(support.mkfunc('tearDown'))
+    grouped = [test.DTest(support.mkfunc('grouped_%d' % i)) for i in range(2)]
+    for dt in grouped:
+        depends(setUp)(dt)
+    depends(*grouped)(tearDown)
+    tearDown._set_partner(setUp)
+
+    lone = [test.DTest(support.mkfunc('lone_%d' % i)) for i in range(4)]
+
+    pkgSetUp = test.DTestFixtureSetUp(support.mkfunc('setUp', modname='tests'))
+    pkgTearDown = test.DTestFixtureTearDown(support.mkfunc('tearDown',
+                                                           modname='tests'))
+    for dt in [setUp] + lone:
+        depends(pkgSetUp)(dt)
+    depends(tearDown, *lone)(pkgTearDown)
+    pkgTearDown._set_partner(pkgSetUp)
+
+    return [setUp, tearDown] + grouped + lone + [pkgSetUp, pkgTearDown]
+
+
+def test_parse():
+    assert_equal(shard.parse('2/3'), (2, 3))
+    assert_raises(DTestException, shard.parse, '0/3')
+    assert_raises(DTestException, shard.parse, '4/3')
+    assert_raises(DTestException, shard.parse, '2')
+
+
+def test_partition():
+    tests = _mksuite()
+    group = set(tests[:4])
+
+    # No history; three shards of two tests each
+    shards = shard.partition(tests, 3)
+    assert_equal(set().union(*shards), set(tests))
+    assert_equal(len([s for s in shards if group <= s]), 1)
+    assert_equal(sorted(len([dt for dt in s if dt.istest()])
+                        for s in shards), [2, 2, 2])
+
+    # Every shard runs the package fixtures
+    for s in shards:
+        assert_true(set(tests[-2:]) <= s)
+    assert_equal(sum(len(s) for s in shards), len(tests) + 4)
+
+    # The partition doesn't depend on the order of the tests
+    assert_equal(shard.partition(reversed(tests), 3), shards)
+
+
+def test_balance():
+    tests = _mksuite()
+    hist = history.DTestHistory('/nonexistent/history')
+
+    # One lone test takes longer than all the others together
+    for dt in tests:
+        hist.durations[str(dt)] = 1.0
+    hist.durations[str(tests[4])] = 10.0
+
+    shards = shard.partition(tests, 2, hist)
+    assert_equal(shard.select(tests, 1, 2, hist), shards[0])
+    assert_in(set([tests[4]]) | set(tests[-2:]), shards)
+
+
+# Runs the dtest command line, reporting each exploration of the tree
+EXPLORING = """
+from dtest import core
+explore = core.explore
+def exploring(*args, **kwargs):
+    print 'Exploring'
+    return explore(*args, **kwargs)
+core.explore = exploring
+""" + support.DRIVER
+
+
+def test_main():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    try:
+        support.write(os.path.join(tmpdir, 'test_sharded.py'),
+                      'def test_a():\n    pass\n\n'
+                      'def test_b():\n    pass\n')
+
+        basedir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([basedir] + sys.path)
+
+        # Without an index, the tree is only explored once
+        proc = subprocess.Popen([sys.executable, '-c', EXPLORING,
+                                 '-d', tmpdir, '--shard', '1/2'], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        out = proc.communicate()[0]
+        assert_equal(proc.returncode, 0, out)
+        assert_in('Running shard 1/2: 1 of 2 tests', out)
+        assert_equal(out.count('Exploring'), 1, out)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,68 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import subprocess
+import sys
+
+from dtest import *
+from dtest.util import *
+
+
+# The root of the source tree
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A generous bound on the time, in seconds, taken to import the
+# framework; bench/bench_startup.py measures it against a tighter
+# budget
+BUDGET = 1.0
+
+# Modules which only some test runs need, and which importing the
+# framework must leave to be loaded on first use
+DEFERRED = [
+    'eventlet', 'ast', 'ctypes', 'hashlib', 'json', 'optparse',
+    'subprocess', 'tempfile',
+    'dtest.cache', 'dtest.daemon', 'dtest.history', 'dtest.impact',
+    'dtest.importtime', 'dtest.index', 'dtest.process', 'dtest.shard',
+    'dtest.static', 'dtest.watch', 'dtest.wire',
+    ]
+
+# Import the framework in a fresh interpreter, reporting the time
+# taken and the modules imported
+CHECK = """
+import sys, time
+start = time.time()
+import dtest.constants, dtest.util, dtest.test, dtest
+print time.time() - start
+print ' '.join(name for name, mod in sys.modules.items() if mod is not None)
+"""
+
+
+def test_startup():
+    # Make the source tree importable
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p])
+
+    out = subprocess.check_output([sys.executable, '-c', CHECK], env=env)
+    elapsed, loaded = out.split('\n', 1)
+    loaded = set(loaded.split())
+
+    # Defining tests must not load the machinery of particular kinds
+    # of test run...
+    assert_equal([name for name in DEFERRED if name in loaded], [])
+
+    # ...and must be quick
+    assert_less(float(elapsed), BUDGET)
@@ -0,0 +1,140 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from dtest import *
+from dtest import index
+from dtest import shard
+from dtest import static
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+def test_static():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'parsed')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        support.write(os.path.join(pkgdir, '__init__.py'),
+                      'def setUp():\n    pass\n\n'
+                      'def tearDown():\n    pass\n')
+        support.write(os.path.join(pkgdir, 'test_one.py'),
+                      'from dtest import *\n\n'
+                      '@attr(speed="slow")\n@timed(3)\n'
+                      'def test_x():\n    pass\n\n'
+                      '@skip\n@depends(test_x)\n'
+                      'def test_y():\n    pass\n\n'
+                      '@nottest\n'
+                      'def test_helper():\n    pass\n\n'
+                      '@require(db=None)\n'
+                      'def uses_db():\n    pass\n\n'
+                      'class TestCls(DTestCase):\n'
+                      '    @classmethod\n'
+                      '    def setUpClass(cls):\n        pass\n\n'
+                      '    @classmethod\n'
+                      '    def tearDownClass(cls):\n        pass\n\n'
+                      '    @failing\n'
+                      '    def test_a(self):\n        pass\n\n'
+                      '    @repeat(2)\n    @depends(test_a)\n'
+                      '    def test_b(self):\n        pass\n')
+
+        # Parse the package and the module, without importing them
+        idx = index.DTestIndex(None)
+        modnames = ['parsed', 'parsed.test_one']
+        with static.DTestStatic(pkgdir, modnames) as parsed:
+            for modname in modnames:
+                idx.record(modname, [tmpdir], modnames, True)
+        assert_equal(parsed.caught, [])
+        assert_false('parsed' in sys.modules)
+        assert_false('parsed.test_one' in sys.modules)
+
+        # The records are only good for static discovery
+        assert_true(idx.stale('parsed.test_one'))
+        assert_false(idx.stale('parsed.test_one', True))
+
+        # The stand-ins look like the real tests
+        stubs = idx.tests(modnames)
+        import parsed.test_one
+        tests = set()
+        test.visit_mod(parsed.test_one, tests)
+        assert_equal(support.graph(stubs), support.graph(tests))
+
+        # A module which cannot be parsed is reported
+        support.write(os.path.join(pkgdir, 'test_two.py'), 'def test_z(:\n')
+        with static.DTestStatic(pkgdir, ['parsed.test_two']) as parsed:
+            pass
+        assert_equal([modname for path, modname, exc_info in parsed.caught],
+                     ['parsed.test_two'])
+        assert_equal(parsed.caught[0][2][0], SyntaxError)
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if modname == 'parsed' or modname.startswith('parsed.'):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
+
+
+def test_shard():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'parsedshard')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        # A package fixture, a class with class fixtures, and two
+        # independent tests
+        support.write(os.path.join(pkgdir, '__init__.py'),
+                      'def setUp():\n    pass\n\n'
+                      'def tearDown():\n    pass\n')
+        support.write(os.path.join(pkgdir, 'test_one.py'),
+                      'from dtest import *\n\n'
+                      'class TestCls(DTestCase):\n'
+                      '    @classmethod\n'
+                      '    def setUpClass(cls):\n        pass\n\n'
+                      '    def test_a(self):\n        pass\n\n'
+                      '    def test_b(self):\n        pass\n')
+        support.write(os.path.join(pkgdir, 'test_two.py'),
+                      'def test_c():\n    pass\n\n'
+                      'def test_d():\n    pass\n')
+
+        # Parse and shard them, without importing anything
+        idx = index.DTestIndex(None)
+        modnames = ['parsedshard', 'parsedshard.test_one',
+                    'parsedshard.test_two']
+        with static.DTestStatic(pkgdir, modnames) as parsed:
+            assert_true(hasattr(parsed.modules['parsedshard'], '__path__'))
+            for modname in modnames:
+                idx.record(modname, [tmpdir], modnames, True)
+        assert_false('parsedshard' in sys.modules)
+
+        stubs = idx.tests(modnames)
+        byname = dict((str(dt), dt) for dt in stubs)
+        shards = shard.partition(stubs, 2)
+        assert_equal([len([dt for dt in s if dt.istest()]) for s in shards],
+                     [2, 2])
+        for s in shards:
+            assert_in(byname['parsedshard.setUp'], s)
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if modname == 'parsedshard' or modname.startswith('parsedshard.'):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,110 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from dtest import *
+from dtest import core
+from dtest import scheduler
+from dtest import test
+from dtest.util import *
+
+from tests import support
+
+
+def mktest(events, name, cls=test.DTest):
+    # Build a test which records that it ran
+    def func():
+        events.append(name)
+    func.__name__ = name
+    return cls(func)
+
+
+def test_stream():
+    events = []
+    setUp = mktest(events, 'setUp', test.DTestFixtureSetUp)
+    tearDown = mktest(events, 'tearDown', test.DTestFixtureTearDown)
+    tearDown._set_partner(setUp)
+    a = mktest(events, 'a')
+    b = mktest(events, 'b')
+    c = mktest(events, 'c')
+    for dt in (a, b, c):
+        depends(setUp)(dt)
+        depends(dt)(tearDown)
+
+    # The test b depends on c, which is discovered later
+    depends(c)(b)
+
+    def feed():
+        yield set([setUp, tearDown, a, b])
+
+        # The first tests ran while discovery went on, but b had to
+        # wait for c, and the tearDown() fixture for all the tests
+        assert_equal(events, ['setUp', 'a'])
+        yield set([c])
+
+    queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')))
+    assert_true(queue.run(debug=True, feed=feed()))
+    assert_equal(events, ['setUp', 'a', 'c', 'b', 'tearDown'])
+    assert_equal(len(queue.tests), 5)
+
+
+def test_stream_scheduler():
+    # Only tests may be started in the order in which they're ready
+    queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')),
+                       scheduler=scheduler.CriticalPathScheduler())
+    assert_raises(DTestException, queue.run, feed=[])
+
+
+def test_stream_path():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'streamed')
+    os.makedirs(os.path.join(pkgdir, 'test_sub'))
+    try:
+        # A test which records the import path it sees, and a test
+        # package discovered after it, whose import uses a module in
+        # the base directory and outlasts the test
+        support.write(os.path.join(pkgdir, '__init__.py'), '')
+        support.write(os.path.join(pkgdir, 'test_path.py'),
+                      'import sys\n\n'
+                      'from eventlet import sleep\n\n'
+                      'seen = []\n\n'
+                      'def test_path():\n'
+                      '    sleep(0.1)\n'
+                      '    seen.append(list(sys.path))\n')
+        support.write(os.path.join(pkgdir, 'test_sub', '__init__.py'),
+                      'from eventlet import sleep\n'
+                      'import streamed_helper\n\n'
+                      'sleep(0.5)\n')
+        support.write(os.path.join(tmpdir, 'streamed_helper.py'), '')
+
+        # The test runs while the package is imported, without seeing
+        # the base directory in the import path
+        queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')))
+        assert_true(queue.run(feed=core.stream(pkgdir)))
+        assert_equal(queue.caught, [])
+        assert_in('streamed.test_sub', sys.modules)
+        seen = sys.modules['streamed.test_path'].seen
+        assert_equal(len(seen), 1)
+        assert_not_in(tmpdir, seen[0])
+    finally:
+        for modname in sys.modules.keys():
+            if (modname in ('streamed', 'streamed_helper') or
+                modname.startswith('streamed.')):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
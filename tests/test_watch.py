@@ -0,0 +1,148 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import sys
+import tempfile
+
+from dtest import *
+from dtest import test
+from dtest import watch
+from dtest.util import *
+
+from tests import support
+
+
+def _check_watcher(cls):
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    try:
+        try:
+            watcher = cls([tmpdir])
+        except OSError:
+            # Not available here
+            return
+
+        try:
+            support.write(os.path.join(tmpdir, 'ignored.txt'), 'ignored\n')
+            support.write(os.path.join(tmpdir, 'changed.py'), 'a = 1\n')
+            assert_equal(watcher.wait(),
+                         set([os.path.join(tmpdir, 'changed.py')]))
+        finally:
+            watcher.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_polling_watcher():
+    _check_watcher(lambda roots: watch.PollingWatcher(roots, 0.01))
+
+
+def test_inotify_watcher():
+    _check_watcher(watch.InotifyWatcher)
+
+
+def test_refresh():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'watched')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        # A package fixture, a library, and two test modules, one of
+        # which uses the library
+        support.write(os.path.join(pkgdir, '__init__.py'),
+                      'def setUp():\n    pass\n')
+        support.write(os.path.join(pkgdir, 'lib.py'), 'value = 1\n')
+        support.write(os.path.join(pkgdir, 'test_lib.py'),
+                      'from watched import lib\n\n'
+                      'def test_lib():\n    assert lib.value == 1\n')
+        support.write(os.path.join(pkgdir, 'test_other.py'),
+                      'def test_other():\n    pass\n')
+
+        import watched.test_lib
+        import watched.test_other
+        tests = set()
+        for mod in (watched.test_lib, watched.test_other):
+            test.visit_mod(mod, tests)
+        old_lib = test._gettest(watched.test_lib.test_lib)
+        pkg_setUp = sys.modules['watched']._dt_setUp
+        assert_in(old_lib, pkg_setUp.dependents)
+
+        # Changing the library reloads it and the test module using it
+        support.write(os.path.join(pkgdir, 'lib.py'), 'value = 2\n')
+        stale, caught = watch.refresh([os.path.join(pkgdir, 'lib.py')],
+                                      [tmpdir])
+        assert_equal(stale, set(['watched.lib', 'watched.test_lib']))
+        assert_equal(caught, [])
+        assert_equal(watched.test_lib.lib.value, 2)
+
+        # The old test is detached, and the new one is found
+        assert_not_in(old_lib, pkg_setUp.dependents)
+        tests = set()
+        test.visit_mod(watched.test_lib, tests)
+        new_lib = test._gettest(watched.test_lib.test_lib)
+        assert_is_not(new_lib, old_lib)
+        assert_in(new_lib, tests)
+        assert_in(new_lib, pkg_setUp.dependents)
+
+        # A broken module is reported and left empty
+        support.write(os.path.join(pkgdir, 'test_other.py'),
+                      'def test_other(:\n')
+        stale, caught = watch.refresh(
+            [os.path.join(pkgdir, 'test_other.py')], [tmpdir])
+        assert_equal(stale, set(['watched.test_other']))
+        assert_equal(len(caught), 1)
+        assert_equal(caught[0][1], 'watched.test_other')
+        assert_false(hasattr(watched.test_other, 'test_other'))
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if modname == 'watched' or modname.startswith('watched.'):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
+
+
+def test_refresh_submodule():
+    tmpdir = os.path.realpath(tempfile.mkdtemp())
+    pkgdir = os.path.join(tmpdir, 'watchedpkg')
+    os.mkdir(pkgdir)
+    sys.path.insert(0, tmpdir)
+    try:
+        # A test module which imports a submodule of a helper package;
+        # only the package is bound in its namespace
+        support.write(os.path.join(pkgdir, '__init__.py'), '')
+        support.write(os.path.join(pkgdir, 'db.py'), 'value = 1\n')
+        support.write(os.path.join(tmpdir, 'watched_user.py'),
+                      'import watchedpkg.db\n\n'
+                      'def test_db():\n    assert watchedpkg.db.value == 1\n')
+
+        import watched_user
+        old_db = test._gettest(watched_user.test_db)
+
+        # Changing the submodule reloads the test module, too
+        support.write(os.path.join(pkgdir, 'db.py'), 'value = 2\n')
+        stale, caught = watch.refresh([os.path.join(pkgdir, 'db.py')],
+                                      [tmpdir])
+        assert_equal(stale, set(['watchedpkg.db', 'watched_user']))
+        assert_equal(caught, [])
+        assert_equal(watched_user.watchedpkg.db.value, 2)
+        assert_is_not(test._gettest(watched_user.test_db), old_db)
+    finally:
+        sys.path.remove(tmpdir)
+        for modname in sys.modules.keys():
+            if (modname in ('watchedpkg', 'watched_user') or
+                modname.startswith('watchedpkg.')):
+                del sys.modules[modname]
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,52 @@
+# Copyright 2011 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+
+from dtest import *
+from dtest import test
+from dtest import watchdog
+from dtest.util import *
+
+
+def test_hard_timeout():
+    # A test spinning on the CPU never yields, so only the watchdog
+    # can stop it
+    def spin():
+        try:
+            while True:
+                pass
+        except Exception:
+            pass
+
+    def other():
+        pass
+
+    spinner = test.DTest(spin)
+    timed(0.1)(spinner)
+    bystander = test.DTest(other)
+
+    queue = DTestQueue(output=DTestOutput(open(os.devnull, 'w')),
+                       hard_timeouts=True)
+    queue.add_tests([spinner, bystander])
+    assert_false(queue.run(debug=True))
+
+    assert_equal(spinner.state, ERROR)
+    assert_equal(bystander.state, OK)
+    assert_is_none(watchdog.current())
+
+    msg = spinner.result.msgs[0]
+    assert_true(issubclass(msg.exc_type, DTestTimeout))
+    assert_in('hard timeout', str(msg.exc_value))